@@ -1,19 +1,37 @@
 import os
+import atexit
+import csv
+import gzip
+import zlib
+import json
+import mimetypes
 import sqlite3
 import uuid
 import importlib
 import hashlib
+import html
+import queue
 import re
 import secrets
 import smtplib
+import socket
 import ssl
-from datetime import datetime, timedelta
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from email.message import EmailMessage
-from functools import wraps
-from io import BytesIO
-from zoneinfo import ZoneInfo
+from functools import lru_cache, wraps
+from io import BytesIO, TextIOWrapper
+from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from flask import Flask, jsonify, request, send_from_directory, send_file
+from flask import Flask, g, has_request_context, jsonify, make_response, request, send_from_directory, send_file
 from werkzeug.security import generate_password_hash, check_password_hash
 from fpdf import FPDF
 
@@ -22,12 +40,37 @@ try:
 except Exception:
     load_dotenv = None
 
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin lock entre procesos (el servidor de desarrollo es un solo proceso)
+    fcntl = None
+
 # Detectar si estamos en Render con PostgreSQL
 DATABASE_URL = os.getenv("DATABASE_URL")
 USE_POSTGRES = DATABASE_URL is not None
+# Replica opcional para las lecturas (get_db(readonly=True)); sin ella van a la primaria
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or DATABASE_URL
 psycopg2 = None
 psycopg2_extras = None
 
+try:
+    brotli = importlib.import_module("brotli")
+except ImportError:
+    brotli = None
+
+try:
+    msgpack = importlib.import_module("msgpack")
+except ImportError:
+    msgpack = None
+
+try:
+    pil_image = importlib.import_module("PIL.Image")
+    pil_image_ops = importlib.import_module("PIL.ImageOps")
+except ImportError:
+    pil_image = None
+    pil_image_ops = None
+
 if USE_POSTGRES:
     try:
         psycopg2 = importlib.import_module("psycopg2")
@@ -37,19 +80,141 @@ if USE_POSTGRES:
 
 BASE_DIR = os.path.dirname(__file__)
 FRONT_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", "front"))
-DATA_DIR = os.path.join(BASE_DIR, "data")
+DATA_DIR = os.getenv("APP_DATA_DIR") or os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "inventory.db")
+WRITE_LOCK_PATH = DB_PATH + ".write.lock"
+SCHEDULER_LOCK_PATH = DB_PATH + ".scheduler.lock"
+BACKUPS_DIR = os.path.join(DATA_DIR, "backups")
+DB_READONLY_URI = Path(os.path.abspath(DB_PATH)).as_uri() + "?mode=ro"
+STATIC_BUILD_DIR = os.path.join(BASE_DIR, "static_build")
 
 if load_dotenv:
     load_dotenv(os.path.join(BASE_DIR, ".env"), override=False)
     load_dotenv(os.path.join(os.path.dirname(BASE_DIR), ".env"), override=False)
 
-app = Flask(__name__, static_folder=FRONT_DIR, static_url_path="")
+# Los archivos del front se sirven con las rutas propias de abajo (index/static_files/assets)
+app = Flask(__name__, static_folder=None)
 
 EMAIL_CODE_EXPIRY_MINUTES = 10
 EMAIL_RESEND_COOLDOWN_SECONDS = 60
 EMAIL_MAX_ATTEMPTS = 5
 
+ASSET_MAX_AGE_SECONDS = 365 * 24 * 60 * 60
+FINGERPRINT_EXTENSIONS = (".css", ".js")
+
+# Compresion de respuestas dinamicas (los assets con hash ya salen precomprimidos)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "application/manifest+json",
+    "application/msgpack",
+    "image/svg+xml",
+    "text/css",
+    "text/csv",
+    "text/event-stream",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+COMPRESSED_CACHE_SIZE = 256
+UNHASHED_ASSETS = {"service-worker.js"}
+RENDERED_PAGES = ("index.html", "login.html", "tienda.html", "service-worker.js")
+APP_SHELL_URLS = ["/", "/index.html", "/login.html", "/manifest.json"]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SESSION_CLEANUP_INTERVAL_SECONDS = 300
+SESSION_TTL_MS = 7 * 24 * 3600 * 1000
+
+# Audit log: buffer en memoria por worker que un hilo escribe por tandas
+AUDIT_BUFFER_SIZE = 10_000
+AUDIT_BATCH_SIZE = 200
+AUDIT_FLUSH_SECONDS = 2.0
+AUDIT_MAX_IDS = 1000
+AUDIT_PAGE_SIZE = 50
+AUDIT_MAX_PAGE_SIZE = 500
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "180"))
+
+# Perfil de SQLite por conexion (SQLITE_TUNING=0 lo apaga). cache_size negativo es en KiB.
+# page_size solo aplica al crear la BD; los checkpoints los controla el scheduler.
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1").strip().lower() not in {"0", "false", "no"}
+SQLITE_PRAGMAS = (
+    ("mmap_size", int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))),
+    ("cache_size", -int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))),
+    ("temp_store", "MEMORY"),
+    ("wal_autocheckpoint", int(os.getenv("SQLITE_WAL_AUTOCHECKPOINT", "4000"))),
+) if SQLITE_TUNING else ()
+SQLITE_PAGE_SIZE = int(os.getenv("SQLITE_PAGE_SIZE", "4096"))
+SQLITE_WAL_TRUNCATE_BYTES = int(os.getenv("SQLITE_WAL_TRUNCATE_BYTES", str(64 * 1024 * 1024)))
+
+# Scheduler de mantenimiento: un hilo por worker, solo el lider corre las tareas
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1").strip().lower() not in {"0", "false", "no"}
+SCHEDULER_TICK_SECONDS = 30
+SCHEDULER_ADVISORY_LOCK_ID = 0x506C7573
+LEDGER_COMPACTION_INTERVAL_SECONDS = 3600
+ANALYZE_INTERVAL_SECONDS = 24 * 3600
+WAL_CHECKPOINT_INTERVAL_SECONDS = 600
+VACUUM_INTERVAL_SECONDS = 7 * 24 * 3600
+VACUUM_FREE_RATIO = 0.2
+BACKUP_INTERVAL_SECONDS = int(os.getenv("BACKUP_INTERVAL_SECONDS", str(24 * 3600)))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "3"))
+
+STOCK_MOVEMENT_KINDS = ("sale", "return", "adjustment", "import", "receipt", "snapshot")
+STOCK_SNAPSHOT_EVERY = 50
+MOVEMENTS_PAGE_SIZE = 50
+MOVEMENTS_MAX_PAGE_SIZE = 500
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = 1024
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "60"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# /api/events: cada stream abierto ocupa un hilo del servidor, por eso hay un tope por proceso
+EVENT_BACKLOG_SIZE = 500
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "8"))
+SSE_TICKET_TTL_SECONDS = int(os.getenv("SSE_TICKET_TTL_SECONDS", "30"))
+
+# Catalogo publico paginado. Rangos de precio en centavos: (desde, hasta exclusivo)
+STORE_PAGE_SIZE = 12
+STORE_MAX_PAGE_SIZE = 48
+STORE_PRICE_BANDS = ((0, 1000), (1000, 2500), (2500, 5000), (5000, 10000), (10000, None))
+# La primera pagina pre-renderada se descarta al cambiar el inventario en este proceso;
+# los demas workers la regeneran a mas tardar despues de este TTL
+STOREFRONT_SNAPSHOT_TTL_SECONDS = int(os.getenv("STOREFRONT_SNAPSHOT_TTL_SECONDS", "30"))
+
+# Ajustes de la tabla config: nombre -> (tipo, variable de entorno, default, alcance).
+# Un valor guardado gana sobre el entorno; los de alcance "store" se guardan por tienda.
+SETTING_DEFINITIONS = {
+    "timezone": ("timezone", "APP_TZ", "America/Panama", "global"),
+    "currency": ("currency", "CURRENCY", "USD", "store"),
+    "taxRate": ("percent", "TAX_RATE", "0", "store"),
+    "whatsappNumber": ("phone", "WHATSAPP_NUMBER", "", "store"),
+}
+SETTINGS_CACHE_TTL_SECONDS = int(os.getenv("SETTINGS_CACHE_TTL_SECONDS", "60"))
+
+# Imagenes de productos: original por contenido (sha256) en el disco de datos + miniaturas WebP
+IMAGES_DIR = os.path.join(DATA_DIR, "images")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_WIDTHS = (160, 320, 640, 960)
+IMAGE_WEBP_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+IMAGE_NAME_RE = re.compile(r"^(?P<digest>[0-9a-f]{64})(?:-(?P<width>\d+))?\.(?P<ext>jpg|png|webp|gif)$")
+
+# Export CSV de items: se arma en memoria hasta este tamano y despues en un archivo temporal
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# Estado del pipeline de assets, se llena en build_static_assets() al arrancar
+ASSET_MANIFEST = {}
+ASSET_VARIANTS = {}
+RENDERED_FILES = {}
+FRONT_FILES = set()
+
 
 def is_production_env():
     app_env = (os.getenv("APP_ENV") or os.getenv("FLASK_ENV") or "").strip().lower()
@@ -80,8 +245,7 @@ def allow_auto_verify_on_email_failure():
 
 
 def now_local():
-    tz_name = os.getenv("APP_TZ", "America/Panama")
-    return datetime.now(ZoneInfo(tz_name))
+    return datetime.now(SETTINGS.get("timezone"))
 
 
 def normalize_email(value):
@@ -102,6 +266,45 @@ def generate_email_code():
     return f"{secrets.randbelow(1_000_000):06d}"
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def now_ms():
+    """Ahora en milisegundos UTC: el formato de created_at/updated_at en ventas, items, ledger y sesiones"""
+    return time.time_ns() // 1_000_000
+
+
+def to_epoch_ms(value):
+    """datetime, texto ISO o ms a milisegundos UTC (sin zona se asume la de la app); None si no se entiende"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if text.isdigit():
+            return int(text)
+        try:
+            value = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=SETTINGS.get("timezone"))
+    # Aritmetica entera: timestamp() en float puede perder el ultimo milisegundo
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def ms_to_iso(ms):
+    """Timestamp guardado a ISO 8601 en la zona de la app (lo que devuelve la API)"""
+    if ms is None:
+        return None
+    return (EPOCH + timedelta(milliseconds=ms)).astimezone(SETTINGS.get("timezone")).isoformat(
+        timespec="milliseconds"
+    )
+
+
 def parse_iso_datetime(value):
     if not value:
         return now_local()
@@ -182,16 +385,6 @@ def store_email_verification(conn, user_id, code):
     )
 
 
-def create_session(conn, user_id):
-    token = str(uuid.uuid4())
-    created_at = now_local().isoformat()
-    conn.execute(
-        "INSERT INTO sessions (token, user_id, created_at) VALUES (?, ?, ?)",
-        (token, user_id, created_at),
-    )
-    return token
-
-
 def pdf_safe(value, default="N/A"):
     if value is None:
         return default
@@ -203,59 +396,494 @@ def format_invoice_datetime(value):
     if not value:
         return ""
     try:
+        if isinstance(value, int):
+            # Timestamps guardados en ms UTC
+            value = ms_to_iso(value)
         dt = datetime.fromisoformat(value)
         if dt.tzinfo is None:
             return dt.strftime("%Y-%m-%d %H:%M")
-        tz_name = os.getenv("APP_TZ", "America/Panama")
-        return dt.astimezone(ZoneInfo(tz_name)).strftime("%Y-%m-%d %H:%M")
+        return dt.astimezone(SETTINGS.get("timezone")).strftime("%Y-%m-%d %H:%M")
     except Exception:
         return str(value)
 
 
-def get_db():
+def get_db(readonly=False):
+    """Conexion a la BD. Con readonly=True es solo lectura: en SQLite se abre con mode=ro y
+    query_only (no toca el lock de escritura), en Postgres va a DATABASE_READ_URL si existe."""
     if USE_POSTGRES:
-        conn = psycopg2.connect(DATABASE_URL)
+        conn = psycopg2.connect(DATABASE_READ_URL if readonly else DATABASE_URL)
         conn.autocommit = False
+        if readonly:
+            conn.set_session(readonly=True)
         # Retornar un wrapper que proporciona execute() compatible
-        return PostgresConnectionWrapper(conn)
+        return InstrumentedConnection(PostgresConnectionWrapper(conn))
     else:
         os.makedirs(DATA_DIR, exist_ok=True)
-        conn = sqlite3.connect(DB_PATH, timeout=30)
+        if readonly:
+            conn = sqlite3.connect(DB_READONLY_URI, uri=True, timeout=30)
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            # journal_mode = WAL queda guardado en la BD: lo fija init_db() una vez
+            conn = sqlite3.connect(DB_PATH, timeout=30)
+            conn.execute("PRAGMA synchronous = NORMAL")
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA busy_timeout = 30000")
-        conn.execute("PRAGMA journal_mode = WAL")
-        conn.execute("PRAGMA synchronous = NORMAL")
-        return conn
+        tune_sqlite_connection(conn)
+        return InstrumentedConnection(conn)
 
 
-class PostgresConnectionWrapper:
-    """Wrapper que hace psycopg2 compatible con sqlite3"""
+def tune_sqlite_connection(conn, pragmas=None):
+    """Aplicar el perfil SQLITE_PRAGMAS (o `pragmas`) a una conexion recien abierta"""
+    for name, value in SQLITE_PRAGMAS if pragmas is None else pragmas:
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def optimize_sqlite_at_exit():
+    """Al terminar el worker: PRAGMA optimize y un checkpoint TRUNCATE si nadie lo impide"""
+    if USE_POSTGRES or not os.path.exists(DB_PATH):
+        return
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=1)
+        try:
+            conn.execute("PRAGMA optimize")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Error optimizing SQLite at exit: {e}")
+
+
+atexit.register(optimize_sqlite_at_exit)
+
+
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def write_lock():
+    """Un solo escritor a la vez: entre hilos con un Lock y entre workers con flock.
+
+    Los writers hacen cola aqui en orden en vez de competir por el lock de SQLite
+    con busy_timeout; los lectores no pasan por aqui y escalan con los workers.
+    """
+    with _write_lock:
+        if USE_POSTGRES or fcntl is None:
+            yield
+            return
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(WRITE_LOCK_PATH, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def write_transaction():
+    """Conexion para escrituras: serializada con write_lock() y dentro de una transaccion.
+
+    Hace commit al salir sin error y rollback si hubo excepcion. Un handler que
+    responde un error antes de escribir no necesita hacer nada mas. Si el request ya
+    tiene una abierta (@idempotent) se reutiliza y el commit lo hace la de afuera.
+    """
+    in_request = has_request_context()
+    if in_request and g.get("write_conn") is not None:
+        yield g.write_conn
+        return
+    with write_lock():
+        conn = get_db()
+        if in_request:
+            g.write_conn = conn
+        try:
+            if not USE_POSTGRES:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if in_request:
+                g.pop("write_conn", None)
+            conn.close()
+
+
+def setting_key(name, store_id=None):
+    """Clave en la tabla config: los ajustes de tienda llevan el id de la tienda"""
+    if SETTING_DEFINITIONS[name][3] == "store":
+        return f"store:{store_id}:{name}"
+    return name
+
+
+def parse_setting(kind, raw):
+    """Convertir un valor de texto al tipo del ajuste; devuelve (valor, error)"""
+    text = str(raw if raw is not None else "").strip()
+    if kind == "timezone":
+        try:
+            return ZoneInfo(text), None
+        except (ZoneInfoNotFoundError, ValueError):
+            return None, "Unknown timezone."
+    if kind == "currency":
+        code = text.upper()
+        if not re.fullmatch(r"[A-Z]{3}", code):
+            return None, "Currency must be a 3-letter code."
+        return code, None
+    if kind == "percent":
+        try:
+            rate = Decimal(text or "0")
+        except InvalidOperation:
+            return None, "Tax rate must be a number."
+        if not rate.is_finite() or rate < 0 or rate > 100:
+            return None, "Tax rate must be between 0 and 100."
+        return rate, None
+    if kind == "phone":
+        digits = re.sub(r"[\s()+-]", "", text)
+        if digits and not (digits.isdigit() and 7 <= len(digits) <= 15):
+            return None, "WhatsApp number must have 7 to 15 digits."
+        return digits, None
+    return text, None
+
+
+def setting_to_text(kind, value):
+    if kind == "timezone":
+        return value.key
+    return str(value)
+
+
+def setting_to_json(kind, value):
+    if kind == "timezone":
+        return value.key
+    if kind == "percent":
+        return float(value)
+    return value
+
+
+class SettingsCache:
+    """Ajustes tipados de la tabla config con el entorno como default.
+
+    Se leen todos de una vez y cada valor se convierte (ZoneInfo, Decimal...) una sola vez;
+    update() escribe y descarta la copia. Los demas workers releen tras el TTL.
+    """
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.values = {}
+        self.parsed = {}
+
+    def _ensure_loaded(self):
+        loaded_at = self.loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds:
+            return
+        try:
+            with get_db(readonly=True) as conn:
+                rows = conn.execute("SELECT key, value FROM config").fetchall()
+        except Exception:
+            # Antes de init_db() la tabla no existe: usar el entorno sin cachear la lectura
+            return
+        with self.lock:
+            self.values = {row["key"]: row["value"] for row in rows}
+            self.parsed = {}
+            self.loaded_at = time.monotonic()
+
+    def get(self, name, store_id=None):
+        self._ensure_loaded()
+        key = setting_key(name, store_id)
+        with self.lock:
+            if key in self.parsed:
+                return self.parsed[key]
+            kind, env_name, default, _ = SETTING_DEFINITIONS[name]
+            raw = self.values.get(key)
+            if raw is None:
+                raw = os.getenv(env_name, default)
+            value, error = parse_setting(kind, raw)
+            if error:
+                print(f"Invalid setting {key}={raw!r}: {error} Using {default!r}.")
+                value, _ = parse_setting(kind, default)
+            self.parsed[key] = value
+            return value
+
+    def update(self, conn, store_id, values):
+        """Guardar valores ya validados dentro de la transaccion del llamador"""
+        for name, value in values.items():
+            conn.execute(
+                "INSERT INTO config (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (setting_key(name, store_id), setting_to_text(SETTING_DEFINITIONS[name][0], value)),
+            )
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+
+SETTINGS = SettingsCache(SETTINGS_CACHE_TTL_SECONDS)
+
+
+class Metrics:
+    """Contadores en memoria (por proceso) expuestos en /api/metrics"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.statements = {}
+
+    def observe_request(self, method, endpoint, status, seconds):
+        key = (method, endpoint, str(status))
+        with self.lock:
+            entry = self.requests.get(key)
+            if entry is None:
+                entry = self.requests[key] = {
+                    "buckets": [0] * len(LATENCY_BUCKETS),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][index] += 1
+            entry["sum"] += seconds
+            entry["count"] += 1
+
+    def observe_statement(self, statement, seconds, rows=0, executions=1):
+        with self.lock:
+            entry = self.statements.get(statement)
+            if entry is None:
+                entry = self.statements[statement] = {"count": 0, "seconds": 0.0, "rows": 0}
+            entry["count"] += executions
+            entry["seconds"] += seconds
+            entry["rows"] += rows
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by endpoint.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            requests_snapshot = {k: dict(v, buckets=list(v["buckets"])) for k, v in self.requests.items()}
+            statements_snapshot = {k: dict(v) for k, v in self.statements.items()}
+
+        for (method, endpoint, status), entry in sorted(requests_snapshot.items()):
+            labels = f'method="{prom_label(method)}",endpoint="{prom_label(endpoint)}",status="{status}"'
+            for bound, bucket_count in zip(LATENCY_BUCKETS, entry["buckets"]):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {entry['sum']:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {entry['count']}")
+
+        metric_defs = (
+            ("sql_statements_total", "counter", "Executions per SQL statement.", "count"),
+            ("sql_statement_duration_seconds_total", "counter", "Time spent per SQL statement.", "seconds"),
+            ("sql_rows_returned_total", "counter", "Rows fetched per SQL statement.", "rows"),
+        )
+        for name, metric_type, help_text, field in metric_defs:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for statement, entry in sorted(statements_snapshot.items()):
+                value = entry[field]
+                if field == "seconds":
+                    value = f"{value:.6f}"
+                lines.append(f'{name}{{statement="{prom_label(statement)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def prom_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def normalize_sql(query):
+    return " ".join(str(query).split())[:160]
+
+
+METRICS = Metrics()
+
+
+def record_statement(statement, seconds, rows=0, executions=1):
+    METRICS.observe_statement(statement, seconds, rows, executions)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        print(f"Slow query ({seconds * 1000:.1f} ms, {rows} rows): {statement}")
+
+
+class InstrumentedCursor:
+    """Cursor que mide tiempo y filas de cada sentencia"""
+    def __init__(self, cur, statement=None):
+        self.cur = cur
+        self.statement = statement
+
+    def __getattr__(self, name):
+        return getattr(self.cur, name)
+
+    def __iter__(self):
+        # Iterar sin fetchall: un cursor server-side de Postgres trae las filas por tandas
+        rows = 0
+        seconds = 0.0
+        iterator = iter(self.cur)
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - started
+            rows += 1
+            yield row
+        record_statement(self.statement, seconds, rows, 0)
+
+    def execute(self, query, params=None):
+        self.statement = normalize_sql(query)
+        started = time.perf_counter()
+        if params is None:
+            self.cur.execute(query)
+        else:
+            self.cur.execute(query, params)
+        record_statement(self.statement, time.perf_counter() - started)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        self.statement = normalize_sql(query)
+        started = time.perf_counter()
+        self.cur.executemany(query, seq_of_params)
+        record_statement(self.statement, time.perf_counter() - started, executions=len(seq_of_params))
+        return self
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self.cur.fetchone()
+        record_statement(self.statement, time.perf_counter() - started, 1 if row is not None else 0, 0)
+        return row
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self.cur.fetchall()
+        record_statement(self.statement, time.perf_counter() - started, len(rows), 0)
+        return rows
+
+    def close(self):
+        self.cur.close()
+
+
+class InstrumentedConnection:
+    """Envuelve sqlite3 o PostgresConnectionWrapper para registrar metricas SQL"""
     def __init__(self, conn):
         self.conn = conn
-    
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
     def __enter__(self):
+        self.conn.__enter__()
         return self
-    
+
     def __exit__(self, *args):
-        self.conn.close()
-    
+        return self.conn.__exit__(*args)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.conn.cursor(*args, **kwargs))
+
     def execute(self, query, params=None):
-        cur = self.conn.cursor(cursor_factory=psycopg2_extras.RealDictCursor)
-        if params:
-            cur.execute(query, params)
+        statement = normalize_sql(query)
+        started = time.perf_counter()
+        if params is None:
+            cur = self.conn.execute(query)
+        else:
+            cur = self.conn.execute(query, params)
+        record_statement(statement, time.perf_counter() - started)
+        return InstrumentedCursor(cur, statement)
+
+    def executemany(self, query, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        statement = normalize_sql(query)
+        started = time.perf_counter()
+        cur = self.conn.executemany(query, seq_of_params)
+        record_statement(statement, time.perf_counter() - started, executions=len(seq_of_params))
+        return InstrumentedCursor(cur, statement)
+
+    def execute_values(self, query, rows, page_size=1000):
+        rows = list(rows)
+        statement = normalize_sql(query)
+        started = time.perf_counter()
+        cur = self.conn.execute_values(query, rows, page_size=page_size)
+        record_statement(statement, time.perf_counter() - started, executions=len(rows))
+        return InstrumentedCursor(cur, statement)
+
+    def copy_expert(self, query, file, params=None):
+        statement = normalize_sql(query)
+        started = time.perf_counter()
+        cur = self.conn.copy_expert(query, file, params)
+        record_statement(statement, time.perf_counter() - started, cur.rowcount)
+        return InstrumentedCursor(cur, statement)
+
+
+# Placeholders ? fuera de literales; los % se duplican porque psycopg2 los interpreta
+_PG_PARAM_RE = re.compile(r"'(?:[^']|'')*'|\?")
+POSTGRES_ITERSIZE = 2000
+COPY_CHUNK_BYTES = 64 * 1024
+
+
+@lru_cache(maxsize=512)
+def translate_sql_postgres(query):
+    """Pasar SQL escrito con placeholders ? (sqlite3) al formato %s de psycopg2"""
+    if "?" not in query:
+        return query
+    query = query.replace("%", "%%")
+    return _PG_PARAM_RE.sub(lambda m: "%s" if m.group() == "?" else m.group(), query)
+
+
+class PostgresConnectionWrapper:
+    """Wrapper que hace psycopg2 compatible con sqlite3"""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        # Igual que sqlite3: commit si el bloque termino bien; ademas cierra la conexion
+        if exc_type is None:
+            self.commit()
         else:
-            cur.execute(query)
+            self.rollback()
+        self.conn.close()
+
+    def cursor(self, name=None):
+        """Cursor con filas tipo dict; con `name` es un cursor server-side que trae
+        POSTGRES_ITERSIZE filas por viaje al iterarlo."""
+        cur = self.conn.cursor(name=name, cursor_factory=psycopg2_extras.RealDictCursor)
+        if name:
+            cur.itersize = POSTGRES_ITERSIZE
         return PostgresCursor(cur, self.conn)
-    
+
+    def execute(self, query, params=None):
+        return self.cursor().execute(query, params)
+
+    def executemany(self, query, seq_of_params):
+        return self.cursor().executemany(query, seq_of_params)
+
+    def execute_values(self, query, rows, page_size=1000):
+        """INSERT de muchas filas en pocas sentencias: `query` lleva `VALUES %s`"""
+        cur = self.cursor()
+        psycopg2_extras.execute_values(cur.cur, query, rows, page_size=page_size)
+        return cur
+
+    def copy_expert(self, query, file, params=None):
+        """COPY ... FROM STDIN / TO STDOUT contra un archivo; COPY no acepta parametros,
+        asi que `params` (placeholders %s) se interpolan con mogrify."""
+        cur = self.cursor()
+        if params is not None:
+            query = cur.cur.mogrify(query, params).decode()
+        cur.cur.copy_expert(query, file, size=COPY_CHUNK_BYTES)
+        return cur
+
     def commit(self):
         try:
             self.conn.commit()
         except:
             pass
-    
+
     def close(self):
         self.conn.close()
-    
+
     def rollback(self):
         try:
             self.conn.rollback()
@@ -268,116 +896,809 @@ class PostgresCursor:
     def __init__(self, cur, conn):
         self.cur = cur
         self.conn = conn
-    
+
+    def __iter__(self):
+        return iter(self.cur)
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount
+
+    def execute(self, query, params=None):
+        if params is None:
+            self.cur.execute(query)
+        else:
+            self.cur.execute(translate_sql_postgres(query), params)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        # execute_batch manda varias sentencias por viaje en vez de una por fila
+        psycopg2_extras.execute_batch(self.cur, translate_sql_postgres(query), seq_of_params, page_size=500)
+        return self
+
     def fetchone(self):
         return self.cur.fetchone()
-    
+
     def fetchall(self):
         return self.cur.fetchall()
-    
+
     def close(self):
         self.cur.close()
 
 
-def execute_query(conn, query, params=None, fetch=False, fetch_one=False):
-    """Ejecutar query de forma agnóstica entre SQLite y PostgreSQL"""
-    try:
-        if params:
-            cur = conn.execute(query, params)
-        else:
-            cur = conn.execute(query)
-        if fetch_one:
-            result = cur.fetchone()
-            cur.close()
-            return result
-        elif fetch:
-            result = cur.fetchall()
-            cur.close()
-            return result
-        else:
-            conn.commit()
-            return None
-    except Exception as e:
-        print(f"Query error: {e}")
-        if USE_POSTGRES:
-            conn.rollback()
-        raise
+# Repositorios: el SQL de items, ventas y sesiones que cambia entre SQLite y Postgres
+# vive aqui y no en los handlers. Reciben una conexion abierta (get_db/write_transaction).
+ITEM_COLUMNS = (
+    "id", "store_id", "name", "sku", "quantity", "location", "price_cents",
+    "cost_unit_cents", "threshold", "description", "image_url", "status", "updated_at",
+)
+# CSV de export/import: las columnas de items sin store_id (montos en centavos, fecha en ms)
+ITEM_EXPORT_COLUMNS = tuple(column for column in ITEM_COLUMNS if column != "store_id")
+ITEM_IMPORT_REQUIRED = {"name", "sku", "location"}
+ITEM_IMPORT_BATCH = 5000
+# Upsert por id; ON CONFLICT existe en SQLite >= 3.24 y en Postgres. Nunca cambia store_id: un id
+# de otra tienda no se toca (los handlers ademas le dan un id nuevo con owner/foreign_ids)
+ITEM_UPSERT_CONFLICT_SQL = (
+    "ON CONFLICT (id) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in ITEM_COLUMNS if column not in {"id", "store_id"})
+    + " WHERE items.store_id = excluded.store_id"
+)
+
+
+def stream_rows(conn, query, params=()):
+    """Iterar el resultado sin traerlo entero a memoria: en Postgres con un cursor
+    server-side (con nombre), en SQLite el cursor ya avanza fila por fila."""
+    if USE_POSTGRES:
+        return conn.cursor(name=f"stream_{uuid.uuid4().hex}").execute(query, params)
+    return conn.execute(query, params)
 
 
-def init_db():
-    conn = get_db()
-    try:
+class ItemsRepo:
+    def __init__(self, conn, store_id):
+        self.conn = conn
+        self.store_id = store_id
+
+    def stream(self):
+        return stream_rows(
+            self.conn, "SELECT * FROM items WHERE store_id = ? ORDER BY updated_at DESC", (self.store_id,)
+        )
+
+    def get(self, item_id):
+        return self.conn.execute(
+            "SELECT * FROM items WHERE id = ? AND store_id = ?", (item_id, self.store_id)
+        ).fetchone()
+
+    def owner(self, item_id):
+        """Cantidad y tienda de un id en cualquier tienda (los ids son globales)"""
+        return self.conn.execute(
+            "SELECT quantity, store_id FROM items WHERE id = ?", (item_id,)
+        ).fetchone()
+
+    def sku_taken(self, sku, item_id):
+        return self.conn.execute(
+            "SELECT id FROM items WHERE store_id = ? AND sku = ? AND id != ?",
+            (self.store_id, sku, item_id),
+        ).fetchone() is not None
+
+    def quantities(self):
+        return {
+            row["id"]: row["quantity"]
+            for row in self.conn.execute(
+                "SELECT id, quantity FROM items WHERE store_id = ?", (self.store_id,)
+            ).fetchall()
+        }
+
+    def row(self, item):
+        return (
+            item["id"],
+            self.store_id,
+            item["name"],
+            item["sku"],
+            item["quantity"],
+            item["location"],
+            to_cents(item["price"]),
+            to_cents(item["costUnit"]),
+            item["threshold"],
+            item["description"],
+            item["imageUrl"],
+            item["status"],
+            to_epoch_ms(item["updatedAt"]),
+        )
+
+    def upsert(self, item):
+        self.upsert_many([item])
+
+    def upsert_many(self, items):
+        rows = [self.row(item) for item in items]
+        if not rows:
+            return
+        columns = ", ".join(ITEM_COLUMNS)
         if USE_POSTGRES:
-            cur = conn.cursor()
+            # execute_values: un INSERT multi-fila por pagina en vez de una sentencia por item
+            self.conn.execute_values(
+                f"INSERT INTO items ({columns}) VALUES %s {ITEM_UPSERT_CONFLICT_SQL}", rows
+            )
         else:
-            cur = conn.cursor()
-        
-        # Crear tablas base
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                username TEXT NOT NULL UNIQUE,
-                email TEXT UNIQUE,
-                password_hash TEXT NOT NULL,
-                email_verified INTEGER NOT NULL DEFAULT 1,
-                created_at TEXT NOT NULL
+            placeholders = ", ".join("?" for _ in ITEM_COLUMNS)
+            self.conn.executemany(
+                f"INSERT INTO items ({columns}) VALUES ({placeholders}) {ITEM_UPSERT_CONFLICT_SQL}", rows
             )
-            """
+
+    def export_csv(self, out):
+        """Escribir los items de la tienda como CSV con encabezado en `out` (binario)"""
+        columns = ", ".join(ITEM_EXPORT_COLUMNS)
+        if USE_POSTGRES:
+            # COPY TO STDOUT: Postgres arma el CSV y lo manda por bloques
+            self.conn.copy_expert(
+                f"COPY (SELECT {columns} FROM items WHERE store_id = %s ORDER BY id) "
+                "TO STDOUT WITH (FORMAT csv, HEADER true)",
+                out,
+                (self.store_id,),
+            )
+            return
+        text = TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+        writer = csv.writer(text)
+        writer.writerow(ITEM_EXPORT_COLUMNS)
+        rows = stream_rows(
+            self.conn, f"SELECT {columns} FROM items WHERE store_id = ? ORDER BY id", (self.store_id,)
         )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS email_verifications (
-                user_id TEXT PRIMARY KEY,
-                code_hash TEXT NOT NULL,
-                expires_at TEXT NOT NULL,
-                attempts INTEGER NOT NULL DEFAULT 0,
-                resend_available_at TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
+        for row in rows:
+            writer.writerow(tuple(row))
+        text.detach()
+
+    def import_csv(self, stream):
+        """Cargar items desde un CSV como el de export_csv() (`stream` binario).
+
+        Se saltan las filas sin name, sku o location; un id que ya usa otra tienda recibe uno
+        nuevo. Devuelve {id: quantity} de lo importado; ValueError si el CSV no sirve.
+        """
+        header = next(csv.reader([stream.readline().decode("utf-8-sig")]), [])
+        header = [column.strip() for column in header]
+        if not ITEM_IMPORT_REQUIRED <= set(header) or not set(header) <= set(ITEM_EXPORT_COLUMNS):
+            raise ValueError("CSV header must use the export columns (name, sku and location are required).")
+        if USE_POSTGRES:
+            return self._copy_import(stream, header)
+
+        imported = {}
+        batch = []
+        for values in csv.reader(TextIOWrapper(stream, encoding="utf-8", newline="")):
+            item, error = parse_item(csv_item_payload(dict(zip(header, values))))
+            if error:
+                continue
+            batch.append(item)
+            if len(batch) >= ITEM_IMPORT_BATCH:
+                self._import_batch(batch, imported)
+                batch = []
+        self._import_batch(batch, imported)
+        return imported
+
+    def _import_batch(self, batch, imported):
+        taken = self.foreign_ids([item["id"] for item in batch])
+        for item in batch:
+            if item["id"] in taken:
+                item["id"] = str(uuid.uuid4())
+            imported[item["id"]] = item["quantity"]
+        self.upsert_many(batch)
+
+    def foreign_ids(self, item_ids):
+        """De estos ids, los que ya usa otra tienda (consulta por tandas de 500)"""
+        taken = set()
+        for start in range(0, len(item_ids), 500):
+            chunk = item_ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT id FROM items WHERE store_id <> ? AND id IN ({', '.join('?' for _ in chunk)})",
+                [self.store_id, *chunk],
+            ).fetchall()
+            taken.update(row["id"] for row in rows)
+        return taken
+
+    def _copy_import(self, stream, header):
+        """COPY FROM STDIN a una tabla temporal todo TEXT (un valor malo no corta el COPY) y de ahi
+        un solo INSERT ... SELECT con las reglas de parse_item: numeros que no son enteros valen 0,
+        quantity y threshold no bajan de 0, status vacio es Nuevo. Con ids repetidos gana la
+        ultima fila, como en el upsert por tandas de SQLite."""
+        columns = ", ".join(f"{column} TEXT" for column in ITEM_EXPORT_COLUMNS)
+        try:
+            self.conn.execute(
+                f"CREATE TEMP TABLE items_import (rownum BIGSERIAL, {columns}) ON COMMIT DROP"
+            )
+            self.conn.copy_expert(
+                f"COPY items_import ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", stream
             )
+            rows = self.conn.execute(
+                f"""
+                INSERT INTO items ({", ".join(ITEM_COLUMNS)})
+                SELECT id, store_id, name, sku, quantity, location, price_cents, cost_unit_cents, threshold,
+                       description, image_url, status, updated_at
+                FROM (
+                    SELECT DISTINCT ON (id) * FROM (
+                        SELECT
+                            CASE WHEN COALESCE(i.id, '') = ''
+                                OR EXISTS (SELECT 1 FROM items o WHERE o.id = i.id AND o.store_id <> ?)
+                            THEN gen_random_uuid()::text ELSE i.id END AS id,
+                            ? AS store_id,
+                            TRIM(i.name) AS name, TRIM(i.sku) AS sku,
+                            GREATEST(COALESCE({pg_int_sql("i.quantity")}, 0), 0) AS quantity,
+                            TRIM(i.location) AS location,
+                            COALESCE({pg_int_sql("i.price_cents")}, 0) AS price_cents,
+                            COALESCE({pg_int_sql("i.cost_unit_cents")}, 0) AS cost_unit_cents,
+                            GREATEST(COALESCE({pg_int_sql("i.threshold")}, 0), 0) AS threshold,
+                            COALESCE(TRIM(i.description), '') AS description,
+                            COALESCE(TRIM(i.image_url), '') AS image_url,
+                            COALESCE(NULLIF(TRIM(i.status), ''), 'Nuevo') AS status,
+                            COALESCE(
+                                CASE WHEN TRIM(i.updated_at) ~ '^[0-9]{{1,18}}$' THEN TRIM(i.updated_at)::bigint END, ?
+                            ) AS updated_at,
+                            i.rownum
+                        FROM items_import i
+                        WHERE TRIM(i.name) <> '' AND TRIM(i.sku) <> '' AND TRIM(i.location) <> ''
+                    ) AS parsed
+                    ORDER BY id, rownum DESC
+                ) AS src
+                {ITEM_UPSERT_CONFLICT_SQL}
+                RETURNING id, quantity
+                """,
+                (self.store_id, self.store_id, now_ms()),
+            ).fetchall()
+        except psycopg2.DataError as error:
+            raise ValueError(f"Invalid CSV: {error}") from error
+        return {row["id"]: row["quantity"] for row in rows}
+
+    def update(self, item):
+        self.conn.execute(
             """
+            UPDATE items
+            SET name = ?, sku = ?, quantity = ?, location = ?, price_cents = ?, cost_unit_cents = ?,
+                threshold = ?, description = ?, image_url = ?, status = ?, updated_at = ?
+            WHERE id = ? AND store_id = ?
+            """,
+            self.row(item)[2:] + (item["id"], self.store_id),
         )
-        cur.execute(
+
+    def add_quantity(self, item_id, delta):
+        self.conn.execute(
+            "UPDATE items SET quantity = quantity + ? WHERE id = ? AND store_id = ?",
+            (delta, item_id, self.store_id),
+        )
+
+    def delete(self, item_id):
+        self.conn.execute("DELETE FROM items WHERE id = ? AND store_id = ?", (item_id, self.store_id))
+
+    def clear(self):
+        self.conn.execute("DELETE FROM items WHERE store_id = ?", (self.store_id,))
+
+
+def pg_int_sql(column):
+    """Texto a entero en SQL de Postgres como to_int(): NULL si no es un entero (cabe en INTEGER)"""
+    return f"CASE WHEN TRIM({column}) ~ '^[+-]?[0-9]{{1,9}}$' THEN TRIM({column})::integer END"
+
+
+def csv_item_payload(row):
+    """Fila del CSV de items (centavos, ms) al payload de parse_item (dolares)"""
+    payload = {
+        key: row.get(key, "")
+        for key in ("id", "name", "sku", "quantity", "location", "threshold", "description", "status")
+    }
+    payload["price"] = from_cents(to_int(row.get("price_cents")))
+    payload["costUnit"] = from_cents(to_int(row.get("cost_unit_cents")))
+    payload["imageUrl"] = row.get("image_url", "")
+    payload["updatedAt"] = row.get("updated_at") or None
+    return payload
+
+
+class SalesRepo:
+    def __init__(self, conn, store_id):
+        self.conn = conn
+        self.store_id = store_id
+
+    def stream(self, start_ms=None, end_ms=None):
+        """Ventas de la tienda (la mas nueva primero), opcionalmente en [start_ms, end_ms)"""
+        query = "SELECT * FROM sales WHERE store_id = ?"
+        params = [self.store_id]
+        if start_ms is not None:
+            query += " AND created_at >= ?"
+            params.append(start_ms)
+        if end_ms is not None:
+            query += " AND created_at < ?"
+            params.append(end_ms)
+        return stream_rows(self.conn, query + " ORDER BY created_at DESC", params)
+
+    def get(self, sale_id):
+        return self.conn.execute(
+            "SELECT * FROM sales WHERE id = ? AND store_id = ?", (sale_id, self.store_id)
+        ).fetchone()
+
+    def find(self, sale_id):
+        """Venta con ese id en cualquier tienda (ids de venta generados por el cliente)"""
+        return self.conn.execute("SELECT * FROM sales WHERE id = ?", (sale_id,)).fetchone()
+
+    def insert(self, sale):
+        self.conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS sessions (
-                token TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
+            INSERT INTO sales
+            (id, store_id, item_id, quantity, price_cents, total_cents, cost_unit_cents, gain_cents, payment_method, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                sale["id"],
+                self.store_id,
+                sale["item_id"],
+                sale["quantity"],
+                sale["price_cents"],
+                sale["total_cents"],
+                sale["cost_unit_cents"],
+                sale["gain_cents"],
+                sale["payment_method"],
+                sale["created_at"],
+            ),
+        )
+
+    def delete(self, sale_id):
+        self.conn.execute("DELETE FROM sales WHERE id = ? AND store_id = ?", (sale_id, self.store_id))
+
+    def totals(self, start_ms, end_ms, by_payment=False):
+        """Sumas enteras del rango; con by_payment una fila por medio de pago"""
+        group = "payment_method, " if by_payment else ""
+        query = f"""
+            SELECT
+                {group}SUM(total_cents) AS total_cents,
+                SUM(gain_cents) AS gain_cents,
+                COUNT(*) AS count,
+                SUM(quantity) AS units
+            FROM sales
+            WHERE store_id = ? AND created_at >= ? AND created_at < ?
+        """
+        if by_payment:
+            query += " GROUP BY payment_method ORDER BY total_cents DESC"
+        return self.conn.execute(query, (self.store_id, start_ms, end_ms)).fetchall()
+
+
+class SessionsRepo:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def create(self, user_id, token=None):
+        token = token or str(uuid.uuid4())
+        self.conn.execute(
+            "INSERT INTO sessions (token, user_id, created_at) VALUES (?, ?, ?)",
+            (token, user_id, now_ms()),
+        )
+        return token
+
+    def lookup(self, token):
+        """user_id y store_id de la sesion vigente, o None (las vencidas las borra el scheduler)"""
+        return self.conn.execute(
             """
+            SELECT s.user_id, u.store_id
+            FROM sessions s
+            JOIN users u ON u.id = s.user_id
+            WHERE s.token = ? AND s.created_at >= ?
+            """,
+            (token, now_ms() - SESSION_TTL_MS),
+        ).fetchone()
+
+    def delete(self, token):
+        self.conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def create_stream_ticket(self, user_id):
+        """Ticket corto y de un solo uso para GET /api/events (EventSource no manda headers,
+        asi el token de sesion no termina en la URL ni en los logs). Se guarda solo el hash."""
+        ticket = secrets.token_urlsafe(32)
+        self.conn.execute(
+            "INSERT INTO stream_tickets (ticket_hash, user_id, expires_at) VALUES (?, ?, ?)",
+            (hashlib.sha256(ticket.encode("utf-8")).hexdigest(), user_id, now_ms() + SSE_TICKET_TTL_SECONDS * 1000),
         )
-        cur.execute(
+        return ticket
+
+    def redeem_stream_ticket(self, ticket):
+        """Consumir el ticket: user_id y store_id si sigue vigente y nadie lo uso antes, o None"""
+        ticket_hash = hashlib.sha256(ticket.encode("utf-8")).hexdigest()
+        session = self.conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS items (
+            SELECT t.user_id, u.store_id
+            FROM stream_tickets t
+            JOIN users u ON u.id = t.user_id
+            WHERE t.ticket_hash = ? AND t.expires_at >= ?
+            """,
+            (ticket_hash, now_ms()),
+        ).fetchone()
+        # En Postgres un canje simultaneo espera este DELETE y despues no borra nada
+        deleted = self.conn.execute("DELETE FROM stream_tickets WHERE ticket_hash = ?", (ticket_hash,)).rowcount
+        return session if deleted else None
+
+    def delete_older_than(self, cutoff_ms):
+        return self.conn.execute("DELETE FROM sessions WHERE created_at < ?", (cutoff_ms,)).rowcount
+
+
+AUTOINCREMENT_PK_SQL = "BIGSERIAL PRIMARY KEY" if USE_POSTGRES else "INTEGER PRIMARY KEY AUTOINCREMENT"
+
+ITEMS_COLUMNS_SQL = """
                 id TEXT PRIMARY KEY,
+                store_id TEXT,
                 name TEXT NOT NULL,
                 sku TEXT NOT NULL,
                 quantity INTEGER NOT NULL,
                 location TEXT NOT NULL,
-                price REAL NOT NULL,
+                price_cents INTEGER NOT NULL,
                 threshold INTEGER NOT NULL,
                 description TEXT,
                 image_url TEXT,
                 status TEXT,
-                cost_unit REAL DEFAULT 0,
-                updated_at TEXT NOT NULL
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS sales (
+                cost_unit_cents INTEGER NOT NULL DEFAULT 0,
+                updated_at BIGINT NOT NULL
+"""
+
+# cost_unit_cents es el costo del item al momento de la venta; gain_cents queda
+# calculado y guardado para que los reportes sean sumas enteras sin JOIN
+SALES_COLUMNS_SQL = """
                 id TEXT PRIMARY KEY,
+                store_id TEXT,
                 item_id TEXT NOT NULL,
                 quantity INTEGER NOT NULL,
-                price REAL NOT NULL,
-                total REAL NOT NULL,
+                price_cents INTEGER NOT NULL,
+                total_cents INTEGER NOT NULL,
+                cost_unit_cents INTEGER NOT NULL DEFAULT 0,
+                gain_cents INTEGER NOT NULL DEFAULT 0,
                 payment_method TEXT NOT NULL,
-                created_at TEXT NOT NULL,
+                created_at BIGINT NOT NULL,
                 FOREIGN KEY (item_id) REFERENCES items (id)
-            )
+"""
+
+SESSIONS_COLUMNS_SQL = """
+                token TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                created_at BIGINT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+"""
+
+STOCK_MOVEMENTS_COLUMNS_SQL = f"""
+                id {AUTOINCREMENT_PK_SQL},
+                store_id TEXT,
+                item_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                delta INTEGER NOT NULL,
+                balance INTEGER,
+                ref_id TEXT,
+                created_at BIGINT NOT NULL
+"""
+
+IDEMPOTENCY_KEYS_COLUMNS_SQL = """
+                user_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                path TEXT NOT NULL,
+                request_hash TEXT NOT NULL,
+                status INTEGER,
+                body TEXT,
+                created_at BIGINT NOT NULL,
+                PRIMARY KEY (user_id, key)
+"""
+
+# Columnas de fecha guardadas como ms UTC (BIGINT); antes eran texto ISO con offset local
+TIMESTAMP_COLUMNS = (
+    ("items", "updated_at", ITEMS_COLUMNS_SQL),
+    ("sales", "created_at", SALES_COLUMNS_SQL),
+    ("sessions", "created_at", SESSIONS_COLUMNS_SQL),
+    ("stock_movements", "created_at", STOCK_MOVEMENTS_COLUMNS_SQL),
+    ("idempotency_keys", "created_at", IDEMPOTENCY_KEYS_COLUMNS_SQL),
+)
+
+
+def table_exists(cur, name):
+    if USE_POSTGRES:
+        cur.execute("SELECT 1 FROM information_schema.tables WHERE table_name = %s", (name,))
+        return cur.fetchone() is not None
+    return cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def migrate_money_to_cents_sqlite(cur):
+    """Reconstruir items/sales de REAL a centavos enteros (SQLite no borra columnas NOT NULL)"""
+    item_columns = {row[1] for row in cur.execute("PRAGMA table_info(items)").fetchall()}
+    sale_columns = {row[1] for row in cur.execute("PRAGMA table_info(sales)").fetchall()}
+    if "price_cents" in item_columns and "price_cents" in sale_columns:
+        return
+    # Todo en una transaccion: si algo falla no quedan tablas a medio copiar
+    cur.execute("BEGIN")
+    if "price_cents" not in item_columns:
+        def optional(column, fallback):
+            return column if column in item_columns else fallback
+
+        cur.execute("CREATE TABLE items_cents (" + ITEMS_COLUMNS_SQL + ")")
+        cur.execute(
+            f"""
+            INSERT INTO items_cents
+            (id, name, sku, quantity, location, price_cents, threshold, description, image_url, status,
+             cost_unit_cents, updated_at)
+            SELECT id, name, sku, quantity, location, CAST(ROUND(price * 100) AS INTEGER), threshold,
+                   {optional("description", "NULL")}, {optional("image_url", "NULL")},
+                   {optional("status", "NULL")},
+                   CAST(ROUND(COALESCE({optional("cost_unit", "0")}, 0) * 100) AS INTEGER), updated_at
+            FROM items
+            """
+        )
+        cur.execute("DROP TABLE items")
+        cur.execute("ALTER TABLE items_cents RENAME TO items")
+
+    if "price_cents" not in sale_columns:
+        # Las ventas viejas no tienen costo historico: se toma el costo actual del item
+        cur.execute("CREATE TABLE sales_cents (" + SALES_COLUMNS_SQL + ")")
+        cur.execute(
+            """
+            INSERT INTO sales_cents
+            (id, item_id, quantity, price_cents, total_cents, cost_unit_cents, gain_cents,
+             payment_method, created_at)
+            SELECT s.id, s.item_id, s.quantity,
+                   CAST(ROUND(s.price * 100) AS INTEGER),
+                   CAST(ROUND(s.total * 100) AS INTEGER),
+                   COALESCE(i.cost_unit_cents, 0),
+                   (CAST(ROUND(s.price * 100) AS INTEGER) - COALESCE(i.cost_unit_cents, 0)) * s.quantity,
+                   s.payment_method, s.created_at
+            FROM sales s
+            LEFT JOIN items i ON s.item_id = i.id
+            """
+        )
+        cur.execute("DROP TABLE sales")
+        cur.execute("ALTER TABLE sales_cents RENAME TO sales")
+
+
+def migrate_timestamps_sqlite(cur):
+    """Pasar las fechas ISO de TIMESTAMP_COLUMNS a ms UTC. La tabla se reconstruye si la columna
+    es TEXT (la afinidad TEXT volveria a guardar los enteros como texto) y luego se convierten
+    los valores que sigan siendo texto."""
+    conn = cur.connection
+    conn.create_function("to_epoch_ms", 1, to_epoch_ms, deterministic=True)
+    if not conn.in_transaction:
+        cur.execute("BEGIN")
+    fallback = now_ms()
+    for table, column, columns_sql in TIMESTAMP_COLUMNS:
+        declared = {row[1]: row[2].upper() for row in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+        if declared.get(column) == "TEXT":
+            cur.execute(f"DROP TABLE IF EXISTS {table}_ms")
+            cur.execute(f"CREATE TABLE {table}_ms ({columns_sql})")
+            new_columns = [row[1] for row in cur.execute(f"PRAGMA table_info({table}_ms)").fetchall()]
+            shared = ", ".join(name for name in new_columns if name in declared)
+            cur.execute(f"INSERT INTO {table}_ms ({shared}) SELECT {shared} FROM {table}")
+            cur.execute(f"DROP TABLE {table}")
+            cur.execute(f"ALTER TABLE {table}_ms RENAME TO {table}")
+        cur.execute(
+            f"UPDATE {table} SET {column} = COALESCE(to_epoch_ms({column}), ?) WHERE typeof({column}) = 'text'",
+            (fallback,),
+        )
+
+
+def migrate_timestamps_postgres(cur):
+    for table, column, _ in TIMESTAMP_COLUMNS:
+        cur.execute(
+            "SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+            (table, column),
+        )
+        row = cur.fetchone()
+        if row and row["data_type"] == "text":
+            cur.execute(
+                f"""
+                ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT
+                USING FLOOR(EXTRACT(EPOCH FROM {column}::timestamptz) * 1000)::BIGINT
+                """
+            )
+
+
+def migrate_money_to_cents_postgres(cur):
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'items'"
+    )
+    item_columns = {row["column_name"] for row in cur.fetchall()}
+    if "price" in item_columns:
+        cur.execute("ALTER TABLE items ADD COLUMN IF NOT EXISTS price_cents INTEGER")
+        cur.execute("ALTER TABLE items ADD COLUMN IF NOT EXISTS cost_unit_cents INTEGER NOT NULL DEFAULT 0")
+        cur.execute(
+            """
+            UPDATE items
+            SET price_cents = ROUND(price * 100),
+                cost_unit_cents = ROUND(COALESCE(cost_unit, 0) * 100)
+            """
+        )
+        cur.execute("ALTER TABLE items ALTER COLUMN price_cents SET NOT NULL")
+        cur.execute("ALTER TABLE items DROP COLUMN price")
+        cur.execute("ALTER TABLE items DROP COLUMN IF EXISTS cost_unit")
+
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'sales'"
+    )
+    sale_columns = {row["column_name"] for row in cur.fetchall()}
+    if "price" in sale_columns:
+        for column in ("price_cents", "total_cents"):
+            cur.execute(f"ALTER TABLE sales ADD COLUMN IF NOT EXISTS {column} INTEGER")
+        for column in ("cost_unit_cents", "gain_cents"):
+            cur.execute(f"ALTER TABLE sales ADD COLUMN IF NOT EXISTS {column} INTEGER NOT NULL DEFAULT 0")
+        cur.execute(
+            """
+            UPDATE sales
+            SET price_cents = ROUND(price * 100),
+                total_cents = ROUND(total * 100),
+                cost_unit_cents = COALESCE(
+                    (SELECT cost_unit_cents FROM items WHERE items.id = sales.item_id), 0
+                )
+            """
+        )
+        cur.execute("UPDATE sales SET gain_cents = (price_cents - cost_unit_cents) * quantity")
+        cur.execute("ALTER TABLE sales ALTER COLUMN price_cents SET NOT NULL")
+        cur.execute("ALTER TABLE sales ALTER COLUMN total_cents SET NOT NULL")
+        cur.execute("ALTER TABLE sales DROP COLUMN price")
+        cur.execute("ALTER TABLE sales DROP COLUMN total")
+
+
+def migrate_to_stores(cur):
+    """Agregar store_id a users/items/sales y asignar los datos existentes a la tienda principal"""
+    param = "%s" if USE_POSTGRES else "?"
+    for table in ("users", "items", "sales", "stock_movements"):
+        if USE_POSTGRES:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS store_id TEXT")
+        else:
+            columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+            if "store_id" not in columns:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN store_id TEXT")
+
+    cur.execute("SELECT COUNT(*) AS count FROM users WHERE store_id IS NULL")
+    orphan_users = cur.fetchone()["count"]
+    cur.execute("SELECT COUNT(*) AS count FROM items WHERE store_id IS NULL")
+    orphan_items = cur.fetchone()["count"]
+    cur.execute("SELECT COUNT(*) AS count FROM sales WHERE store_id IS NULL")
+    orphan_sales = cur.fetchone()["count"]
+    if orphan_users or orphan_items or orphan_sales:
+        cur.execute("SELECT id FROM stores ORDER BY created_at, id LIMIT 1")
+        row = cur.fetchone()
+        if row:
+            store_id = row["id"]
+        else:
+            store_id = str(uuid.uuid4())
+            cur.execute(
+                f"INSERT INTO stores (id, name, join_code, created_at) VALUES ({param}, {param}, {param}, {param})",
+                (store_id, os.getenv("STORE_NAME", "Mi tienda"), generate_join_code(), now_local().isoformat()),
+            )
+        for table in ("users", "items", "sales"):
+            cur.execute(f"UPDATE {table} SET store_id = {param} WHERE store_id IS NULL", (store_id,))
+    # Movimientos: la tienda del item (o la principal si el item ya no existe)
+    cur.execute(
+        """
+        UPDATE stock_movements
+        SET store_id = (SELECT items.store_id FROM items WHERE items.id = stock_movements.item_id)
+        WHERE store_id IS NULL
+        """
+    )
+    cur.execute("SELECT COUNT(*) AS count FROM stock_movements WHERE store_id IS NULL")
+    if cur.fetchone()["count"]:
+        cur.execute("SELECT id FROM stores ORDER BY created_at, id LIMIT 1")
+        row = cur.fetchone()
+        if row:
+            cur.execute(
+                f"UPDATE stock_movements SET store_id = {param} WHERE store_id IS NULL", (row["id"],)
+            )
+
+    # Indices compuestos que empiezan por store_id: cada tienda solo recorre lo suyo
+    cur.execute("DROP INDEX IF EXISTS idx_items_low_stock")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_items_store_low_stock ON items (store_id, (quantity - threshold))"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_store_updated ON items (store_id, updated_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_store_sku ON items (store_id, sku)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_store_name ON items (store_id, name)")
+    # Cubre los conteos por faceta del catalogo publico sin leer la tabla
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_items_store_catalog "
+        "ON items (store_id, quantity, status, location, price_cents)"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sales_store_created ON sales (store_id, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_store ON users (store_id)")
+
+
+def generate_join_code():
+    return secrets.token_urlsafe(6)
+
+
+def primary_store_id(conn):
+    """La tienda mas vieja: dueña de los datos previos a multi-tienda y de la tienda publica por defecto"""
+    row = conn.execute("SELECT id FROM stores ORDER BY created_at, id LIMIT 1").fetchone()
+    return row["id"] if row else None
+
+
+def storefront_store_id(conn):
+    """Tienda del catalogo publico: la de ?store=<id> (el enlace que muestran los ajustes).
+    Sin parametro, la tienda principal, para los enlaces de antes de multi-tienda.
+    None si el id no existe."""
+    store_id = request.args.get("store")
+    if not store_id:
+        return primary_store_id(conn)
+    row = conn.execute("SELECT id FROM stores WHERE id = ?", (store_id,)).fetchone()
+    return row["id"] if row else None
+
+
+def resolve_signup_store(conn, payload, username):
+    """Tienda para un usuario nuevo: la del codigo de invitacion (storeCode) o una tienda nueva"""
+    join_code = str(payload.get("storeCode") or "").strip()
+    if join_code:
+        row = conn.execute("SELECT id FROM stores WHERE join_code = ?", (join_code,)).fetchone()
+        if not row:
+            return None, "Invalid store code."
+        return row["id"], None
+    store_id = str(uuid.uuid4())
+    store_name = str(payload.get("storeName") or "").strip() or username
+    conn.execute(
+        "INSERT INTO stores (id, name, join_code, created_at) VALUES (?, ?, ?, ?)",
+        (store_id, store_name, generate_join_code(), now_local().isoformat()),
+    )
+    return store_id, None
+
+
+def init_db():
+    conn = get_db()
+    try:
+        if USE_POSTGRES:
+            cur = conn.cursor()
+        else:
+            cur = conn.cursor()
+        
+        if not USE_POSTGRES:
+            # page_size solo se puede elegir antes de crear la primera tabla
+            if cur.execute("PRAGMA page_count").fetchone()[0] == 0:
+                cur.execute(f"PRAGMA page_size = {SQLITE_PAGE_SIZE}")
+            cur.execute("PRAGMA journal_mode = WAL")
+
+        # Crear tablas base
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                username TEXT NOT NULL UNIQUE,
+                email TEXT UNIQUE,
+                password_hash TEXT NOT NULL,
+                email_verified INTEGER NOT NULL DEFAULT 1,
+                created_at TEXT NOT NULL
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS email_verifications (
+                user_id TEXT PRIMARY KEY,
+                code_hash TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                resend_available_at TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+            """ + SESSIONS_COLUMNS_SQL + """
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+            """ + ITEMS_COLUMNS_SQL + """
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sales (
+            """ + SALES_COLUMNS_SQL + """
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stores (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                join_code TEXT NOT NULL UNIQUE,
+                created_at TEXT NOT NULL
+            )
             """
         )
         cur.execute(
@@ -388,6 +1709,61 @@ def init_db():
             )
             """
         )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                name TEXT PRIMARY KEY,
+                last_run_at BIGINT NOT NULL,
+                duration_ms INTEGER NOT NULL,
+                last_error TEXT,
+                runs INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                worker TEXT
+            )
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id {AUTOINCREMENT_PK_SQL},
+                store_id TEXT NOT NULL,
+                user_id TEXT,
+                endpoint TEXT NOT NULL,
+                action TEXT NOT NULL,
+                entity_type TEXT NOT NULL,
+                entity_ids TEXT NOT NULL,
+                entity_count INTEGER NOT NULL,
+                before_data TEXT,
+                after_data TEXT,
+                created_at BIGINT NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_store ON audit_log (store_id, id)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stream_tickets (
+                ticket_hash TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                expires_at BIGINT NOT NULL
+            )
+            """
+        )
+        ledger_exists = table_exists(cur, "stock_movements")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stock_movements (
+            """ + STOCK_MOVEMENTS_COLUMNS_SQL + """
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+            """ + IDEMPOTENCY_KEYS_COLUMNS_SQL + """
+            )
+            """
+        )
         
         # Para SQLite, agregar columnas faltantes si es necesario
         if not USE_POSTGRES:
@@ -406,26 +1782,8 @@ def init_db():
             except:
                 pass
 
-            columns = {
-                row[1]
-                for row in cur.execute("PRAGMA table_info(items)").fetchall()
-            }
-            try:
-                if "description" not in columns:
-                    cur.execute("ALTER TABLE items ADD COLUMN description TEXT")
-            except: pass
-            try:
-                if "image_url" not in columns:
-                    cur.execute("ALTER TABLE items ADD COLUMN image_url TEXT")
-            except: pass
-            try:
-                if "status" not in columns:
-                    cur.execute("ALTER TABLE items ADD COLUMN status TEXT")
-            except: pass
-            try:
-                if "cost_unit" not in columns:
-                    cur.execute("ALTER TABLE items ADD COLUMN cost_unit REAL DEFAULT 0")
-            except: pass
+            migrate_money_to_cents_sqlite(cur)
+            migrate_timestamps_sqlite(cur)
         else:
             try:
                 cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS email TEXT")
@@ -435,11 +1793,34 @@ def init_db():
                 cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS email_verified INTEGER NOT NULL DEFAULT 1")
             except:
                 pass
+            migrate_money_to_cents_postgres(cur)
+            migrate_timestamps_postgres(cur)
+
+        migrate_to_stores(cur)
+
+        # Despues de las migraciones: reconstruir una tabla borra sus indices
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stock_movements_item ON stock_movements (item_id, id)"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)"
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions (created_at)")
 
         try:
             cur.execute("UPDATE users SET email_verified = 1 WHERE email_verified IS NULL")
         except:
             pass
+
+        if not ledger_exists:
+            # Primer arranque con ledger: el stock actual queda como snapshot inicial
+            cur.execute(
+                """
+                INSERT INTO stock_movements (store_id, item_id, kind, delta, balance, created_at)
+                SELECT store_id, id, 'snapshot', 0, quantity, ? FROM items
+                """,
+                (now_ms(),),
+            )
         
         conn.commit()
     except Exception as e:
@@ -461,13 +1842,13 @@ def row_to_item(row):
         "sku": row["sku"],
         "quantity": row["quantity"],
         "location": row["location"],
-        "price": row["price"],
-        "costUnit": row["cost_unit"] if "cost_unit" in row.keys() else 0,
+        "price": from_cents(row["price_cents"]),
+        "costUnit": from_cents(row["cost_unit_cents"]),
         "threshold": row["threshold"],
         "description": row["description"],
         "imageUrl": row["image_url"],
         "status": row["status"],
-        "updatedAt": row["updated_at"],
+        "updatedAt": ms_to_iso(row["updated_at"]),
     }
 
 
@@ -476,10 +1857,11 @@ def row_to_sale(row):
         "id": row["id"],
         "itemId": row["item_id"],
         "quantity": row["quantity"],
-        "price": row["price"],
-        "total": row["total"],
+        "price": from_cents(row["price_cents"]),
+        "total": from_cents(row["total_cents"]),
+        "gain": from_cents(row["gain_cents"]),
         "paymentMethod": row["payment_method"],
-        "createdAt": row["created_at"],
+        "createdAt": ms_to_iso(row["created_at"]),
     }
 
 
@@ -490,13 +1872,166 @@ def to_int(value, default=0):
         return default
 
 
-def to_float(value, default=0.0):
+def to_cents(value, default=0):
+    """Monto en dolares (numero o texto) a centavos enteros, redondeando half-up"""
     try:
-        return float(value)
-    except (TypeError, ValueError):
+        return int((Decimal(str(value)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    except (TypeError, ValueError, InvalidOperation):
         return default
 
 
+def from_cents(cents):
+    return round((cents or 0) / 100, 2)
+
+
+def format_money(amount, currency="USD"):
+    """Monto para PDF/HTML: $1,234.50 en dolares, o el codigo de la moneda delante"""
+    text = f"{amount:,.2f}"
+    return f"${text}" if currency == "USD" else f"{currency} {text}"
+
+
+def image_path(digest, width=None, ext="webp"):
+    name = f"{digest}-{width}.webp" if width else f"{digest}.{ext}"
+    return os.path.join(IMAGES_DIR, digest[:2], name)
+
+
+def find_original_image(digest):
+    for ext in IMAGE_FORMATS.values():
+        path = image_path(digest, ext=ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def local_image_digest(image_url):
+    """Hash de una imagen subida a /images/ (None si es una URL externa)"""
+    if not image_url or not image_url.startswith("/images/"):
+        return None
+    match = IMAGE_NAME_RE.match(image_url[len("/images/"):])
+    if not match or match.group("width"):
+        return None
+    return match.group("digest")
+
+
+def image_srcset(image_url):
+    """srcset con las miniaturas WebP de una imagen subida; None para URLs externas"""
+    digest = local_image_digest(image_url)
+    if not digest:
+        return None
+    return ", ".join(f"/images/{digest}-{width}.webp {width}w" for width in IMAGE_WIDTHS)
+
+
+def store_image(data):
+    """Guardar el original por su sha256 (subir lo mismo dos veces no duplica). Devuelve (digest, ext)"""
+    try:
+        with pil_image.open(BytesIO(data)) as probe:
+            image_format = probe.format
+            probe.verify()
+    except Exception:
+        return None, None
+    ext = IMAGE_FORMATS.get(image_format)
+    if not ext:
+        return None, None
+    digest = hashlib.sha256(data).hexdigest()
+    path = image_path(digest, ext=ext)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file_atomic(path, data)
+    return digest, ext
+
+
+def generate_thumbnails(digest, source_path):
+    """Crear las miniaturas WebP que falten. Sin agrandar: si el original es mas angosto que
+    el ancho pedido se guarda a su tamano (el srcset igual lista todos los anchos)."""
+    with pil_image.open(source_path) as original:
+        image = pil_image_ops.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for width in IMAGE_WIDTHS:
+            target = image_path(digest, width)
+            if os.path.exists(target):
+                continue
+            resized = image
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), pil_image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, format="WEBP", quality=IMAGE_WEBP_QUALITY)
+            write_file_atomic(target, buffer.getvalue())
+
+
+def _thumbnail_job(digest, source_path):
+    try:
+        generate_thumbnails(digest, source_path)
+    except Exception as exc:
+        print(f"Thumbnail generation failed for {digest}: {exc}")
+
+
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="thumbnails")
+
+
+# Formato columnar de las listas: (nombre en la API, columna SQL, conversion)
+ITEM_FIELDS = (
+    ("id", "id", None),
+    ("name", "name", None),
+    ("sku", "sku", None),
+    ("quantity", "quantity", None),
+    ("location", "location", None),
+    ("price", "price_cents", from_cents),
+    ("costUnit", "cost_unit_cents", from_cents),
+    ("threshold", "threshold", None),
+    ("description", "description", None),
+    ("imageUrl", "image_url", None),
+    ("status", "status", None),
+    ("updatedAt", "updated_at", ms_to_iso),
+)
+SALE_FIELDS = (
+    ("id", "id", None),
+    ("itemId", "item_id", None),
+    ("quantity", "quantity", None),
+    ("price", "price_cents", from_cents),
+    ("total", "total_cents", from_cents),
+    ("gain", "gain_cents", from_cents),
+    ("paymentMethod", "payment_method", None),
+    ("createdAt", "created_at", ms_to_iso),
+)
+STORE_ITEM_FIELDS = tuple(
+    field for field in ITEM_FIELDS if field[0] not in {"location", "costUnit", "threshold", "updatedAt"}
+) + (("imageSrcset", "image_url", image_srcset),)
+MSGPACK_MIMETYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def list_response(rows, fields, row_to_dict):
+    """Responder una lista: array de objetos (default), columnar con ?format=columnar,
+    o columnar en MessagePack si el cliente lo pide por Accept y msgpack esta instalado.
+
+    El columnar arma un array por columna directo de las filas, sin un dict por fila:
+    {"columns": [...], "count": n, "data": [[col0...], [col1...]]}
+
+    Todas las variantes llevan Vary: Accept, Accept-Encoding (tambien la JSON por defecto y
+    los 304) para que un cache no sirva el cuerpo de una a un cliente que pidio otra.
+    """
+    accepts_msgpack = msgpack is not None and any(
+        mimetype in request.accept_mimetypes.values() for mimetype in MSGPACK_MIMETYPES
+    )
+    if request.args.get("format") != "columnar" and not accepts_msgpack:
+        response = jsonify([row_to_dict(row) for row in rows])
+        response.vary.update(("Accept", "Accept-Encoding"))
+        return response
+
+    rows = list(rows)  # puede llegar un cursor (ItemsRepo/SalesRepo.stream)
+    data = []
+    for _, column, convert in fields:
+        values = [row[column] for row in rows]
+        data.append([convert(value) for value in values] if convert else values)
+    payload = {"columns": [name for name, _, _ in fields], "count": len(rows), "data": data}
+    if accepts_msgpack:
+        response = app.response_class(msgpack.packb(payload), mimetype=MSGPACK_MIMETYPES[0])
+    else:
+        response = jsonify(payload)
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+
 def parse_item(payload):
     name = str(payload.get("name", "")).strip()
     sku = str(payload.get("sku", "")).strip()
@@ -508,11 +2043,11 @@ def parse_item(payload):
         return None, "Missing name, sku, or location."
 
     item_id = str(payload.get("id") or uuid.uuid4())
-    quantity = to_int(payload.get("quantity"))
-    threshold = to_int(payload.get("threshold"))
-    price = to_float(payload.get("price"))
-    cost_unit = to_float(payload.get("costUnit"))
-    updated_at = payload.get("updatedAt") or now_local().isoformat()
+    quantity = max(to_int(payload.get("quantity")), 0)
+    threshold = max(to_int(payload.get("threshold")), 0)
+    price_cents = to_cents(payload.get("price"))
+    cost_unit_cents = to_cents(payload.get("costUnit"))
+    updated_at = ms_to_iso(to_epoch_ms(payload.get("updatedAt")) or now_ms())
 
     return (
         {
@@ -521,8 +2056,8 @@ def parse_item(payload):
             "sku": sku,
             "quantity": quantity,
             "location": location,
-            "price": price,
-            "costUnit": cost_unit,
+            "price": from_cents(price_cents),
+            "costUnit": from_cents(cost_unit_cents),
             "threshold": threshold,
             "description": description,
             "imageUrl": image_url,
@@ -541,12 +2076,376 @@ def get_week_range():
     return start, end
 
 
+def record_stock_movements(conn, movements):
+    """Agregar movimientos (item_id, kind, delta, ref_id) al ledger y tomar snapshots si toca.
+
+    Se llama dentro de la misma write_transaction() que cambia items.quantity.
+    """
+    movements = [m for m in movements if m[2]]
+    if not movements:
+        return
+    created_at = now_ms()
+    conn.executemany(
+        """
+        INSERT INTO stock_movements (store_id, item_id, kind, delta, ref_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (g.store_id, item_id, kind, delta, ref_id, created_at)
+            for item_id, kind, delta, ref_id in movements
+        ],
+    )
+    item_ids = sorted({m[0] for m in movements})
+    if len(item_ids) <= 100:
+        for item_id in item_ids:
+            snapshot_stock_if_due(conn, item_id, created_at)
+    else:
+        compact_stock_ledger(conn)
+
+
+def snapshot_stock_if_due(conn, item_id, created_at):
+    last_snapshot = conn.execute(
+        "SELECT MAX(id) AS id FROM stock_movements WHERE item_id = ? AND kind = 'snapshot'",
+        (item_id,),
+    ).fetchone()
+    tail = conn.execute(
+        "SELECT COUNT(*) AS count FROM stock_movements WHERE item_id = ? AND id > ?",
+        (item_id, last_snapshot["id"] or 0),
+    ).fetchone()
+    if tail["count"] < STOCK_SNAPSHOT_EVERY:
+        return
+    conn.execute(
+        """
+        INSERT INTO stock_movements (store_id, item_id, kind, delta, balance, created_at)
+        SELECT store_id, id, 'snapshot', 0, quantity, ? FROM items WHERE id = ?
+        """,
+        (created_at, item_id),
+    )
+
+
+def compact_stock_ledger(conn):
+    """Snapshot para cada item con STOCK_SNAPSHOT_EVERY o mas movimientos desde el ultimo"""
+    conn.execute(
+        """
+        INSERT INTO stock_movements (store_id, item_id, kind, delta, balance, created_at)
+        SELECT i.store_id, i.id, 'snapshot', 0, i.quantity, ?
+        FROM items i
+        WHERE (
+            SELECT COUNT(*) FROM stock_movements m
+            WHERE m.item_id = i.id
+              AND m.id > COALESCE(
+                  (SELECT MAX(s.id) FROM stock_movements s WHERE s.item_id = i.id AND s.kind = 'snapshot'), 0
+              )
+        ) >= ?
+        """,
+        (now_ms(), STOCK_SNAPSHOT_EVERY),
+    )
+
+
+def stock_at(conn, item_id, at_ms):
+    """Stock de un item en una fecha: ultimo snapshot <= fecha + suma de deltas posteriores"""
+    snapshot = conn.execute(
+        """
+        SELECT id, balance FROM stock_movements
+        WHERE item_id = ? AND kind = 'snapshot' AND created_at <= ?
+        ORDER BY id DESC LIMIT 1
+        """,
+        (item_id, at_ms),
+    ).fetchone()
+    base_id = snapshot["id"] if snapshot else 0
+    base = snapshot["balance"] if snapshot else 0
+    tail = conn.execute(
+        """
+        SELECT COALESCE(SUM(delta), 0) AS delta FROM stock_movements
+        WHERE item_id = ? AND id > ? AND created_at <= ? AND kind != 'snapshot'
+        """,
+        (item_id, base_id, at_ms),
+    ).fetchone()
+    return base + tail["delta"]
+
+
+def low_stock_ids(conn, item_ids=None):
+    """Ids con quantity <= threshold (todos via indice, o solo los item_ids dados)"""
+    if item_ids is None:
+        rows = conn.execute(
+            "SELECT id FROM items WHERE store_id = ? AND quantity - threshold <= 0", (g.store_id,)
+        ).fetchall()
+    else:
+        item_ids = list(item_ids)
+        rows = []
+        # Una consulta por tanda de 500 ids (como foreign_ids), no una por item
+        for start in range(0, len(item_ids), 500):
+            chunk = item_ids[start:start + 500]
+            rows += conn.execute(
+                f"""
+                SELECT id FROM items
+                WHERE store_id = ? AND id IN ({', '.join('?' for _ in chunk)}) AND quantity - threshold <= 0
+                """,
+                [g.store_id, *chunk],
+            ).fetchall()
+    return {row["id"] for row in rows}
+
+
+def track_low_stock_crossings(conn, before_ids, item_ids=None):
+    """Comparar el set de stock bajo antes/despues de un cambio y encolar las alertas.
+
+    Las alertas salen en after_request (SSE y webhook), cuando la transaccion ya hizo commit.
+    """
+    after_ids = low_stock_ids(conn, item_ids)
+    crossed_low = after_ids - before_ids
+    recovered = before_ids - after_ids
+    if not crossed_low and not recovered:
+        return
+    changed = sorted(crossed_low | recovered)
+    rows = {}
+    for start in range(0, len(changed), 500):
+        chunk = changed[start:start + 500]
+        for row in conn.execute(
+            f"SELECT * FROM items WHERE store_id = ? AND id IN ({', '.join('?' for _ in chunk)})",
+            [g.store_id, *chunk],
+        ).fetchall():
+            rows[row["id"]] = row
+    for item_id in changed:
+        if item_id in rows:
+            queue_event(
+                "low-stock" if item_id in crossed_low else "stock-recovered",
+                row_to_item(rows[item_id]),
+            )
+
+
+_webhook_queue = queue.Queue(maxsize=1000)
+_webhook_thread = None
+_webhook_thread_lock = threading.Lock()
+
+
+def _webhook_worker():
+    while True:
+        url, alert = _webhook_queue.get()
+        try:
+            body = json.dumps(alert).encode("utf-8")
+            req = urllib.request.Request(
+                url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(req, timeout=5):
+                pass
+        except Exception as e:
+            print(f"Error sending low stock webhook: {e}")
+
+
+LOW_STOCK_EVENT_TYPES = {"low-stock", "stock-recovered"}
+
+
+def queue_event(event_type, data):
+    """Encolar un evento de la request actual; se publica en after_request si la respuesta es OK"""
+    g.setdefault("pending_events", []).append((event_type, data))
+
+
+def queue_item_event(conn, item_id):
+    row = conn.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+    if row:
+        queue_event("item", row_to_item(row))
+
+
+def audit_diff(before, after):
+    """Solo los campos que cambiaron: ({campo: antes}, {campo: despues})"""
+    if not before or not after:
+        return before, after
+    changed = [key for key in sorted(set(before) | set(after)) if before.get(key) != after.get(key)]
+    return {key: before.get(key) for key in changed}, {key: after.get(key) for key in changed}
+
+
+def queue_audit(action, entity_type, entity_ids, before=None, after=None, diff=True):
+    """Registrar una mutacion de la request; entra al AUDIT en after_request si la respuesta es OK.
+    Con diff=False before/after se guardan completos (resumenes de operaciones masivas)."""
+    if diff:
+        before, after = audit_diff(before, after)
+    g.setdefault("pending_audit", []).append((action, entity_type, list(entity_ids), before, after))
+
+
+class AuditLog:
+    """Audit log con buffer circular en memoria: la request solo agrega al deque y un hilo de
+    fondo escribe en audit_log por tandas. Si la BD no da abasto se descartan las entradas
+    mas viejas del buffer (quedan contadas en dropped)."""
+
+    def __init__(self, capacity, batch_size, flush_seconds):
+        self.buffer = deque(maxlen=capacity)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self.written = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+
+    def append(self, entries):
+        with self.condition:
+            self.dropped += max(0, len(self.buffer) + len(entries) - self.buffer.maxlen)
+            self.buffer.extend(entries)
+            if len(self.buffer) >= self.batch_size:
+                self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="audit-writer", daemon=True)
+                self.thread.start()
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                self.condition.wait(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing audit log: {e}")
+
+    def flush(self):
+        """Escribir lo pendiente; una tanda por transaccion"""
+        with self.flush_lock:
+            while True:
+                with self.condition:
+                    batch = [self.buffer.popleft() for _ in range(min(self.batch_size, len(self.buffer)))]
+                if not batch:
+                    return
+                try:
+                    with write_transaction() as conn:
+                        conn.executemany(
+                            """
+                            INSERT INTO audit_log
+                            (store_id, user_id, endpoint, action, entity_type, entity_ids, entity_count,
+                             before_data, after_data, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """,
+                            batch,
+                        )
+                except Exception:
+                    # Devolver la tanda al buffer para el proximo intento
+                    with self.condition:
+                        self.buffer.extendleft(reversed(batch))
+                    raise
+                self.written += len(batch)
+
+
+AUDIT = AuditLog(AUDIT_BUFFER_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_SECONDS)
+
+
+def flush_audit_at_exit():
+    try:
+        AUDIT.flush()
+    except Exception as e:
+        print(f"Error writing audit log at exit: {e}")
+
+
+atexit.register(flush_audit_at_exit)
+
+
+def row_to_audit(row):
+    return {
+        "id": row["id"],
+        "userId": row["user_id"],
+        "username": row["username"],
+        "endpoint": row["endpoint"],
+        "action": row["action"],
+        "entityType": row["entity_type"],
+        "entityIds": json.loads(row["entity_ids"]),
+        "entityCount": row["entity_count"],
+        "before": json.loads(row["before_data"]) if row["before_data"] else None,
+        "after": json.loads(row["after_data"]) if row["after_data"] else None,
+        "createdAt": ms_to_iso(row["created_at"]),
+    }
+
+
+class EventBroker:
+    """Pub/sub en memoria para /api/events: un Queue por suscriptor y un historial corto
+    para reanudar con Last-Event-ID. Cada suscriptor solo recibe los eventos de su tienda.
+    Solo cubre el proceso actual."""
+
+    def __init__(self, backlog_size, subscriber_queue_size=256):
+        self.stream_id = secrets.token_hex(4)
+        self.backlog = deque(maxlen=backlog_size)
+        self.subscriber_queue_size = subscriber_queue_size
+        self.subscribers = {}
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def publish(self, store_id, event_type, data):
+        with self.lock:
+            self.sequence += 1
+            event = (f"{self.stream_id}-{self.sequence}", event_type, json.dumps(data))
+            self.backlog.append((self.sequence, store_id, event))
+            subscribers = [sub for sub, sub_store in self.subscribers.items() if sub_store == store_id]
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Cliente demasiado lento: se descarta lo pendiente y se le pide recargar todo
+                self.unsubscribe(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+
+    def subscribe(self, store_id, last_event_id=None):
+        """Devuelve (queue, eventos pendientes). Si el id ya no esta en memoria (u otro proceso
+        o reinicio) el unico pendiente es un evento reset: el cliente recarga las listas."""
+        subscriber = queue.Queue(maxsize=self.subscriber_queue_size)
+        with self.lock:
+            missed = []
+            if last_event_id:
+                stream_id, _, raw_sequence = last_event_id.partition("-")
+                sequence = to_int(raw_sequence, -1)
+                oldest = self.backlog[0][0] if self.backlog else self.sequence + 1
+                if stream_id != self.stream_id or sequence < oldest - 1 or sequence > self.sequence:
+                    missed = [(f"{self.stream_id}-{self.sequence}", "reset", "{}")]
+                else:
+                    missed = [
+                        event
+                        for seq, event_store, event in self.backlog
+                        if seq > sequence and event_store == store_id
+                    ]
+            self.subscribers[subscriber] = store_id
+        return subscriber, missed
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.pop(subscriber, None)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+
+EVENTS = EventBroker(EVENT_BACKLOG_SIZE)
+
+
+def dispatch_low_stock_alerts(alerts):
+    """Enviar alertas a LOW_STOCK_WEBHOOK_URL en un hilo aparte (nunca bloquea la request)"""
+    global _webhook_thread
+    url = (os.getenv("LOW_STOCK_WEBHOOK_URL") or "").strip()
+    if not url or not alerts:
+        return
+    with _webhook_thread_lock:
+        if _webhook_thread is None:
+            _webhook_thread = threading.Thread(target=_webhook_worker, name="low-stock-webhook", daemon=True)
+            _webhook_thread.start()
+    for alert in alerts:
+        try:
+            _webhook_queue.put_nowait((url, alert))
+        except queue.Full:
+            print("Low stock webhook queue full, dropping alert")
+
+
+def row_to_movement(row):
+    return {
+        "id": row["id"],
+        "itemId": row["item_id"],
+        "kind": row["kind"],
+        "delta": row["delta"],
+        "balance": row["balance"],
+        "refId": row["ref_id"],
+        "createdAt": ms_to_iso(row["created_at"]),
+    }
+
+
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        # Limpiar sesiones expiradas
-        cleanup_expired_sessions()
-        
         token = request.headers.get("Authorization")
         if not token:
             return jsonify({"error": "Unauthorized"}), 401
@@ -555,61 +2454,860 @@ def require_auth(f):
             token = token[7:]
 
         with get_db() as conn:
-            session = conn.execute(
-                "SELECT user_id FROM sessions WHERE token = ?", (token,)
-            ).fetchone()
+            session = SessionsRepo(conn).lookup(token)
 
-        if not session:
+        if not session or not session["store_id"]:
             return jsonify({"error": "Invalid token"}), 401
 
+        # Usuario y tienda de la sesion: todos los handlers filtran por g.store_id
+        g.user_id = session["user_id"]
+        g.store_id = session["store_id"]
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+def require_operator(f):
+    """Rutas del operador del servidor (backup de toda la BD, tareas de mantenimiento): piden
+    Authorization: Bearer <OPERATOR_TOKEN>, no una sesion de tienda. Sin OPERATOR_TOKEN quedan
+    deshabilitadas."""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        operator_token = (os.getenv("OPERATOR_TOKEN") or "").strip()
+        if not operator_token:
+            return jsonify({"error": "Operator endpoints are disabled (OPERATOR_TOKEN is not set)."}), 403
+        token = request.headers.get("Authorization", "").replace("Bearer ", "")
+        if not secrets.compare_digest(token, operator_token):
+            return jsonify({"error": "Unauthorized"}), 401
         return f(*args, **kwargs)
 
     return decorated
 
 
-def cleanup_expired_sessions():
-    """Limpiar sesiones más antiguas de 7 días"""
+def cleanup_expired_sessions(conn):
+    """Borrar sesiones vencidas, tickets de stream sin usar y claves de idempotencia viejas"""
+    SessionsRepo(conn).delete_older_than(now_ms() - SESSION_TTL_MS)
+    conn.execute("DELETE FROM stream_tickets WHERE expires_at < ?", (now_ms(),))
+    conn.execute(
+        "DELETE FROM idempotency_keys WHERE created_at < ?", (now_ms() - IDEMPOTENCY_TTL_SECONDS * 1000,)
+    )
+
+
+def purge_old_audit_entries(conn):
+    conn.execute(
+        "DELETE FROM audit_log WHERE created_at < ?", (now_ms() - AUDIT_RETENTION_DAYS * 24 * 3600 * 1000,)
+    )
+
+
+def checkpoint_wal(conn):
+    # PASSIVE no espera a los lectores: copia lo que pueda del WAL a la BD
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    wal_path = DB_PATH + "-wal"
+    if os.path.exists(wal_path) and os.path.getsize(wal_path) > SQLITE_WAL_TRUNCATE_BYTES:
+        # Lectores largos no dejaron reiniciar el WAL: TRUNCATE esperando poco (tenemos write_lock)
+        conn.execute("PRAGMA busy_timeout = 2000")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+
+
+def analyze_database(conn):
+    if not USE_POSTGRES:
+        # Limita las filas que mira ANALYZE por indice: estadisticas suficientes sin recorrer todo
+        conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("ANALYZE")
+
+
+def vacuum_if_fragmented(conn):
+    """VACUUM solo si mas de VACUUM_FREE_RATIO de las paginas estan libres (reescribe la BD)"""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if page_count and free_pages / page_count >= VACUUM_FREE_RATIO:
+        conn.execute("VACUUM")
+
+
+def rotate_backups():
+    """Copia de la BD con la API de backup de SQLite; quedan las BACKUP_KEEP mas nuevas"""
+    os.makedirs(BACKUPS_DIR, exist_ok=True)
+    target = os.path.join(BACKUPS_DIR, f"inventory-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.db")
+    source = sqlite3.connect(DB_READONLY_URI, uri=True, timeout=30)
     try:
-        with get_db() as conn:
-            cutoff = (now_local() - timedelta(days=7)).isoformat()
+        destination = sqlite3.connect(target + ".tmp")
+        try:
+            source.backup(destination)
+        finally:
+            destination.close()
+    finally:
+        source.close()
+    os.replace(target + ".tmp", target)
+    backups = sorted(name for name in os.listdir(BACKUPS_DIR) if name.endswith(".db"))
+    for name in backups[:-BACKUP_KEEP]:
+        os.remove(os.path.join(BACKUPS_DIR, name))
+
+
+def in_write_transaction(job):
+    def run():
+        with write_transaction() as conn:
+            job(conn)
+
+    return run
+
+
+def on_connection(job):
+    # VACUUM y los PRAGMA de checkpoint no pueden ir dentro de una transaccion
+    def run():
+        with write_lock():
+            conn = get_db()
+            try:
+                job(conn)
+                conn.commit()
+            finally:
+                conn.close()
+
+    return run
+
+
+class Scheduler:
+    """Tareas de mantenimiento periodicas en un hilo de fondo, fuera del camino de las requests.
+
+    Con varios workers solo las corre el lider: el que tiene el flock de SCHEDULER_LOCK_PATH
+    (o el advisory lock en Postgres). Si el lider muere el lock se libera y otro lo toma en la
+    siguiente vuelta. El resultado de cada corrida queda en la tabla scheduled_jobs.
+    """
+
+    def __init__(self, tick_seconds):
+        self.tick_seconds = tick_seconds
+        self.jobs = {}
+        self.last_runs = None
+        self.leader = False
+        self.lock_handle = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def register(self, name, interval_seconds, func):
+        self.jobs[name] = (interval_seconds, func)
+
+    def start(self):
+        if self.thread is not None or not SCHEDULER_ENABLED:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+                self.thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                if self._acquire_leadership():
+                    self.run_due()
+            except Exception as e:
+                print(f"Scheduler error: {e}")
+            time.sleep(self.tick_seconds)
+
+    def _acquire_leadership(self):
+        if self.leader:
+            return True
+        if USE_POSTGRES:
+            # Advisory lock de sesion: dura lo que la conexion dedicada
+            conn = psycopg2.connect(DATABASE_URL)
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (SCHEDULER_ADVISORY_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                conn.close()
+                return False
+            self.lock_handle = conn
+        elif fcntl is not None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            lock_file = open(SCHEDULER_LOCK_PATH, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self.lock_handle = lock_file
+        self.leader = True
+        print(f"Scheduler leader: pid {os.getpid()}")
+        return True
+
+    def run_due(self):
+        if self.last_runs is None:
+            # Nuevo lider: sigue el calendario del anterior en vez de correr todo de una
+            with get_db(readonly=True) as conn:
+                rows = conn.execute("SELECT name, last_run_at FROM scheduled_jobs").fetchall()
+            self.last_runs = {row["name"]: row["last_run_at"] for row in rows}
+        for name, (interval_seconds, func) in self.jobs.items():
+            last_run = self.last_runs.get(name)
+            if last_run is None or now_ms() - last_run >= interval_seconds * 1000:
+                self.run(name)
+
+    def run(self, name):
+        _, func = self.jobs[name]
+        started_at = now_ms()
+        started = time.perf_counter()
+        error = None
+        try:
+            func()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Scheduled job {name} failed: {error}")
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        self.last_runs[name] = started_at
+        with write_transaction() as conn:
             conn.execute(
-                "DELETE FROM sessions WHERE created_at < ?", (cutoff,)
+                """
+                INSERT INTO scheduled_jobs (name, last_run_at, duration_ms, last_error, runs, failures, worker)
+                VALUES (?, ?, ?, ?, 1, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    last_run_at = excluded.last_run_at,
+                    duration_ms = excluded.duration_ms,
+                    last_error = excluded.last_error,
+                    runs = scheduled_jobs.runs + 1,
+                    failures = scheduled_jobs.failures + excluded.failures,
+                    worker = excluded.worker
+                """,
+                (name, started_at, duration_ms, error, 1 if error else 0, f"{socket.gethostname()}:{os.getpid()}"),
             )
-            conn.commit()
-    except Exception as e:
-        print(f"Error cleaning up sessions: {e}")
+
+    def status(self, conn):
+        rows = {row["name"]: row for row in conn.execute("SELECT * FROM scheduled_jobs").fetchall()}
+        jobs = []
+        for name, (interval_seconds, _) in self.jobs.items():
+            row = rows.get(name)
+            jobs.append(
+                {
+                    "name": name,
+                    "intervalSeconds": interval_seconds,
+                    "lastRunAt": ms_to_iso(row["last_run_at"]) if row else None,
+                    "durationMs": row["duration_ms"] if row else None,
+                    "lastError": row["last_error"] if row else None,
+                    "runs": row["runs"] if row else 0,
+                    "failures": row["failures"] if row else 0,
+                    "worker": row["worker"] if row else None,
+                }
+            )
+        return jobs
+
+
+SCHEDULER = Scheduler(SCHEDULER_TICK_SECONDS)
+SCHEDULER.register("session-cleanup", SESSION_CLEANUP_INTERVAL_SECONDS, in_write_transaction(cleanup_expired_sessions))
+SCHEDULER.register("ledger-compaction", LEDGER_COMPACTION_INTERVAL_SECONDS, in_write_transaction(compact_stock_ledger))
+SCHEDULER.register("audit-retention", 24 * 3600, in_write_transaction(purge_old_audit_entries))
+SCHEDULER.register("analyze", ANALYZE_INTERVAL_SECONDS, on_connection(analyze_database))
+if not USE_POSTGRES:
+    # En Postgres el autovacuum, los checkpoints y los backups son del servidor
+    SCHEDULER.register("wal-checkpoint", WAL_CHECKPOINT_INTERVAL_SECONDS, on_connection(checkpoint_wal))
+    SCHEDULER.register("vacuum", VACUUM_INTERVAL_SECONDS, on_connection(vacuum_if_fragmented))
+    SCHEDULER.register("backup-rotation", BACKUP_INTERVAL_SECONDS, rotate_backups)
+
+
+class IdempotencyCache:
+    """LRU en memoria delante de la tabla idempotency_keys (solo respuestas terminadas)"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry["stored_at"] > IDEMPOTENCY_TTL_SECONDS:
+                del self.entries[cache_key]
+                return None
+            self.entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, request_hash, status, body):
+        with self.lock:
+            self.entries[cache_key] = {
+                "request_hash": request_hash,
+                "status": status,
+                "body": body,
+                "stored_at": time.monotonic(),
+            }
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+IDEMPOTENCY_CACHE = IdempotencyCache(IDEMPOTENCY_CACHE_SIZE)
+
+
+def replay_response(status, body):
+    response = app.response_class(body, status=status, mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(f):
+    """Respetar el header Idempotency-Key: la primera respuesta (no 5xx) se guarda por
+    IDEMPOTENCY_TTL_SECONDS y los reintentos con la misma clave la reciben sin ejecutar nada.
+    Va debajo de @require_auth (las claves son por usuario).
+
+    La clave se reserva, el handler corre y la respuesta se guarda en una sola transaccion
+    (el write_transaction() del handler reutiliza esta): si el proceso muere a mitad, el
+    rollback se lleva la reserva junto con las escrituras. Una reserva sin respuesta con mas
+    de IDEMPOTENCY_LEASE_SECONDS se considera abandonada y se vuelve a ejecutar.
+    """
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key", "").strip()
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({"error": "Idempotency-Key too long."}), 400
+
+        cache_key = (g.user_id, key)
+        request_hash = hashlib.sha256(
+            f"{request.method} {request.path}\n".encode("utf-8") + request.get_data()
+        ).hexdigest()
+
+        cached = IDEMPOTENCY_CACHE.get(cache_key)
+        if cached:
+            if cached["request_hash"] != request_hash:
+                return jsonify({"error": "Idempotency-Key reused with a different request."}), 422
+            return replay_response(cached["status"], cached["body"])
+
+        with write_transaction() as conn:
+            # En Postgres el INSERT espera si otra transaccion tiene la misma clave sin commit
+            reserved = conn.execute(
+                """
+                INSERT INTO idempotency_keys (user_id, key, path, request_hash, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, key) DO NOTHING
+                """,
+                (g.user_id, key, request.path, request_hash, now_ms()),
+            ).rowcount
+            if not reserved:
+                row = conn.execute(
+                    "SELECT * FROM idempotency_keys WHERE user_id = ? AND key = ?", (g.user_id, key)
+                ).fetchone()
+                expired = row["created_at"] < now_ms() - IDEMPOTENCY_TTL_SECONDS * 1000
+                abandoned = row["status"] is None and row["created_at"] < now_ms() - IDEMPOTENCY_LEASE_SECONDS * 1000
+                if not expired and not abandoned:
+                    if row["request_hash"] != request_hash:
+                        return jsonify({"error": "Idempotency-Key reused with a different request."}), 422
+                    if row["status"] is None:
+                        return jsonify({"error": "A request with this Idempotency-Key is in progress."}), 409
+                    IDEMPOTENCY_CACHE.put(cache_key, request_hash, row["status"], row["body"])
+                    return replay_response(row["status"], row["body"])
+                conn.execute(
+                    """
+                    UPDATE idempotency_keys SET path = ?, request_hash = ?, status = NULL, body = NULL, created_at = ?
+                    WHERE user_id = ? AND key = ?
+                    """,
+                    (request.path, request_hash, now_ms(), g.user_id, key),
+                )
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code >= 500:
+                # Error del servidor: liberar la clave para que el reintento se ejecute
+                conn.execute("DELETE FROM idempotency_keys WHERE user_id = ? AND key = ?", (g.user_id, key))
+                return response
+            body = response.get_data(as_text=True)
+            conn.execute(
+                "UPDATE idempotency_keys SET status = ?, body = ? WHERE user_id = ? AND key = ?",
+                (response.status_code, body, g.user_id, key),
+            )
+        IDEMPOTENCY_CACHE.put(cache_key, request_hash, response.status_code, body)
+        return response
+
+    return decorated
+
+
+def write_file_atomic(path, data):
+    # pid + hilo: el pool de miniaturas y una request pueden escribir el mismo archivo a la vez
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_precompressed(path, data):
+    """Guardar el archivo junto a sus variantes .gz/.br y devolverlas por encoding"""
+    variants = {}
+    if not os.path.isfile(path):
+        write_file_atomic(path, data)
+    gz_path = path + ".gz"
+    if not os.path.isfile(gz_path):
+        write_file_atomic(gz_path, gzip.compress(data, compresslevel=9, mtime=0))
+    variants["gzip"] = gz_path
+    if brotli is not None:
+        br_path = path + ".br"
+        if not os.path.isfile(br_path):
+            write_file_atomic(br_path, brotli.compress(data))
+        variants["br"] = br_path
+    return variants
+
+
+def rewrite_asset_urls(html):
+    """Cambiar href/src de css/js por su version con hash en /assets/"""
+
+    def replace(match):
+        hashed = ASSET_MANIFEST.get(match.group("name"))
+        if not hashed:
+            return match.group(0)
+        return f'{match.group("attr")}="/assets/{hashed}"'
+
+    return re.sub(r'(?P<attr>href|src)="/?(?P<name>[^"?#/]+)(?:\?[^"]*)?"', replace, html)
+
+
+def render_service_worker(source):
+    """Generar CACHE_NAME y urlsToCache del service worker desde el manifest"""
+    manifest_hash = hashlib.sha256(
+        json.dumps(ASSET_MANIFEST, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:10]
+    urls = APP_SHELL_URLS + [f"/assets/{name}" for name in sorted(ASSET_MANIFEST.values())]
+    source = re.sub(
+        r"const CACHE_NAME = '[^']*';",
+        f"const CACHE_NAME = 'plus-control-{manifest_hash}';",
+        source,
+        count=1,
+    )
+    return re.sub(
+        r"const urlsToCache = \[[^\]]*\];",
+        "const urlsToCache = " + json.dumps(urls, indent=2) + ";",
+        source,
+        count=1,
+    )
+
+
+def build_static_assets():
+    """Fingerprint + precompresion de css/js y render de HTML con las URLs nuevas.
+
+    Los archivos con hash quedan en back/static_build y se sirven como immutable;
+    el HTML y el service worker se guardan en memoria con su ETag.
+    """
+    ASSET_MANIFEST.clear()
+    ASSET_VARIANTS.clear()
+    RENDERED_FILES.clear()
+    FRONT_FILES.clear()
+    FRONT_FILES.update(
+        name for name in os.listdir(FRONT_DIR) if os.path.isfile(os.path.join(FRONT_DIR, name))
+    )
+
+    try:
+        os.makedirs(STATIC_BUILD_DIR, exist_ok=True)
+        for name in sorted(FRONT_FILES):
+            if not name.endswith(FINGERPRINT_EXTENSIONS) or name in UNHASHED_ASSETS:
+                continue
+            with open(os.path.join(FRONT_DIR, name), "rb") as fh:
+                data = fh.read()
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+            ASSET_VARIANTS[hashed] = write_precompressed(os.path.join(STATIC_BUILD_DIR, hashed), data)
+            ASSET_MANIFEST[name] = hashed
+        write_file_atomic(
+            os.path.join(STATIC_BUILD_DIR, "asset-manifest.json"),
+            json.dumps(ASSET_MANIFEST, indent=2, sort_keys=True).encode("utf-8"),
+        )
+    except OSError as e:
+        print(f"Error building static assets: {e}")
+        ASSET_MANIFEST.clear()
+        ASSET_VARIANTS.clear()
+
+    for name in RENDERED_PAGES:
+        if name not in FRONT_FILES:
+            continue
+        with open(os.path.join(FRONT_DIR, name), encoding="utf-8") as fh:
+            source = fh.read()
+        if name == "service-worker.js":
+            body = render_service_worker(source)
+        else:
+            body = rewrite_asset_urls(source)
+        body = body.encode("utf-8")
+        RENDERED_FILES[name] = (body, hashlib.sha256(body).hexdigest()[:16])
+    return ASSET_MANIFEST
+
+
+def send_rendered(name):
+    body, etag = RENDERED_FILES[name]
+    response = app.response_class(body, mimetype=mimetypes.guess_type(name)[0])
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+class StorefrontSnapshots:
+    """HTML de tienda.html con la primera pagina del catalogo ya armada, uno por tienda"""
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.pages = {}
+
+    def get(self, store_id):
+        with self.lock:
+            entry = self.pages.get(store_id)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[1]
+        return None
+
+    def put(self, store_id, page):
+        with self.lock:
+            self.pages[store_id] = (time.monotonic(), page)
+
+    def invalidate(self, store_id):
+        with self.lock:
+            self.pages.pop(store_id, None)
+
+
+STOREFRONT_SNAPSHOTS = StorefrontSnapshots(STOREFRONT_SNAPSHOT_TTL_SECONDS)
+
+
+def render_store_card(item, currency):
+    """Misma tarjeta que buildCard() en store.js; el boton lo activa el JS al hidratar"""
+    name = html.escape(item["name"] or "")
+    image = ""
+    if item["imageUrl"]:
+        srcset = ""
+        if item["imageSrcset"]:
+            srcset = f' srcset="{html.escape(item["imageSrcset"])}" sizes="(max-width: 520px) 100vw, 280px"'
+        image = (
+            f'<img src="{html.escape(item["imageUrl"])}"{srcset} alt="{name}" loading="lazy" decoding="async" />'
+        )
+    description = (item["description"] or "")[:80]
+    low_stock = item["quantity"] <= 3
+    return (
+        '<article class="store-card">'
+        f'<div class="store-card-media">{image}</div>'
+        f"<h4>{name}</h4>"
+        + (f'<p class="store-card-desc">{html.escape(description)}</p>' if description else "")
+        + f'<div class="store-card-price">{html.escape(format_money(item["price"], currency))}</div>'
+        '<div class="store-card-meta">'
+        f'<span>{html.escape(item["status"] or "Nuevo")}</span>'
+        f'<span class="store-tag-pill{" low" if low_stock else ""}">'
+        f'{"Quedan pocos" if low_stock else "Disponible"}</span>'
+        "</div>"
+        '<button class="store-action" disabled aria-disabled="true">Agregar al carrito</button>'
+        "</article>"
+    )
+
+
+def render_storefront(template, catalog):
+    """Pegar la primera pagina en el HTML y dejarla como JSON para que store.js no la vuelva a pedir"""
+    total = catalog["total"]
+    store = catalog["store"]
+    cards = "".join(render_store_card(item, store["currency"]) for item in catalog["items"])
+    if not cards:
+        cards = "<div class='store-empty'>No hay productos disponibles.</div>"
+    initial = json.dumps(catalog, separators=(",", ":")).replace("<", "\\u003c")
+    body = template.replace(
+        "<h1>Tienda</h1>", f"<h1>{html.escape(store['name'] or 'Tienda')}</h1>"
+    ).replace(
+        '<div id="storeGrid" class="store-grid"></div>',
+        f'<div id="storeGrid" class="store-grid">{cards}</div>',
+    ).replace(
+        '<div id="storeCount" class="store-count">0 productos</div>',
+        f'<div id="storeCount" class="store-count">{total} producto{"" if total == 1 else "s"}</div>',
+    ).replace(
+        "</body>",
+        f'<script id="storeInitial" type="application/json">{initial}</script>\n  </body>',
+    )
+    return body.encode("utf-8")
+
+
+def send_storefront():
+    with get_db(readonly=True) as conn:
+        store_id = storefront_store_id(conn)
+        if store_id is None:
+            return app.response_class("Store not found.", status=404, mimetype="text/plain")
+        body = STOREFRONT_SNAPSHOTS.get(store_id)
+        if body is None:
+            catalog = query_catalog(conn, store_id, [], 1, STORE_PAGE_SIZE)
+            if "tienda.html" in RENDERED_FILES:
+                template = RENDERED_FILES["tienda.html"][0].decode("utf-8")
+            else:
+                with open(os.path.join(FRONT_DIR, "tienda.html"), encoding="utf-8") as handle:
+                    template = handle.read()
+            body = render_storefront(template, catalog)
+            STOREFRONT_SNAPSHOTS.put(store_id, body)
+
+    response = app.response_class(body, mimetype="text/html")
+    response.set_etag(hashlib.sha256(body).hexdigest()[:16])
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 
 @app.route("/")
 def index():
+    if "index.html" in RENDERED_FILES:
+        return send_rendered("index.html")
     response = send_from_directory(FRONT_DIR, "index.html")
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route("/assets/<path:filename>")
+def hashed_assets(filename):
+    variants = ASSET_VARIANTS.get(filename)
+    if variants is None:
+        return jsonify({"error": "Not found"}), 404
+
+    encoding = None
+    path = os.path.join(STATIC_BUILD_DIR, filename)
+    for candidate in ("br", "gzip"):
+        if candidate in variants and candidate in request.accept_encodings:
+            encoding = candidate
+            path = variants[candidate]
+            break
+
+    response = send_file(
+        path,
+        mimetype=mimetypes.guess_type(filename)[0],
+        max_age=ASSET_MAX_AGE_SECONDS,
+        conditional=True,
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE_SECONDS}, immutable"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.route("/images/<name>")
+def serve_image(name):
+    """Originales y miniaturas por hash: el contenido de una URL nunca cambia"""
+    match = IMAGE_NAME_RE.match(name)
+    if not match:
+        return jsonify({"error": "Not found"}), 404
+
+    digest = match.group("digest")
+    width = match.group("width")
+    if width:
+        if match.group("ext") != "webp" or int(width) not in IMAGE_WIDTHS:
+            return jsonify({"error": "Not found"}), 404
+        path = image_path(digest, int(width))
+        if not os.path.exists(path):
+            # Pedida antes de que el pool la termine: generarla aca mismo
+            source_path = find_original_image(digest)
+            if not source_path or pil_image is None:
+                return jsonify({"error": "Not found"}), 404
+            generate_thumbnails(digest, source_path)
+    else:
+        path = image_path(digest, ext=match.group("ext"))
+        if not os.path.exists(path):
+            return jsonify({"error": "Not found"}), 404
+
+    response = send_file(
+        path,
+        mimetype=mimetypes.guess_type(name)[0],
+        max_age=ASSET_MAX_AGE_SECONDS,
+        conditional=True,
+    )
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE_SECONDS}, immutable"
     return response
 
 
 @app.route("/<path:path>")
 def static_files(path):
-    file_path = os.path.join(FRONT_DIR, path)
-    if os.path.isfile(file_path):
+    if path == "tienda.html":
+        return send_storefront()
+    if path in RENDERED_FILES:
+        return send_rendered(path)
+    if path in FRONT_FILES:
         response = send_from_directory(FRONT_DIR, path)
-        # No cache for CSS, JS, HTML files
-        if path.endswith(('.css', '.js', '.html')):
-            response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
+        # css/js sin hash (clientes viejos): revalidar siempre
+        if path.endswith(FINGERPRINT_EXTENSIONS):
+            response.headers['Cache-Control'] = 'no-cache'
         return response
-    response = send_from_directory(FRONT_DIR, "index.html")
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    if path.startswith("api/"):
+        return jsonify({"error": "Not found"}), 404
+    return index()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Arranca con la primera request: con --preload el hilo no sobreviviria al fork
+    SCHEDULER.start()
+
+
+@app.after_request
+def flush_pending_events(response):
+    events = g.pop("pending_events", None)
+    if events and response.status_code < 400:
+        STOREFRONT_SNAPSHOTS.invalidate(g.store_id)
+        for event_type, data in events:
+            EVENTS.publish(g.store_id, event_type, data)
+        dispatch_low_stock_alerts(
+            [
+                {"type": event_type, "storeId": g.store_id, "item": data}
+                for event_type, data in events
+                if event_type in LOW_STOCK_EVENT_TYPES
+            ]
+        )
+    return response
+
+
+@app.after_request
+def flush_pending_audit(response):
+    entries = g.pop("pending_audit", None)
+    if entries and response.status_code < 400:
+        endpoint = f"{request.method} {request.path}"
+        created_at = now_ms()
+        AUDIT.append(
+            [
+                (
+                    g.store_id,
+                    g.user_id,
+                    endpoint,
+                    action,
+                    entity_type,
+                    json.dumps(entity_ids[:AUDIT_MAX_IDS]),
+                    len(entity_ids),
+                    json.dumps(before) if before is not None else None,
+                    json.dumps(after) if after is not None else None,
+                    created_at,
+                )
+                for action, entity_type, entity_ids, before, after in entries
+            ]
+        )
+    return response
+
+
+@app.after_request
+def record_request_timing(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        METRICS.observe_request(request.method, endpoint, response.status_code, time.perf_counter() - started)
     return response
 
 
+class CompressedCache:
+    """Cuerpos comprimidos de respuestas con ETag: cada version se comprime una sola vez"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_compress(self, key, compress):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+                return body
+        body = compress()
+        with self.lock:
+            self.entries[key] = body
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return body
+
+
+COMPRESSED_CACHE = CompressedCache(COMPRESSED_CACHE_SIZE)
+
+
+def choose_encoding():
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if request.accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress_bytes(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Comprimir un generador chunk por chunk, con flush en cada uno (SSE sigue en vivo)"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        compress = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+@app.after_request
+def compress_response(response):
+    if (
+        request.method == "HEAD"
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or "Content-Encoding" in response.headers
+        or "no-transform" in response.headers.get("Cache-Control", "")
+        # send_file (backup, archivos sin hash): pasa directo sin leerse en memoria
+        or response.direct_passthrough
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag:
+        body = COMPRESSED_CACHE.get_or_compress((etag, encoding), lambda: compress_bytes(data, encoding))
+        # Misma entidad en otra codificacion: el ETag pasa a debil y sigue validando If-None-Match
+        response.set_etag(etag, weak=True)
+    else:
+        body = compress_bytes(data, encoding)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@app.route("/api/metrics")
+def metrics():
+    """Metricas en formato de texto Prometheus. Muestran rutas, latencias y SQL del worker:
+    siempre piden METRICS_TOKEN y sin el quedan deshabilitadas."""
+    metrics_token = (os.getenv("METRICS_TOKEN") or "").strip()
+    if not metrics_token:
+        return jsonify({"error": "Metrics are disabled (METRICS_TOKEN is not set)."}), 403
+    token = request.headers.get("Authorization", "").replace("Bearer ", "")
+    if not secrets.compare_digest(token, metrics_token):
+        return jsonify({"error": "Unauthorized"}), 401
+    return app.response_class(METRICS.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/api/health")
 def health():
     return jsonify({"status": "ok", "version": "2.1"})
 
 
+def auto_verify_user(user_id):
+    """Marcar el correo como verificado y abrir sesion (local/dev cuando SMTP falla)"""
+    with write_transaction() as conn:
+        conn.execute("UPDATE users SET email_verified = 1 WHERE id = ?", (user_id,))
+        conn.execute("DELETE FROM email_verifications WHERE user_id = ?", (user_id,))
+        return SessionsRepo(conn).create(user_id)
+
+
 @app.route("/api/auth/register", methods=["POST"])
 def register():
     payload = request.get_json(silent=True) or {}
@@ -632,7 +3330,7 @@ def register():
         created_at = now_local().isoformat()
         token = str(uuid.uuid4())
 
-        with get_db() as conn:
+        with write_transaction() as conn:
             existing_username = conn.execute(
                 "SELECT id FROM users WHERE username = ?", (username,)
             ).fetchone()
@@ -645,117 +3343,54 @@ def register():
             if existing_email:
                 return jsonify({"error": "Email already exists."}), 400
 
+            store_id, store_error = resolve_signup_store(conn, payload, username)
+            if store_error:
+                return jsonify({"error": store_error}), 400
+
             conn.execute(
-                "INSERT INTO users (id, username, email, password_hash, email_verified, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (user_id, username, email, password_hash, 1, created_at),
-            )
-            conn.execute(
-                "INSERT INTO sessions (token, user_id, created_at) VALUES (?, ?, ?)",
-                (token, user_id, created_at),
+                "INSERT INTO users (id, username, email, password_hash, email_verified, created_at, store_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, username, email, password_hash, 1, created_at, store_id),
             )
-            conn.commit()
+            SessionsRepo(conn).create(user_id, token)
 
         return jsonify({"token": token, "username": username, "requiresVerification": False}), 201
 
-    with get_db() as conn:
-        existing_username = conn.execute(
-            "SELECT id, email, email_verified FROM users WHERE username = ?", (username,)
-        ).fetchone()
-        if existing_username:
-            if existing_username["email_verified"] == 1:
-                return jsonify({"error": "Username already exists."}), 400
-            existing_user_email = normalize_email(existing_username["email"])
-            if existing_user_email != email:
-                return jsonify({"error": "Username already exists with a different email."}), 400
-
-            user_id = existing_username["id"]
-            code = generate_email_code()
-            store_email_verification(conn, user_id, code)
-            conn.commit()
-
-            email_ok, email_error = send_verification_email(email, username, code)
-            if not email_ok:
-                if allow_dev_email_fallback():
-                    return jsonify(
-                        {
-                            "requiresVerification": True,
-                            "email": email,
-                            "username": username,
-                            "devCode": code,
-                            "warning": f"Email not sent in local/dev mode: {email_error}",
-                        }
-                    ), 200
-                if allow_auto_verify_on_email_failure():
-                    conn.execute("UPDATE users SET email_verified = 1 WHERE id = ?", (user_id,))
-                    token = create_session(conn, user_id)
-                    conn.execute("DELETE FROM email_verifications WHERE user_id = ?", (user_id,))
-                    conn.commit()
-                    return jsonify(
-                        {
-                            "token": token,
-                            "username": username,
-                            "requiresVerification": False,
-                            "warning": f"Auto-verified in local/dev because email could not be sent: {email_error}",
-                        }
-                    ), 200
-                return jsonify({"error": f"Could not send verification email: {email_error}"}), 503
-
-            return jsonify({"requiresVerification": True, "email": email, "username": username}), 200
-
-        existing_email = conn.execute(
-            "SELECT id, username, email_verified FROM users WHERE lower(email) = lower(?)", (email,)
+    # Un usuario sin verificar que se vuelve a registrar recibe un codigo nuevo (200);
+    # el correo se manda despues del commit para no retener el write_lock durante SMTP
+    status_code = 200
+    with write_transaction() as conn:
+        existing = conn.execute(
+            "SELECT id, username, email, email_verified FROM users WHERE username = ?", (username,)
         ).fetchone()
-        if existing_email:
-            if existing_email["email_verified"] == 1:
+        if existing:
+            if existing["email_verified"] == 1:
+                return jsonify({"error": "Username already exists."}), 400
+            if normalize_email(existing["email"]) != email:
+                return jsonify({"error": "Username already exists with a different email."}), 400
+        else:
+            existing = conn.execute(
+                "SELECT id, username, email_verified FROM users WHERE lower(email) = lower(?)", (email,)
+            ).fetchone()
+            if existing and existing["email_verified"] == 1:
                 return jsonify({"error": "Email already exists."}), 400
 
-            user_id = existing_email["id"]
-            username = existing_email["username"]
-            code = generate_email_code()
-            store_email_verification(conn, user_id, code)
-            conn.commit()
-
-            email_ok, email_error = send_verification_email(email, username, code)
-            if not email_ok:
-                if allow_dev_email_fallback():
-                    return jsonify(
-                        {
-                            "requiresVerification": True,
-                            "email": email,
-                            "username": username,
-                            "devCode": code,
-                            "warning": f"Email not sent in local/dev mode: {email_error}",
-                        }
-                    ), 200
-                if allow_auto_verify_on_email_failure():
-                    conn.execute("UPDATE users SET email_verified = 1 WHERE id = ?", (user_id,))
-                    token = create_session(conn, user_id)
-                    conn.execute("DELETE FROM email_verifications WHERE user_id = ?", (user_id,))
-                    conn.commit()
-                    return jsonify(
-                        {
-                            "token": token,
-                            "username": username,
-                            "requiresVerification": False,
-                            "warning": f"Auto-verified in local/dev because email could not be sent: {email_error}",
-                        }
-                    ), 200
-                return jsonify({"error": f"Could not send verification email: {email_error}"}), 503
-
-            return jsonify({"requiresVerification": True, "email": email, "username": username}), 200
-
-        user_id = str(uuid.uuid4())
-        password_hash = generate_password_hash(password)
-        created_at = now_local().isoformat()
+        if existing:
+            user_id = existing["id"]
+            username = existing["username"]
+        else:
+            status_code = 201
+            user_id = str(uuid.uuid4())
+            store_id, store_error = resolve_signup_store(conn, payload, username)
+            if store_error:
+                return jsonify({"error": store_error}), 400
 
-        conn.execute(
-            "INSERT INTO users (id, username, email, password_hash, email_verified, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (user_id, username, email, password_hash, 0, created_at),
-        )
+            conn.execute(
+                "INSERT INTO users (id, username, email, password_hash, email_verified, created_at, store_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, username, email, generate_password_hash(password), 0, now_local().isoformat(), store_id),
+            )
 
         code = generate_email_code()
         store_email_verification(conn, user_id, code)
-        conn.commit()
 
     email_ok, email_error = send_verification_email(email, username, code)
 
@@ -769,13 +3404,9 @@ def register():
                     "devCode": code,
                     "warning": f"Email not sent in local/dev mode: {email_error}",
                 }
-            ), 201
+            ), status_code
         if allow_auto_verify_on_email_failure():
-            with get_db() as conn:
-                conn.execute("UPDATE users SET email_verified = 1 WHERE id = ?", (user_id,))
-                token = create_session(conn, user_id)
-                conn.execute("DELETE FROM email_verifications WHERE user_id = ?", (user_id,))
-                conn.commit()
+            token = auto_verify_user(user_id)
             return jsonify(
                 {
                     "token": token,
@@ -783,10 +3414,10 @@ def register():
                     "requiresVerification": False,
                     "warning": f"Auto-verified in local/dev because email could not be sent: {email_error}",
                 }
-            ), 201
+            ), status_code
         return jsonify({"error": f"Could not send verification email: {email_error}"}), 503
 
-    return jsonify({"requiresVerification": True, "email": email, "username": username}), 201
+    return jsonify({"requiresVerification": True, "email": email, "username": username}), status_code
 
 
 @app.route("/api/auth/verify-email", methods=["POST"])
@@ -798,7 +3429,7 @@ def verify_email():
     if not email or not code:
         return jsonify({"error": "Email and code are required."}), 400
 
-    with get_db() as conn:
+    with write_transaction() as conn:
         user = conn.execute(
             "SELECT id, username, email_verified FROM users WHERE lower(email) = lower(?)",
             (email,),
@@ -808,8 +3439,7 @@ def verify_email():
             return jsonify({"error": "User not found."}), 404
 
         if user["email_verified"] == 1:
-            token = create_session(conn, user["id"])
-            conn.commit()
+            token = SessionsRepo(conn).create(user["id"])
             return jsonify({"token": token, "username": user["username"], "alreadyVerified": True})
 
         verification = conn.execute(
@@ -827,18 +3457,17 @@ def verify_email():
             return jsonify({"error": "Verification code expired. Request a new code."}), 400
 
         if hash_email_code(user["id"], code) != verification["code_hash"]:
+            # El intento fallido se guarda: el return hace commit de la transaccion
             conn.execute(
                 "UPDATE email_verifications SET attempts = attempts + 1 WHERE user_id = ?",
                 (user["id"],),
             )
-            conn.commit()
             return jsonify({"error": "Invalid verification code."}), 400
 
         conn.execute("UPDATE users SET email_verified = 1 WHERE id = ?", (user["id"],))
         conn.execute("DELETE FROM email_verifications WHERE user_id = ?", (user["id"],))
 
-        token = create_session(conn, user["id"])
-        conn.commit()
+        token = SessionsRepo(conn).create(user["id"])
 
     return jsonify({"token": token, "username": user["username"]})
 
@@ -851,7 +3480,7 @@ def resend_code():
     if not email:
         return jsonify({"error": "Email is required."}), 400
 
-    with get_db() as conn:
+    with write_transaction() as conn:
         user = conn.execute(
             "SELECT id, username, email_verified FROM users WHERE lower(email) = lower(?)",
             (email,),
@@ -877,7 +3506,6 @@ def resend_code():
 
         code = generate_email_code()
         store_email_verification(conn, user["id"], code)
-        conn.commit()
 
     email_ok, email_error = send_verification_email(email, user["username"], code)
 
@@ -913,15 +3541,13 @@ def login():
         return jsonify({"error": "Invalid username or password."}), 401
 
     if user["email_verified"] != 1 and not require_email_verification():
-        with get_db() as conn:
+        with write_transaction() as conn:
             conn.execute("UPDATE users SET email_verified = 1 WHERE id = ?", (user["id"],))
-            conn.commit()
 
     if user["email_verified"] != 1:
         verification_code = generate_email_code()
-        with get_db() as conn:
+        with write_transaction() as conn:
             store_email_verification(conn, user["id"], verification_code)
-            conn.commit()
 
         email_ok, email_error = send_verification_email(user["email"], user["username"], verification_code)
         if not email_ok:
@@ -936,11 +3562,7 @@ def login():
                     }
                 ), 403
             if allow_auto_verify_on_email_failure():
-                with get_db() as conn:
-                    conn.execute("UPDATE users SET email_verified = 1 WHERE id = ?", (user["id"],))
-                    conn.execute("DELETE FROM email_verifications WHERE user_id = ?", (user["id"],))
-                    token = create_session(conn, user["id"])
-                    conn.commit()
+                token = auto_verify_user(user["id"])
                 return jsonify(
                     {
                         "token": token,
@@ -964,9 +3586,8 @@ def login():
             }
         ), 403
 
-    with get_db() as conn:
-        token = create_session(conn, user["id"])
-        conn.commit()
+    with write_transaction() as conn:
+        token = SessionsRepo(conn).create(user["id"])
 
     return jsonify({"token": token, "username": username})
 
@@ -975,9 +3596,8 @@ def login():
 @require_auth
 def logout():
     token = request.headers.get("Authorization", "").replace("Bearer ", "")
-    with get_db() as conn:
-        conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
-        conn.commit()
+    with write_transaction() as conn:
+        SessionsRepo(conn).delete(token)
     return jsonify({"status": "ok"})
 
 
@@ -988,152 +3608,442 @@ def validate_session():
     return jsonify({"status": "valid"})
 
 
+def row_to_store_item(row):
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "sku": row["sku"],
+        "quantity": row["quantity"],
+        "price": from_cents(row["price_cents"]),
+        "description": row["description"],
+        "imageUrl": row["image_url"],
+        "imageSrcset": image_srcset(row["image_url"]),
+        "status": row["status"],
+    }
+
+
+def price_band_id(low, high):
+    return f"{low // 100}-{high // 100}" if high is not None else f"{low // 100}+"
+
+
+def catalog_filters(args):
+    """Filtros del catalogo publico como (faceta, condicion, parametros)"""
+    filters = []
+    search = (args.get("q") or "").strip().lower()
+    if search:
+        filters.append(("q", "LOWER(name) LIKE ?", [f"%{search}%"]))
+    if args.get("status"):
+        filters.append(("status", "COALESCE(status, 'Nuevo') = ?", [args["status"]]))
+    if args.get("location"):
+        filters.append(("location", "location = ?", [args["location"]]))
+    for low, high in STORE_PRICE_BANDS:
+        if args.get("price") == price_band_id(low, high):
+            if high is None:
+                filters.append(("price", "price_cents >= ?", [low]))
+            else:
+                filters.append(("price", "price_cents >= ? AND price_cents < ?", [low, high]))
+    return filters
+
+
+def catalog_where(store_id, filters, skip=None):
+    """WHERE del catalogo; `skip` deja fuera una faceta para contar sus otras opciones"""
+    clauses = ["store_id = ?", "quantity > 0"]
+    params = [store_id]
+    for facet, clause, values in filters:
+        if facet != skip:
+            clauses.append(clause)
+            params.extend(values)
+    return " AND ".join(clauses), params
+
+
+def query_catalog(conn, store_id, filters, page, limit):
+    """Una pagina del catalogo (orden por nombre) con total y conteos por faceta.
+    Cada faceta cuenta con los demas filtros aplicados pero no el suyo."""
+    where, params = catalog_where(store_id, filters)
+    total = conn.execute(f"SELECT COUNT(*) AS total FROM items WHERE {where}", params).fetchone()["total"]
+    rows = conn.execute(
+        f"""
+        SELECT id, name, sku, quantity, price_cents, description, image_url, status
+        FROM items
+        WHERE {where}
+        ORDER BY name ASC, id ASC
+        LIMIT ? OFFSET ?
+        """,
+        params + [limit, (page - 1) * limit],
+    ).fetchall()
+
+    facets = {}
+    for facet, column in (("status", "COALESCE(status, 'Nuevo')"), ("location", "location")):
+        facet_where, facet_params = catalog_where(store_id, filters, skip=facet)
+        facets[facet] = [
+            {"value": row["value"], "count": row["total"]}
+            for row in conn.execute(
+                f"""
+                SELECT {column} AS value, COUNT(*) AS total
+                FROM items
+                WHERE {facet_where}
+                GROUP BY {column}
+                ORDER BY total DESC, value ASC
+                """,
+                facet_params,
+            ).fetchall()
+        ]
+
+    price_where, price_params = catalog_where(store_id, filters, skip="price")
+    band_columns = []
+    band_params = []
+    for index, (low, high) in enumerate(STORE_PRICE_BANDS):
+        if high is None:
+            band_columns.append(f"SUM(CASE WHEN price_cents >= ? THEN 1 ELSE 0 END) AS band{index}")
+            band_params.append(low)
+        else:
+            band_columns.append(
+                f"SUM(CASE WHEN price_cents >= ? AND price_cents < ? THEN 1 ELSE 0 END) AS band{index}"
+            )
+            band_params.extend([low, high])
+    band_row = conn.execute(
+        f"SELECT {', '.join(band_columns)} FROM items WHERE {price_where}", band_params + price_params
+    ).fetchone()
+    store = conn.execute("SELECT name FROM stores WHERE id = ?", (store_id,)).fetchone()
+    facets["price"] = [
+        {
+            "value": price_band_id(low, high),
+            "min": from_cents(low),
+            "max": from_cents(high) if high is not None else None,
+            "count": band_row[f"band{index}"] or 0,
+        }
+        for index, (low, high) in enumerate(STORE_PRICE_BANDS)
+    ]
+
+    return {
+        "items": [row_to_store_item(row) for row in rows],
+        "page": page,
+        "limit": limit,
+        "total": total,
+        "facets": facets,
+        "store": {
+            "name": store["name"] if store else "",
+            "currency": SETTINGS.get("currency", store_id),
+            "whatsappNumber": SETTINGS.get("whatsappNumber", store_id),
+        },
+    }
+
+
+@app.route("/api/store/catalog", methods=["GET"])
+def store_catalog():
+    """Catalogo publico paginado: ?page, ?limit, ?q, ?status, ?location, ?price (id del rango)"""
+    page = max(to_int(request.args.get("page"), 1), 1)
+    limit = min(max(to_int(request.args.get("limit"), STORE_PAGE_SIZE), 1), STORE_MAX_PAGE_SIZE)
+    with get_db(readonly=True) as conn:
+        store_id = storefront_store_id(conn)
+        if store_id is None:
+            return jsonify({"error": "Store not found."}), 404
+        catalog = query_catalog(conn, store_id, catalog_filters(request.args), page, limit)
+
+    response = jsonify(catalog)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
 @app.route("/api/store/items", methods=["GET"])
 def list_store_items():
-    with get_db() as conn:
+    with get_db(readonly=True) as conn:
+        store_id = storefront_store_id(conn)
+        if store_id is None:
+            return jsonify({"error": "Store not found."}), 404
         rows = conn.execute(
             """
-            SELECT id, name, sku, quantity, price, description, image_url, status
+            SELECT id, name, sku, quantity, price_cents, description, image_url, status
             FROM items
-            WHERE quantity > 0
+            WHERE store_id = ? AND quantity > 0
             ORDER BY name ASC
-            """
+            """,
+            (store_id,),
         ).fetchall()
 
-    return jsonify(
-        [
-            {
-                "id": row["id"],
-                "name": row["name"],
-                "sku": row["sku"],
-                "quantity": row["quantity"],
-                "price": row["price"],
-                "description": row["description"],
-                "imageUrl": row["image_url"],
-                "status": row["status"],
-            }
-            for row in rows
-        ]
-    )
+    # ETag del catalogo: revalidacion barata y el cuerpo comprimido se reutiliza por version
+    response = list_response(rows, STORE_ITEM_FIELDS, row_to_store_item)
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
 
 @app.route("/api/items", methods=["GET"])
 @require_auth
 def list_items():
-    with get_db() as conn:
+    with get_db(readonly=True) as conn:
+        return list_response(ItemsRepo(conn, g.store_id).stream(), ITEM_FIELDS, row_to_item)
+
+
+@app.route("/api/items/<item_id>/movements", methods=["GET"])
+@require_auth
+def list_item_movements(item_id):
+    """Movimientos de stock de un item, del mas nuevo al mas viejo (paginado por ?before=<id>)"""
+    limit = min(max(to_int(request.args.get("limit"), MOVEMENTS_PAGE_SIZE), 1), MOVEMENTS_MAX_PAGE_SIZE)
+    before = to_int(request.args.get("before"), 0)
+    include_snapshots = request.args.get("snapshots") in {"1", "true"}
+
+    query = "SELECT * FROM stock_movements WHERE item_id = ? AND store_id = ?"
+    params = [item_id, g.store_id]
+    if before > 0:
+        query += " AND id < ?"
+        params.append(before)
+    if not include_snapshots:
+        query += " AND kind != 'snapshot'"
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with get_db(readonly=True) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    page = rows[:limit]
+    return jsonify(
+        {
+            "movements": [row_to_movement(row) for row in page],
+            "nextBefore": page[-1]["id"] if len(rows) > limit else None,
+        }
+    )
+
+
+@app.route("/api/items/<item_id>/stock", methods=["GET"])
+@require_auth
+def item_stock_at(item_id):
+    """Stock de un item en una fecha (?at=ISO o ms, por defecto ahora) segun el ledger"""
+    at_ms = to_epoch_ms(request.args.get("at")) or now_ms()
+    with get_db(readonly=True) as conn:
+        owned = conn.execute(
+            "SELECT 1 FROM stock_movements WHERE item_id = ? AND store_id = ? LIMIT 1",
+            (item_id, g.store_id),
+        ).fetchone()
+        if not owned:
+            return jsonify({"error": "Item not found."}), 404
+        quantity = stock_at(conn, item_id, at_ms)
+    return jsonify({"itemId": item_id, "at": ms_to_iso(at_ms), "quantity": quantity})
+
+
+@app.route("/api/alerts/low-stock", methods=["GET"])
+@require_auth
+def low_stock_alerts():
+    """Items con quantity <= threshold, resueltos con idx_items_store_low_stock"""
+    with get_db(readonly=True) as conn:
         rows = conn.execute(
-            "SELECT * FROM items ORDER BY updated_at DESC"
+            "SELECT * FROM items WHERE store_id = ? AND quantity - threshold <= 0 ORDER BY quantity ASC",
+            (g.store_id,),
         ).fetchall()
-    return jsonify([row_to_item(row) for row in rows])
+    return jsonify({"count": len(rows), "items": [row_to_item(row) for row in rows]})
+
+
+def format_sse(event):
+    if event is None:
+        return "event: reset\ndata: {}\n\n"
+    event_id, event_type, data = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+@app.route("/api/events/ticket", methods=["POST"])
+@require_auth
+def event_stream_ticket():
+    """Ticket para abrir GET /api/events?ticket=... (vence en SSE_TICKET_TTL_SECONDS)"""
+    with write_transaction() as conn:
+        ticket = SessionsRepo(conn).create_stream_ticket(g.user_id)
+    return jsonify({"ticket": ticket, "expiresIn": SSE_TICKET_TTL_SECONDS}), 201
+
+
+@app.route("/api/events", methods=["GET"])
+def event_stream():
+    """Stream SSE de cambios en items y ventas; reanuda desde Last-Event-ID si sigue en memoria.
+    Se autentica con un ticket de POST /api/events/ticket, no con el token de sesion."""
+    ticket = request.args.get("ticket", "").strip()
+    session = None
+    if ticket:
+        with write_transaction() as conn:
+            session = SessionsRepo(conn).redeem_stream_ticket(ticket)
+    if not session or not session["store_id"]:
+        return jsonify({"error": "Invalid or expired stream ticket."}), 401
+    g.user_id = session["user_id"]
+    g.store_id = session["store_id"]
+
+    if EVENTS.subscriber_count() >= SSE_MAX_CLIENTS:
+        response = jsonify({"error": "Too many event streams."})
+        response.headers["Retry-After"] = str(SSE_RETRY_MS // 1000)
+        return response, 503
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    subscriber, missed = EVENTS.subscribe(g.store_id, last_event_id)
+
+    def generate():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n: connected {EVENTS.stream_id}\n\n"
+            for event in missed:
+                yield format_sse(event)
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event)
+                if event is None:
+                    return
+        finally:
+            EVENTS.unsubscribe(subscriber)
+
+    return app.response_class(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/api/items", methods=["POST"])
 @require_auth
+@idempotent
 def create_item():
     payload = request.get_json(silent=True) or {}
     item, error = parse_item(payload)
     if error:
         return jsonify({"error": error}), 400
 
-    with get_db() as conn:
-        existing = conn.execute(
-            "SELECT id FROM items WHERE sku = ? AND id != ?",
-            (item["sku"], item["id"]),
-        ).fetchone()
-        if existing:
+    with write_transaction() as conn:
+        items = ItemsRepo(conn, g.store_id)
+        if items.sku_taken(item["sku"], item["id"]):
             return jsonify({"error": "SKU already exists."}), 400
 
-        conn.execute(
-            """
-            INSERT OR REPLACE INTO items
-            (id, name, sku, quantity, location, price, cost_unit, threshold, description, image_url, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                item["id"],
-                item["name"],
-                item["sku"],
-                item["quantity"],
-                item["location"],
-                item["price"],
-                item["costUnit"],
-                item["threshold"],
-                item["description"],
-                item["imageUrl"],
-                item["updatedAt"],
-            ),
-        )
-        conn.commit()
+        previous = items.owner(item["id"])
+        if previous and previous["store_id"] != g.store_id:
+            return jsonify({"error": "Item id already used."}), 409
+        low_before = low_stock_ids(conn, [item["id"]])
+        existing = items.get(item["id"]) if previous else None
+
+        items.upsert(item)
+        if previous:
+            movement = (item["id"], "adjustment", item["quantity"] - previous["quantity"], None)
+        else:
+            movement = (item["id"], "receipt", item["quantity"], None)
+        record_stock_movements(conn, [movement])
+        track_low_stock_crossings(conn, low_before, [item["id"]])
+        if existing:
+            queue_audit("update", "item", [item["id"]], row_to_item(existing), row_to_item(items.get(item["id"])))
+        else:
+            queue_audit("create", "item", [item["id"]], None, item)
+    queue_event("item", item)
     return jsonify(item), 201
 
 
-@app.route("/api/items/<item_id>", methods=["PUT"])
-@require_auth
-def update_item(item_id):
-    payload = request.get_json(silent=True) or {}
+def apply_item_update(conn, item_id, payload):
+    """Editar un item dentro de una transaccion abierta. Devuelve (body, status).
+
+    Si el payload trae expectedUpdatedAt/expectedQuantity (la version que edito el cliente) y
+    el item o su stock cambiaron desde entonces, responde 409 con el item actual. Reenviar la
+    misma edicion es un no-op.
+    """
+    payload = dict(payload)
     payload["id"] = item_id
     item, error = parse_item(payload)
     if error:
-        return jsonify({"error": error}), 400
+        return {"error": error}, 400
+
+    items = ItemsRepo(conn, g.store_id)
+    existing = items.get(item_id)
+    if not existing:
+        return {"error": "Item not found."}, 404
+
+    expected_updated_at = payload.get("expectedUpdatedAt")
+    expected_quantity = payload.get("expectedQuantity")
+    if expected_updated_at or expected_quantity is not None:
+        if existing["updated_at"] == to_epoch_ms(item["updatedAt"]) and existing["quantity"] == item["quantity"]:
+            return row_to_item(existing), 200
+        stale = (expected_updated_at and existing["updated_at"] != to_epoch_ms(expected_updated_at)) or (
+            expected_quantity is not None and existing["quantity"] != to_int(expected_quantity)
+        )
+        if stale:
+            return {"error": "Item changed on the server.", "conflict": "stale", "item": row_to_item(existing)}, 409
 
-    with get_db() as conn:
-        existing = conn.execute(
-            "SELECT id FROM items WHERE id = ?", (item_id,)
-        ).fetchone()
-        if not existing:
-            return jsonify({"error": "Item not found."}), 404
+    if items.sku_taken(item["sku"], item_id):
+        return {"error": "SKU already exists."}, 400
 
-        sku_duplicate = conn.execute(
-            "SELECT id FROM items WHERE sku = ? AND id != ?",
-            (item["sku"], item_id),
-        ).fetchone()
-        if sku_duplicate:
-            return jsonify({"error": "SKU already exists."}), 400
+    low_before = low_stock_ids(conn, [item_id])
+    items.update(item)
+    record_stock_movements(
+        conn, [(item_id, "adjustment", item["quantity"] - existing["quantity"], None)]
+    )
+    track_low_stock_crossings(conn, low_before, [item_id])
+    queue_event("item", item)
+    queue_audit("update", "item", [item_id], row_to_item(existing), row_to_item(items.get(item_id)))
+    return item, 200
 
-        conn.execute(
-            """
-            UPDATE items
-            SET name = ?, sku = ?, quantity = ?, location = ?, price = ?, cost_unit = ?,
-                threshold = ?, description = ?, image_url = ?, updated_at = ?
-            WHERE id = ?
-            """,
-            (
-                item["name"],
-                item["sku"],
-                item["quantity"],
-                item["location"],
-                item["price"],
-                item["costUnit"],
-                item["threshold"],
-                item["description"],
-                item["imageUrl"],
-                item["updatedAt"],
-                item_id,
-            ),
-        )
-        conn.commit()
-    return jsonify(item)
+
+@app.route("/api/images", methods=["POST"])
+@require_auth
+def upload_image():
+    """Subir una imagen de producto (multipart `image` o el cuerpo crudo).
+    Responde la URL para imageUrl; las miniaturas se generan en segundo plano."""
+    if pil_image is None:
+        return jsonify({"error": "Image uploads are not available."}), 503
+    if (request.content_length or 0) > IMAGE_MAX_BYTES + 64 * 1024:
+        return jsonify({"error": "Image too large."}), 413
+
+    upload = request.files.get("image")
+    data = upload.read(IMAGE_MAX_BYTES + 1) if upload else request.get_data(cache=False)
+    if not data:
+        return jsonify({"error": "Missing image."}), 400
+    if len(data) > IMAGE_MAX_BYTES:
+        return jsonify({"error": "Image too large."}), 413
+
+    digest, ext = store_image(data)
+    if not digest:
+        return jsonify({"error": "Unsupported image (use JPEG, PNG, WebP or GIF)."}), 400
+
+    url = f"/images/{digest}.{ext}"
+    _image_executor.submit(_thumbnail_job, digest, image_path(digest, ext=ext))
+    return jsonify({"id": digest, "url": url, "srcset": image_srcset(url)}), 201
+
+
+@app.route("/api/items/<item_id>", methods=["PUT"])
+@require_auth
+@idempotent
+def update_item(item_id):
+    payload = request.get_json(silent=True) or {}
+    with write_transaction() as conn:
+        body, status = apply_item_update(conn, item_id, payload)
+    return jsonify(body), status
 
 
 @app.route("/api/items/<item_id>", methods=["DELETE"])
 @require_auth
 def delete_item(item_id):
-    with get_db() as conn:
-        conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
-        conn.commit()
+    with write_transaction() as conn:
+        items = ItemsRepo(conn, g.store_id)
+        existing = items.get(item_id)
+        items.delete(item_id)
+        if existing:
+            record_stock_movements(conn, [(item_id, "adjustment", -existing["quantity"], None)])
+            queue_event("item-deleted", {"id": item_id})
+            queue_audit("delete", "item", [item_id], row_to_item(existing))
     return jsonify({"status": "ok"})
 
 
 @app.route("/api/items", methods=["DELETE"])
 @require_auth
 def clear_items():
-    with get_db() as conn:
-        conn.execute("DELETE FROM items")
+    with write_transaction() as conn:
+        items = ItemsRepo(conn, g.store_id)
+        previous = items.quantities()
+        items.clear()
+        record_stock_movements(
+            conn, [(item_id, "adjustment", -quantity, None) for item_id, quantity in previous.items()]
+        )
+    queue_event("items-reset", {})
+    queue_audit(
+        "clear", "item", list(previous), {"count": len(previous), "units": sum(previous.values())}, diff=False
+    )
     return jsonify({"status": "cleared"})
 
 
 @app.route("/api/items/bulk", methods=["POST"])
 @require_auth
+@idempotent
 def bulk_items():
     payload = request.get_json(silent=True) or {}
     items = payload.get("items") or []
@@ -1144,63 +4054,181 @@ def bulk_items():
             continue
         cleaned.append(item)
 
-    with get_db() as conn:
-        conn.execute("DELETE FROM items")
-        conn.executemany(
-            """
-            INSERT OR REPLACE INTO items
-            (id, name, sku, quantity, location, price, cost_unit, threshold, description, image_url, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
+    with write_transaction() as conn:
+        items = ItemsRepo(conn, g.store_id)
+        previous = items.quantities()
+        low_before = low_stock_ids(conn)
+        items.clear()
+        # Ids que ya usa otra tienda: el item importado recibe un id nuevo
+        taken = items.foreign_ids([item["id"] for item in cleaned])
+        for item in cleaned:
+            if item["id"] in taken:
+                item["id"] = str(uuid.uuid4())
+        items.upsert_many(cleaned)
+        imported = {item["id"]: item["quantity"] for item in cleaned}
+        record_stock_movements(
+            conn,
             [
-                (
-                    item["id"],
-                    item["name"],
-                    item["sku"],
-                    item["quantity"],
-                    item["location"],
-                    item["price"],
-                    item["costUnit"],
-                    item["threshold"],
-                    item["description"],
-                    item["imageUrl"],
-                    item["updatedAt"],
-                )
-                for item in cleaned
+                (item_id, "import", imported.get(item_id, 0) - previous.get(item_id, 0), None)
+                for item_id in set(previous) | set(imported)
             ],
         )
-        conn.commit()
+        track_low_stock_crossings(conn, low_before)
+    queue_event("items-reset", {})
+    queue_audit(
+        "replace",
+        "item",
+        list(imported),
+        {"count": len(previous), "units": sum(previous.values())},
+        {"count": len(imported), "units": sum(imported.values())},
+        diff=False,
+    )
     return jsonify(cleaned)
 
 
+@app.route("/api/items/export", methods=["GET"])
+@require_auth
+def export_items():
+    """Inventario de la tienda en CSV (centavos y ms); se restaura con POST /api/items/import"""
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    with get_db(readonly=True) as conn:
+        ItemsRepo(conn, g.store_id).export_csv(spool)
+    spool.seek(0)
+
+    def generate():
+        with spool:
+            while chunk := spool.read(COPY_CHUNK_BYTES):
+                yield chunk
+
+    filename = f"inventario-{now_local().strftime('%Y-%m-%d')}.csv"
+    return app.response_class(
+        generate(),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.route("/api/items/import", methods=["POST"])
+@require_auth
+def import_items():
+    """Reemplazar el inventario de la tienda con un CSV de /api/items/export
+    (cuerpo crudo o multipart `file`). Se lee en streaming, sin cargarlo entero."""
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    try:
+        with write_transaction() as conn:
+            items = ItemsRepo(conn, g.store_id)
+            previous = items.quantities()
+            low_before = low_stock_ids(conn)
+            items.clear()
+            imported = items.import_csv(stream)
+            record_stock_movements(
+                conn,
+                [
+                    (item_id, "import", imported.get(item_id, 0) - previous.get(item_id, 0), None)
+                    for item_id in set(previous) | set(imported)
+                ],
+            )
+            track_low_stock_crossings(conn, low_before)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    queue_event("items-reset", {})
+    queue_audit(
+        "import",
+        "item",
+        list(imported),
+        {"count": len(previous), "units": sum(previous.values())},
+        {"count": len(imported), "units": sum(imported.values())},
+        diff=False,
+    )
+    return jsonify({"imported": len(imported)})
+
+
 @app.route("/api/sales", methods=["GET"])
 @require_auth
 def list_sales():
+    """Ventas de la tienda, opcionalmente en un rango ?from=&to= (ISO o ms; `to` exclusivo)"""
+    bounds = {}
+    for arg in ("from", "to"):
+        if request.args.get(arg):
+            bounds[arg] = to_epoch_ms(request.args[arg])
+            if bounds[arg] is None:
+                return jsonify({"error": f"Invalid '{arg}' date."}), 400
+
+    with get_db(readonly=True) as conn:
+        rows = SalesRepo(conn, g.store_id).stream(bounds.get("from"), bounds.get("to"))
+        return list_response(rows, SALE_FIELDS, row_to_sale)
+
+
+@app.route("/api/stores/current", methods=["GET"])
+@require_auth
+def current_store():
+    """Tienda del usuario; joinCode sirve para registrar mas usuarios en la misma tienda"""
+    with get_db(readonly=True) as conn:
+        store = conn.execute("SELECT * FROM stores WHERE id = ?", (g.store_id,)).fetchone()
+    return jsonify(
+        {"id": store["id"], "name": store["name"], "joinCode": store["join_code"], "createdAt": store["created_at"]}
+    )
+
+
+def store_settings(conn, store_id):
+    """Ajustes de una tienda para la API (el nombre vive en stores, el resto en config)"""
+    store = conn.execute("SELECT name FROM stores WHERE id = ?", (store_id,)).fetchone()
+    settings = {"storeName": store["name"] if store else ""}
+    for name, (kind, _, _, scope) in SETTING_DEFINITIONS.items():
+        settings[name] = setting_to_json(kind, SETTINGS.get(name, store_id if scope == "store" else None))
+    return settings
+
+
+@app.route("/api/settings", methods=["GET"])
+@require_auth
+def get_settings():
+    with get_db(readonly=True) as conn:
+        return jsonify(store_settings(conn, g.store_id))
+
+
+@app.route("/api/settings", methods=["PUT"])
+@require_auth
+def update_settings():
+    """Actualizar ajustes de la tienda; solo se cambian las claves enviadas"""
+    payload = request.get_json(silent=True) or {}
+    store_name = None
+    if "storeName" in payload:
+        store_name = str(payload.get("storeName") or "").strip()
+        if not store_name or len(store_name) > 80:
+            return jsonify({"error": "Store name must have 1 to 80 characters."}), 400
+
+    updates = {}
+    for name, (kind, _, _, scope) in SETTING_DEFINITIONS.items():
+        if name not in payload:
+            continue
+        value, error = parse_setting(kind, payload[name])
+        if error:
+            return jsonify({"error": error}), 400
+        updates[name] = value
+
+    with write_transaction() as conn:
+        # La zona horaria es de todo el servidor: solo la cambia la tienda principal
+        if "timezone" in updates and primary_store_id(conn) != g.store_id:
+            return jsonify({"error": "Only the primary store can change the timezone."}), 403
+        previous = store_settings(conn, g.store_id)
+        if store_name is not None:
+            conn.execute("UPDATE stores SET name = ? WHERE id = ?", (store_name, g.store_id))
+        SETTINGS.update(conn, g.store_id, updates)
+    SETTINGS.invalidate()
+
     with get_db() as conn:
-        rows = conn.execute(
-            """
-            SELECT s.*, i.cost_unit
-            FROM sales s
-            LEFT JOIN items i ON s.item_id = i.id
-            ORDER BY s.created_at DESC
-            """
-        ).fetchall()
-    
-    sales_list = []
-    for row in rows:
-        sale = row_to_sale(row)
-        cost_unit = row["cost_unit"] if row["cost_unit"] else 0
-        gain = (row["price"] - cost_unit) * row["quantity"]
-        sale["gain"] = round(gain, 2)
-        sales_list.append(sale)
-    
-    return jsonify(sales_list)
+        settings = store_settings(conn, g.store_id)
+    queue_event("settings", settings)
+    queue_audit("update", "settings", [g.store_id], previous, settings)
+    return jsonify(settings)
 
 
 @app.route("/api/backup")
-@require_auth
+@require_operator
 def backup():
     """Download database backup."""
+    # El archivo tiene los datos de todas las tiendas (usuarios, hashes, sesiones): solo el operador
     if not os.path.exists(DB_PATH):
         return jsonify({"error": "Database not found"}), 404
     return send_file(
@@ -1211,49 +4239,79 @@ def backup():
     )
 
 
+@app.route("/api/audit", methods=["GET"])
+@require_auth
+def list_audit():
+    """Audit log de la tienda, del mas nuevo al mas viejo (paginado por ?before=<id>).
+    Filtros opcionales: ?entityType=, ?entityId=, ?action=, ?userId="""
+    limit = min(max(to_int(request.args.get("limit"), AUDIT_PAGE_SIZE), 1), AUDIT_MAX_PAGE_SIZE)
+    before = to_int(request.args.get("before"), 0)
+    # Lo pendiente de este worker se escribe antes de leer
+    AUDIT.flush()
+
+    query = """
+        SELECT a.*, u.username
+        FROM audit_log a
+        LEFT JOIN users u ON u.id = a.user_id
+        WHERE a.store_id = ?
+    """
+    params = [g.store_id]
+    if before > 0:
+        query += " AND a.id < ?"
+        params.append(before)
+    for arg, column in (("entityType", "entity_type"), ("action", "action"), ("userId", "user_id")):
+        if request.args.get(arg):
+            query += f" AND a.{column} = ?"
+            params.append(request.args[arg])
+    if request.args.get("entityId"):
+        query += " AND a.entity_ids LIKE ?"
+        params.append(f"%{json.dumps(request.args['entityId'])}%")
+    query += " ORDER BY a.id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with get_db(readonly=True) as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    page = rows[:limit]
+    return jsonify(
+        {
+            "entries": [row_to_audit(row) for row in page],
+            "nextBefore": page[-1]["id"] if len(rows) > limit else None,
+        }
+    )
+
+
+@app.route("/api/admin/jobs", methods=["GET"])
+@require_operator
+def scheduled_jobs():
+    """Estado de las tareas de mantenimiento (ultima corrida, duracion, errores)"""
+    with get_db(readonly=True) as conn:
+        jobs = SCHEDULER.status(conn)
+    return jsonify({"enabled": SCHEDULER_ENABLED, "leader": SCHEDULER.leader, "worker": os.getpid(), "jobs": jobs})
+
+
 @app.route("/api/reports/weekly")
 @require_auth
 def weekly_report():
     start, end = get_week_range()
-    start_iso = start.isoformat()
-    end_iso = end.isoformat()
-
-    with get_db() as conn:
-        summary = conn.execute(
-            """
-            SELECT
-                SUM(total) AS total,
-                COUNT(*) AS count,
-                SUM(quantity) AS units
-            FROM sales
-            WHERE created_at >= ? AND created_at < ?
-            """,
-            (start_iso, end_iso),
-        ).fetchone()
+    start_ms = to_epoch_ms(start)
+    end_ms = to_epoch_ms(end)
 
-        by_payment = conn.execute(
-            """
-            SELECT
-                payment_method,
-                SUM(total) AS total,
-                COUNT(*) AS count,
-                SUM(quantity) AS units
-            FROM sales
-            WHERE created_at >= ? AND created_at < ?
-            GROUP BY payment_method
-            ORDER BY total DESC
-            """,
-            (start_iso, end_iso),
-        ).fetchall()
+    with get_db(readonly=True) as conn:
+        sales = SalesRepo(conn, g.store_id)
+        summary = sales.totals(start_ms, end_ms)[0]
+        by_payment = sales.totals(start_ms, end_ms, by_payment=True)
 
-    total = summary["total"] or 0
+    total = from_cents(summary["total_cents"])
+    gain = from_cents(summary["gain_cents"])
     count = summary["count"] or 0
     units = summary["units"] or 0
 
     breakdown = [
         {
             "method": row["payment_method"],
-            "total": row["total"] or 0,
+            "total": from_cents(row["total_cents"]),
+            "gain": from_cents(row["gain_cents"]),
             "count": row["count"] or 0,
             "units": row["units"] or 0,
         }
@@ -1262,9 +4320,10 @@ def weekly_report():
 
     return jsonify(
         {
-            "start": start_iso,
-            "end": end_iso,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
             "total": total,
+            "gain": gain,
             "count": count,
             "units": units,
             "byPayment": breakdown,
@@ -1272,112 +4331,190 @@ def weekly_report():
     )
 
 
-@app.route("/api/sales", methods=["POST"])
-@require_auth
-def create_sale():
-    payload = request.get_json(silent=True) or {}
+CLIENT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def apply_sale(conn, payload):
+    """Registrar una venta dentro de una transaccion abierta. Devuelve (body, status).
+
+    El cliente puede mandar su propio id (ventas hechas offline): si ya existe una venta con
+    ese id y los mismos datos se devuelve la existente sin tocar el stock.
+    """
     item_id = payload.get("itemId")
-    quantity = int(payload.get("quantity") or 0)
-    price = float(payload.get("price") or 0)
+    quantity = to_int(payload.get("quantity"))
+    price_cents = to_cents(payload.get("price") or 0, default=-1)
     payment_method = str(payload.get("paymentMethod") or "").strip()
+    client_id = payload.get("id")
+
+    if not item_id or quantity <= 0 or price_cents < 0 or not payment_method:
+        return {"error": "Invalid sale data."}, 400
+    if client_id is not None and not CLIENT_ID_RE.match(str(client_id)):
+        return {"error": "Invalid sale id."}, 400
+
+    sale_id = str(client_id) if client_id else str(uuid.uuid4())
+    if client_id:
+        previous = SalesRepo(conn, g.store_id).find(sale_id)
+        if previous:
+            if (
+                previous["store_id"] != g.store_id
+                or previous["item_id"] != item_id
+                or previous["quantity"] != quantity
+            ):
+                return {"error": "Sale id already used."}, 409
+            return row_to_sale(previous), 200
+
+    total_cents = quantity * price_cents
+    created_at = now_ms()
+
+    items = ItemsRepo(conn, g.store_id)
+    item = items.get(item_id)
+    if not item:
+        return {"error": "Item not found."}, 404
+
+    if item["quantity"] < quantity:
+        return {"error": "Not enough stock.", "conflict": "stock", "item": row_to_item(item)}, 400
+
+    low_before = low_stock_ids(conn, [item_id])
+    # Guardar el costo unitario actual del item: la ganancia no cambia si luego cambia el costo
+    cost_unit_cents = item["cost_unit_cents"] or 0
+    gain_cents = (price_cents - cost_unit_cents) * quantity
+
+    SalesRepo(conn, g.store_id).insert(
+        {
+            "id": sale_id,
+            "item_id": item_id,
+            "quantity": quantity,
+            "price_cents": price_cents,
+            "total_cents": total_cents,
+            "cost_unit_cents": cost_unit_cents,
+            "gain_cents": gain_cents,
+            "payment_method": payment_method,
+            "created_at": created_at,
+        }
+    )
+    items.add_quantity(item_id, -quantity)
+    record_stock_movements(conn, [(item_id, "sale", -quantity, sale_id)])
+    track_low_stock_crossings(conn, low_before, [item_id])
+    queue_item_event(conn, item_id)
+
+    sale = {
+        "id": sale_id,
+        "itemId": item_id,
+        "quantity": quantity,
+        "price": from_cents(price_cents),
+        "total": from_cents(total_cents),
+        "gain": from_cents(gain_cents),
+        "paymentMethod": payment_method,
+        "createdAt": ms_to_iso(created_at),
+    }
+    queue_event("sale", sale)
+    queue_audit("create", "sale", [sale_id], None, sale)
+    return sale, 201
 
-    if not item_id or quantity <= 0 or price < 0 or not payment_method:
-        return jsonify({"error": "Invalid sale data."}), 400
 
-    total = quantity * price
-    sale_id = str(uuid.uuid4())
-    created_at = now_local().isoformat()
+@app.route("/api/sales", methods=["POST"])
+@require_auth
+@idempotent
+def create_sale():
+    payload = request.get_json(silent=True) or {}
+    with write_transaction() as conn:
+        body, status = apply_sale(conn, payload)
+    return jsonify(body), status
 
-    with get_db() as conn:
-        item = conn.execute(
-            "SELECT quantity, cost_unit FROM items WHERE id = ?", (item_id,)
-        ).fetchone()
-        if not item:
-            return jsonify({"error": "Item not found."}), 404
 
-        if item["quantity"] < quantity:
-            return jsonify({"error": "Not enough stock."}), 400
+SYNC_MAX_OPERATIONS = 500
 
-        # Usar el costo unitario del item
-        cost_unit = item["cost_unit"] if item["cost_unit"] else 0
-        gain = (price - cost_unit) * quantity
 
-        conn.execute(
-            "INSERT INTO sales (id, item_id, quantity, price, total, payment_method, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (sale_id, item_id, quantity, price, total, payment_method, created_at),
-        )
-        conn.execute(
-            "UPDATE items SET quantity = quantity - ? WHERE id = ?",
-            (quantity, item_id),
-        )
-        
-        conn.commit()
+@app.route("/api/sync", methods=["POST"])
+@require_auth
+@idempotent
+def sync_operations():
+    """Reproducir en orden la cola offline del service worker en una sola transaccion.
 
-    return (
-        jsonify(
-            {
-                "id": sale_id,
-                "itemId": item_id,
-                "quantity": quantity,
-                "price": price,
-                "total": total,
-                "gain": round(gain, 2),
-                "paymentMethod": payment_method,
-                "createdAt": created_at,
-            }
-        ),
-        201,
-    )
+    Cada operacion es {"id", "type": "sale"|"item-update", "payload"} y recibe su propio
+    resultado: applied, duplicate, conflict (sin stock o item editado por otro) o error.
+    """
+    payload = request.get_json(silent=True) or {}
+    operations = payload.get("operations")
+    if not isinstance(operations, list):
+        return jsonify({"error": "Missing operations."}), 400
+    if len(operations) > SYNC_MAX_OPERATIONS:
+        return jsonify({"error": f"At most {SYNC_MAX_OPERATIONS} operations per sync."}), 400
+
+    results = []
+    with write_transaction() as conn:
+        for operation in operations:
+            operation = operation if isinstance(operation, dict) else {}
+            op_type = operation.get("type")
+            op_payload = operation.get("payload") or {}
+            if op_type == "sale":
+                body, status = apply_sale(conn, op_payload)
+            elif op_type == "item-update":
+                body, status = apply_item_update(conn, str(op_payload.get("id") or ""), op_payload)
+            else:
+                body, status = {"error": "Unknown operation type."}, 400
+
+            if "conflict" in body:
+                outcome = "conflict"
+            elif status >= 400:
+                outcome = "error"
+            elif op_type == "sale" and status == 200:
+                outcome = "duplicate"
+            else:
+                outcome = "applied"
+            results.append({"id": operation.get("id"), "status": outcome, "result": body})
+    return jsonify({"results": results})
 
 
 @app.route("/api/sales/<sale_id>", methods=["DELETE"])
 @require_auth
 def delete_sale(sale_id):
-    with get_db() as conn:
-        sale = conn.execute(
-            "SELECT * FROM sales WHERE id = ?", (sale_id,)
-        ).fetchone()
+    with write_transaction() as conn:
+        sales = SalesRepo(conn, g.store_id)
+        sale = sales.get(sale_id)
         if not sale:
             return jsonify({"error": "Sale not found."}), 404
 
-        conn.execute(
-            "UPDATE items SET quantity = quantity + ? WHERE id = ?",
-            (sale["quantity"], sale["item_id"]),
-        )
-        conn.execute("DELETE FROM sales WHERE id = ?", (sale_id,))
-        conn.commit()
+        low_before = low_stock_ids(conn, [sale["item_id"]])
+        ItemsRepo(conn, g.store_id).add_quantity(sale["item_id"], sale["quantity"])
+        sales.delete(sale_id)
+        record_stock_movements(conn, [(sale["item_id"], "return", sale["quantity"], sale_id)])
+        track_low_stock_crossings(conn, low_before, [sale["item_id"]])
+        queue_item_event(conn, sale["item_id"])
 
+    queue_event("sale-deleted", {"id": sale_id})
+    queue_audit("delete", "sale", [sale_id], row_to_sale(sale))
     return jsonify({"status": "deleted"})
 
 
-
-
-
-
-
-
 @app.route("/api/sales/<sale_id>/invoice", methods=["GET"])
 @require_auth
 def get_invoice(sale_id):
-    with get_db() as conn:
+    with get_db(readonly=True) as conn:
         sale = conn.execute(
             """
-            SELECT s.id, s.item_id, s.quantity, s.price, s.total, s.payment_method, s.created_at, i.name, i.sku
+            SELECT s.id, s.item_id, s.quantity, s.price_cents, s.total_cents, s.payment_method, s.created_at, i.name, i.sku
             FROM sales s
             LEFT JOIN items i ON s.item_id = i.id
-            WHERE s.id = ?
+            WHERE s.id = ? AND s.store_id = ?
             """,
-            (sale_id,)
+            (sale_id, g.store_id)
         ).fetchone()
         
         if not sale:
             return jsonify({"error": "Sale not found"}), 404
+        store = conn.execute("SELECT name FROM stores WHERE id = ?", (g.store_id,)).fetchone()
+        currency = SETTINGS.get("currency", g.store_id)
+        tax_rate = SETTINGS.get("taxRate", g.store_id)
         
         # Crear PDF
         pdf = FPDF()
         pdf.add_page()
         pdf.set_font("Arial", "B", 16)
         pdf.cell(0, 10, "FACTURA DE VENTA", ln=True, align="C")
+        if store:
+            pdf.set_font("Arial", "", 12)
+            pdf.cell(0, 6, pdf_safe(store["name"]), ln=True, align="C")
         
         pdf.set_font("Arial", "", 10)
         pdf.ln(5)
@@ -1396,13 +4533,25 @@ def get_invoice(sale_id):
         pdf.cell(60, 5, pdf_safe(sale["name"]), border=1)
         pdf.cell(30, 5, pdf_safe(sale["sku"]), border=1)
         pdf.cell(25, 5, str(sale["quantity"]), border=1)
-        pdf.cell(30, 5, f"${sale['price']:.2f}", border=1)
-        pdf.cell(30, 5, f"${sale['total']:.2f}", border=1, ln=True)
+        pdf.cell(30, 5, format_money(from_cents(sale["price_cents"]), currency), border=1)
+        pdf.cell(30, 5, format_money(from_cents(sale["total_cents"]), currency), border=1, ln=True)
         
         pdf.ln(5)
+        if tax_rate:
+            # Los precios incluyen el impuesto: se desglosa del total cobrado
+            subtotal_cents = int(
+                (Decimal(sale["total_cents"]) * 100 / (100 + tax_rate)).quantize(Decimal("1"), rounding=ROUND_HALF_UP)
+            )
+            pdf.set_font("Arial", "", 10)
+            pdf.cell(120, 5, "Subtotal:", border=1)
+            pdf.cell(30, 5, format_money(from_cents(subtotal_cents), currency), border=1, ln=True)
+            pdf.cell(120, 5, f"Impuesto ({tax_rate.normalize():f}%):", border=1)
+            pdf.cell(
+                30, 5, format_money(from_cents(sale["total_cents"] - subtotal_cents), currency), border=1, ln=True
+            )
         pdf.set_font("Arial", "B", 10)
         pdf.cell(120, 5, "TOTAL:", border=1)
-        pdf.cell(30, 5, f"${sale['total']:.2f}", border=1, ln=True)
+        pdf.cell(30, 5, format_money(from_cents(sale["total_cents"]), currency), border=1, ln=True)
         
         pdf.ln(5)
         pdf.cell(0, 5, f"Metodo de Pago: {pdf_safe(sale['payment_method'])}", ln=True)
@@ -1423,6 +4572,7 @@ def get_invoice(sale_id):
 
 
 init_db()
+build_static_assets()
 
 
 if __name__ == "__main__":
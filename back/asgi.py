@@ -0,0 +1,23 @@
+"""Entrada ASGI opcional: `uvicorn back.asgi:app --host 0.0.0.0 --port 5000`.
+
+Es un puente WSGI -> ASGI, no una app async: a2wsgi.WSGIMiddleware corre la misma app Flask
+de back/app.py en un pool de ASGI_THREADS hilos (la app WSGI sigue disponible para gunicorn).
+Lo que gana es que el event loop acepta las conexiones y cada request ocupa un hilo solo
+mientras corre, asi un envio SMTP o un PDF lento no bloquea a los demas. El cuerpo del
+request se lee por partes, las respuestas generadoras (SSE, export) se envian chunk por
+chunk y cada header de la respuesta va como su propio par (varios Set-Cookie no se juntan).
+"""
+import os
+import sys
+
+from a2wsgi import WSGIMiddleware
+
+try:
+    from back.app import app as wsgi_app
+except ImportError:
+    sys.path.insert(0, os.path.dirname(__file__))
+    from app import app as wsgi_app
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "64"))
+
+app = WSGIMiddleware(wsgi_app, workers=ASGI_THREADS)
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""Benchmark reproducible de la API (in-process con el test client o HTTP contra gunicorn).
+
+Ejemplos:
+    python bench_api.py --size 1k
+    python bench_api.py --size 100k --concurrency 8 --requests 100
+    python bench_api.py --mode http --url http://localhost:5000 --db back/data/inventory.db --size 1k
+    python bench_api.py --mode http --server gunicorn --size 1k
+    python bench_api.py --mode http --server uvicorn --size 1k
+    python bench_api.py --compare bench_results/a.json bench_results/b.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(ROOT_DIR, "bench_results")
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+SCENARIOS = [
+    "list_items", "list_sales", "store_items", "store_catalog", "create_sale", "get_invoice", "bulk_items",
+]
+PAYMENT_METHODS = ["Efectivo", "Yappy"]
+# Tienda propia del benchmark: los usuarios se registran en ella con storeCode
+BENCH_STORE_ID = "bench-store"
+BENCH_STORE_CODE = "BENCH-STORE"
+
+# Servidores que --server levanta para comparar el modo sync (WSGI) contra el ASGI
+SERVER_COMMANDS = {
+    "gunicorn": [
+        "gunicorn", "back.app:app", "--workers", "{workers}", "--threads", "4", "--bind", "127.0.0.1:{port}",
+    ],
+    "uvicorn": ["uvicorn", "back.asgi:app", "--host", "127.0.0.1", "--port", "{port}", "--no-access-log"],
+}
+
+
+def seed_database(db_path, count, seed=42):
+    """Insertar `count` items y `count` ventas sinteticos directamente en SQLite (tienda de benchmark)"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute(
+            "INSERT OR IGNORE INTO stores (id, name, join_code, created_at) VALUES (?, ?, ?, ?)",
+            (BENCH_STORE_ID, "Benchmark", BENCH_STORE_CODE, now.isoformat()),
+        )
+        conn.execute("DELETE FROM sales WHERE store_id = ?", (BENCH_STORE_ID,))
+        conn.execute("DELETE FROM items WHERE store_id = ?", (BENCH_STORE_ID,))
+        item_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(count)]
+        batch = 10_000
+        for start in range(0, count, batch):
+            rows = []
+            for index in range(start, min(start + batch, count)):
+                price_cents = rng.randint(100, 50_000)
+                rows.append(
+                    (
+                        item_ids[index],
+                        BENCH_STORE_ID,
+                        f"Producto {index}",
+                        f"SKU-{index:07d}",
+                        rng.randint(0, 500),
+                        f"Estante {rng.randint(1, 40)}",
+                        price_cents,
+                        int(price_cents * rng.uniform(0.4, 0.9)),
+                        rng.randint(1, 20),
+                        "",
+                        "",
+                        "Nuevo",
+                        int((now - timedelta(minutes=index)).timestamp() * 1000),
+                    )
+                )
+            conn.executemany(
+                """
+                INSERT INTO items
+                (id, store_id, name, sku, quantity, location, price_cents, cost_unit_cents, threshold, description,
+                 image_url, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+
+        sale_ids = []
+        for start in range(0, count, batch):
+            rows = []
+            for index in range(start, min(start + batch, count)):
+                sale_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                sale_ids.append(sale_id)
+                quantity = rng.randint(1, 5)
+                price_cents = rng.randint(100, 50_000)
+                cost_unit_cents = int(price_cents * rng.uniform(0.4, 0.9))
+                rows.append(
+                    (
+                        sale_id,
+                        BENCH_STORE_ID,
+                        rng.choice(item_ids),
+                        quantity,
+                        price_cents,
+                        price_cents * quantity,
+                        cost_unit_cents,
+                        (price_cents - cost_unit_cents) * quantity,
+                        rng.choice(PAYMENT_METHODS),
+                        int((now - timedelta(minutes=index * 3)).timestamp() * 1000),
+                    )
+                )
+            conn.executemany(
+                """
+                INSERT INTO sales
+                (id, store_id, item_id, quantity, price_cents, total_cents, cost_unit_cents, gain_cents, payment_method,
+                 created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return item_ids, sale_ids
+
+
+class InProcessClient:
+    """Cliente por hilo sobre app.test_client() con la misma interfaz que HttpClient"""
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, headers=None, json_body=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers, json=json_body)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip("/")
+        self.local = threading.local()
+        self.requests = requests
+
+    def request(self, method, path, headers=None, json_body=None):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        response = session.request(method, self.base_url + path, headers=headers, json=json_body)
+        return response.status_code, response.content
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, data_dir, workers=1):
+    """Levantar gunicorn o uvicorn con una BD temporal y esperar a /api/health"""
+    import requests
+
+    port = free_port()
+    command = [part.format(port=port, workers=workers) for part in SERVER_COMMANDS[name]]
+    # Sin tareas de mantenimiento en medio de las mediciones
+    env = dict(os.environ, APP_DATA_DIR=data_dir, SCHEDULER_ENABLED="0")
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{name} termino con codigo {process.returncode}")
+        try:
+            if requests.get(base_url + "/api/health", timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f"{name} no respondio en 30s")
+
+
+def authenticate(client):
+    username = f"bench-{uuid.uuid4().hex[:8]}"
+    status, body = client.request(
+        "POST",
+        "/api/auth/register",
+        json_body={
+            "username": username,
+            "password": "bench1234",
+            "email": f"{username}@example.com",
+            "storeCode": BENCH_STORE_CODE,
+        },
+    )
+    data = json.loads(body or b"{}")
+    if status not in (200, 201) or not data.get("token"):
+        raise SystemExit(f"No se pudo crear usuario de benchmark ({status}): {body[:200]!r}")
+    return {"Authorization": f"Bearer {data['token']}"}
+
+
+def build_requests(scenario, item_ids, sale_ids, rng, bulk_size):
+    """Devuelve una funcion que genera (method, path, json_body) para cada request"""
+    if scenario == "list_items":
+        return lambda: ("GET", "/api/items", None)
+    if scenario == "list_sales":
+        return lambda: ("GET", "/api/sales", None)
+    if scenario == "store_items":
+        return lambda: ("GET", f"/api/store/items?store={BENCH_STORE_ID}", None)
+    if scenario == "store_catalog":
+        return lambda: ("GET", f"/api/store/catalog?store={BENCH_STORE_ID}&page={rng.randint(1, 5)}", None)
+    if scenario == "create_sale":
+        return lambda: (
+            "POST",
+            "/api/sales",
+            {
+                "itemId": rng.choice(item_ids),
+                "quantity": 1,
+                "price": round(rng.uniform(1, 500), 2),
+                "paymentMethod": rng.choice(PAYMENT_METHODS),
+            },
+        )
+    if scenario == "get_invoice":
+        return lambda: ("GET", f"/api/sales/{rng.choice(sale_ids)}/invoice", None)
+    if scenario == "bulk_items":
+        payload = {
+            "items": [
+                {
+                    "id": item_ids[index],
+                    "name": f"Producto {index}",
+                    "sku": f"SKU-{index:07d}",
+                    "quantity": 100,
+                    "location": "Estante 1",
+                    "price": 10,
+                    "costUnit": 5,
+                    "threshold": 5,
+                }
+                for index in range(min(bulk_size, len(item_ids)))
+            ]
+        }
+        return lambda: ("POST", "/api/items/bulk", payload)
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(client, scenario, next_request, headers, total_requests, concurrency):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(_):
+        nonlocal errors
+        method, path, body = next_request()
+        started = time.perf_counter()
+        try:
+            status, _ = client.request(method, path, headers=headers, json_body=body)
+            ok = status < 400
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(total_requests)))
+    wall = time.perf_counter() - wall_started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "requests": total_requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "wallSeconds": round(wall, 4),
+        "reqPerSec": round(total_requests / wall, 2) if wall else 0.0,
+        "p50Ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95Ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99Ms": round(percentile(latencies, 99) * 1000, 3),
+        "maxMs": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def print_results(results):
+    print(f"\n{'scenario':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for row in results:
+        print(
+            f"{row['scenario']:<14}{row['reqPerSec']:>10}{row['p50Ms']:>10}"
+            f"{row['p95Ms']:>10}{row['p99Ms']:>10}{row['errors']:>8}"
+        )
+
+
+def compare(old_path, new_path):
+    with open(old_path) as fh:
+        old = {row["scenario"]: row for row in json.load(fh)["results"]}
+    with open(new_path) as fh:
+        new_report = json.load(fh)
+    print(f"{'scenario':<14}{'req/s':>22}{'p95 ms':>24}")
+    for row in new_report["results"]:
+        base = old.get(row["scenario"])
+        if not base:
+            continue
+
+        def delta(field):
+            if not base[field]:
+                return "n/a"
+            return f"{(row[field] - base[field]) / base[field] * 100:+.1f}%"
+
+        print(
+            f"{row['scenario']:<14}{base['reqPerSec']:>8} -> {row['reqPerSec']:<8}{delta('reqPerSec'):>6}"
+            f"{base['p95Ms']:>9} -> {row['p95Ms']:<8}{delta('p95Ms'):>6}"
+        )
+
+
+def run_all(client, scenarios, headers, item_ids, sale_ids, rng, args):
+    results = []
+    for scenario in scenarios:
+        if scenario in ("create_sale", "bulk_items") and not item_ids:
+            print(f"  {scenario}: sin items, se omite")
+            continue
+        if scenario == "get_invoice" and not sale_ids:
+            print(f"  {scenario}: sin ventas, se omite")
+            continue
+        next_request = build_requests(scenario, item_ids, sale_ids, rng, args.bulk_size)
+        print(f"  {scenario}...")
+        results.append(
+            run_scenario(client, scenario, next_request, headers, args.requests, args.concurrency)
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la API de Plus Control")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", default="http://localhost:5000", help="Base URL en modo http")
+    parser.add_argument("--db", help="Ruta de la BD a sembrar en modo http (la del servidor)")
+    parser.add_argument(
+        "--server",
+        choices=sorted(SERVER_COMMANDS),
+        help="En modo http, levantar este servidor con una BD temporal en vez de usar --url",
+    )
+    parser.add_argument("--size", choices=sorted(SIZES), default="1k")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--workers", type=int, default=1, help="Workers de gunicorn con --server gunicorn")
+    parser.add_argument("--requests", type=int, default=200, help="Requests por escenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--bulk-size", type=int, default=100, help="Items por request en bulk_items")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Archivo JSON de resultados (por defecto bench_results/)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    # bulk_items reemplaza todo el inventario, siempre al final
+    scenarios.sort(key=lambda name: name == "bulk_items")
+
+    count = SIZES[args.size]
+    server_process = None
+    if args.mode == "inprocess":
+        data_dir = tempfile.mkdtemp(prefix="plus-control-bench-")
+        os.environ["APP_DATA_DIR"] = data_dir
+        os.environ["SCHEDULER_ENABLED"] = "0"
+        sys.path.insert(0, ROOT_DIR)
+        from back.app import app, DB_PATH
+
+        db_path = DB_PATH
+        client = InProcessClient(app)
+    elif args.server:
+        data_dir = tempfile.mkdtemp(prefix="plus-control-bench-")
+        server_process, args.url = start_server(args.server, data_dir, args.workers)
+        db_path = os.path.join(data_dir, "inventory.db")
+        client = HttpClient(args.url)
+    else:
+        db_path = args.db
+        client = HttpClient(args.url)
+
+    item_ids, sale_ids = [], []
+    if db_path:
+        print(f"Sembrando {count} items y {count} ventas en {db_path}...")
+        started = time.perf_counter()
+        item_ids, sale_ids = seed_database(db_path, count, seed=args.seed)
+        print(f"  listo en {time.perf_counter() - started:.1f}s")
+    else:
+        print("Sin --db: se usan los datos existentes del servidor")
+
+    headers = authenticate(client)
+    if not item_ids:
+        status, body = client.request("GET", "/api/items", headers=headers)
+        item_ids = [item["id"] for item in json.loads(body or b"[]")]
+        status, body = client.request("GET", "/api/sales", headers=headers)
+        sale_ids = [sale["id"] for sale in json.loads(body or b"[]")]
+
+    rng = random.Random(args.seed)
+    results = []
+    try:
+        results = run_all(client, scenarios, headers, item_ids, sale_ids, rng, args)
+    finally:
+        if server_process:
+            server_process.terminate()
+            server_process.wait(timeout=10)
+
+    print_results(results)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "mode": args.mode,
+        "url": args.url if args.mode == "http" else None,
+        "server": args.server,
+        "workers": args.workers if args.server == "gunicorn" else None,
+        "size": args.size,
+        "rows": count,
+        "concurrency": args.concurrency,
+        "requestsPerScenario": args.requests,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['commit']}-{args.mode}-{args.size}.json")
+    with open(output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nResultados guardados en {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Benchmark de las rutas masivas de items: import (fila por fila, executemany, execute_values, COPY)
+y export (SELECT + csv contra COPY TO STDOUT). Mide filas/seg.
+
+Usa Postgres si DATABASE_URL esta definido; si no, una BD SQLite temporal.
+
+Ejemplos:
+    python bench_bulk.py --rows 100000
+    DATABASE_URL=postgresql://localhost/inventario python bench_bulk.py --rows 100000
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_STORE_ID = "bench-bulk-store"
+
+
+def make_items(app_module, count, seed):
+    rng = random.Random(seed)
+    items = []
+    for index in range(count):
+        price_cents = rng.randint(100, 50_000)
+        item, _ = app_module.parse_item(
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "name": f"Producto {index}",
+                "sku": f"SKU-{index:07d}",
+                "quantity": rng.randint(0, 500),
+                "location": f"Estante {rng.randint(1, 40)}",
+                "price": app_module.from_cents(price_cents),
+                "costUnit": app_module.from_cents(int(price_cents * rng.uniform(0.4, 0.9))),
+                "threshold": rng.randint(1, 20),
+            }
+        )
+        items.append(item)
+    return items
+
+
+def items_csv(app_module, items):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(app_module.ITEM_EXPORT_COLUMNS)
+    for item in items:
+        row = app_module.ItemsRepo(None, BENCH_STORE_ID).row(item)
+        writer.writerow(row[:1] + row[2:])
+    return out.getvalue().encode("utf-8")
+
+
+def upsert_sql(app_module):
+    placeholders = ", ".join("?" for _ in app_module.ITEM_COLUMNS)
+    return (
+        f"INSERT INTO items ({', '.join(app_module.ITEM_COLUMNS)}) VALUES ({placeholders}) "
+        f"{app_module.ITEM_UPSERT_CONFLICT_SQL}"
+    )
+
+
+def import_rows(app_module, repo, items, payload):
+    # Enfoque anterior: una sentencia por item
+    sql = upsert_sql(app_module)
+    for item in items:
+        repo.conn.execute(sql, repo.row(item))
+
+
+def import_executemany(app_module, repo, items, payload):
+    # En Postgres executemany del wrapper va por execute_batch
+    repo.conn.executemany(upsert_sql(app_module), [repo.row(item) for item in items])
+
+
+def import_execute_values(app_module, repo, items, payload):
+    repo.upsert_many(items)
+
+
+def import_copy(app_module, repo, items, payload):
+    repo.import_csv(io.BytesIO(payload))
+
+
+def export_select(app_module, repo):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(app_module.ITEM_EXPORT_COLUMNS)
+    rows = repo.conn.execute(
+        f"SELECT {', '.join(app_module.ITEM_EXPORT_COLUMNS)} FROM items WHERE store_id = ? ORDER BY id",
+        (BENCH_STORE_ID,),
+    ).fetchall()
+    for row in rows:
+        writer.writerow([row[column] for column in app_module.ITEM_EXPORT_COLUMNS])
+    return len(out.getvalue())
+
+
+def export_copy(app_module, repo):
+    out = io.BytesIO()
+    repo.export_csv(out)
+    return len(out.getvalue())
+
+
+def run(app_module, count, seed, repeat):
+    items = make_items(app_module, count, seed)
+    payload = items_csv(app_module, items)
+    importers = [("rows", import_rows), ("executemany", import_executemany)]
+    if app_module.USE_POSTGRES:
+        importers.append(("execute_values", import_execute_values))
+    importers.append(("copy" if app_module.USE_POSTGRES else "csv_import", import_copy))
+
+    results = []
+    for name, importer in importers:
+        timings = []
+        for _ in range(repeat):
+            with app_module.write_transaction() as conn:
+                repo = app_module.ItemsRepo(conn, BENCH_STORE_ID)
+                repo.clear()
+                started = time.perf_counter()
+                importer(app_module, repo, items, payload)
+                timings.append(time.perf_counter() - started)
+        best = min(timings)
+        results.append({"path": f"import:{name}", "rows": count, "seconds": round(best, 4), "rowsPerSec": round(count / best)})
+        print(f"  import:{name:<16} {count / best:>12,.0f} filas/s")
+
+    for name, exporter in (("select", export_select), ("copy" if app_module.USE_POSTGRES else "stream", export_copy)):
+        timings = []
+        for _ in range(repeat):
+            with app_module.get_db() as conn:
+                started = time.perf_counter()
+                exporter(app_module, app_module.ItemsRepo(conn, BENCH_STORE_ID))
+                timings.append(time.perf_counter() - started)
+        best = min(timings)
+        results.append({"path": f"export:{name}", "rows": count, "seconds": round(best, 4), "rowsPerSec": round(count / best)})
+        print(f"  export:{name:<16} {count / best:>12,.0f} filas/s")
+
+    with app_module.write_transaction() as conn:
+        app_module.ItemsRepo(conn, BENCH_STORE_ID).clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de import/export masivo de items")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3, help="Se reporta la mejor de N corridas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    data_dir = None
+    if not os.getenv("DATABASE_URL"):
+        data_dir = tempfile.mkdtemp(prefix="bench-bulk-")
+        os.environ["APP_DATA_DIR"] = data_dir
+    sys.path.insert(0, ROOT_DIR)
+    from back import app as app_module
+
+    backend = "postgres" if app_module.USE_POSTGRES else "sqlite"
+    print(f"{args.rows:,} items en {backend}")
+    results = run(app_module, args.rows, args.seed, args.repeat)
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "backend": backend,
+            "python": platform.python_version(),
+            "results": results,
+        }
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
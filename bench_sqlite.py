@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Benchmark del perfil de SQLite (SQLITE_PRAGMAS): lecturas y escrituras por segundo sin
+ajustes, con cada PRAGMA por separado y con el perfil completo.
+
+Conviene correrlo sobre el mismo disco que usa la app (en Render, el disco de 1 GB montado
+en APP_DATA_DIR), porque mmap y cache_size dependen de la memoria y del disco.
+
+Ejemplos:
+    python bench_sqlite.py --size 100k
+    python bench_sqlite.py --size 100k --db-dir /var/data/bench --seconds 10
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+from bench_api import BENCH_STORE_ID, SIZES, seed_database
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def connect(db_path, pragmas, tune):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    tune(conn, pragmas)
+    return conn
+
+
+def read_workload(conn, item_ids, rng, deadline):
+    """Mezcla de lecturas de la app: item por id, pagina del catalogo y totales de ventas"""
+    ops = 0
+    while time.perf_counter() < deadline:
+        conn.execute("SELECT * FROM items WHERE id = ?", (rng.choice(item_ids),)).fetchone()
+        conn.execute(
+            "SELECT * FROM items WHERE store_id = ? AND quantity > 0 LIMIT 48 OFFSET ?",
+            (BENCH_STORE_ID, rng.randint(0, len(item_ids) // 2)),
+        ).fetchall()
+        conn.execute(
+            """
+            SELECT SUM(total_cents), COUNT(*) FROM sales
+            WHERE store_id = ? AND created_at >= ?
+            """,
+            (BENCH_STORE_ID, int(time.time() * 1000) - rng.randint(1, 7) * 86_400_000),
+        ).fetchone()
+        ops += 3
+    return ops
+
+
+def write_workload(conn, item_ids, rng, deadline):
+    """Ventas como las de POST /api/sales: venta + stock + movimiento en una transaccion"""
+    ops = 0
+    while time.perf_counter() < deadline:
+        item_id = rng.choice(item_ids)
+        # Fecha antigua: las ventas del benchmark no entran en la ventana de read_workload
+        created_at = ops
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            """
+            INSERT INTO sales
+            (id, store_id, item_id, quantity, price_cents, total_cents, cost_unit_cents, gain_cents, payment_method, created_at)
+            VALUES (?, ?, ?, 1, 100, 100, 50, 50, 'Efectivo', ?)
+            """,
+            (str(uuid.uuid4()), BENCH_STORE_ID, item_id, created_at),
+        )
+        conn.execute("UPDATE items SET quantity = quantity + 0 WHERE id = ?", (item_id,))
+        conn.execute(
+            "INSERT INTO stock_movements (store_id, item_id, kind, delta, created_at) VALUES (?, ?, 'sale', 0, ?)",
+            (BENCH_STORE_ID, item_id, created_at),
+        )
+        conn.execute("COMMIT")
+        ops += 1
+    return ops
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del perfil de PRAGMAs de SQLite")
+    parser.add_argument("--size", choices=sorted(SIZES), default="100k")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duracion de cada carga por perfil")
+    parser.add_argument("--db-dir", help="Directorio de la BD de prueba (por defecto uno temporal)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    data_dir = args.db_dir or tempfile.mkdtemp(prefix="bench-sqlite-")
+    os.makedirs(data_dir, exist_ok=True)
+    os.environ["APP_DATA_DIR"] = data_dir
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    sys.path.insert(0, ROOT_DIR)
+    from back import app as app_module
+
+    count = SIZES[args.size]
+    print(f"Sembrando {count:,} items y ventas en {app_module.DB_PATH}...")
+    seed_database(app_module.DB_PATH, count, seed=args.seed)
+    conn = sqlite3.connect(app_module.DB_PATH)
+    item_ids = [row[0] for row in conn.execute("SELECT id FROM items WHERE store_id = ?", (BENCH_STORE_ID,))]
+    conn.close()
+
+    profiles = [("baseline", ())]
+    profiles += [(name, ((name, value),)) for name, value in app_module.SQLITE_PRAGMAS]
+    profiles.append(("all", app_module.SQLITE_PRAGMAS))
+
+    results = []
+    print(f"\n{'profile':<20} {'reads/s':>10} {'writes/s':>10}")
+    for name, pragmas in profiles:
+        rng = random.Random(args.seed)
+        conn = connect(app_module.DB_PATH, pragmas, app_module.tune_sqlite_connection)
+        try:
+            # Calentar la cache de la conexion antes de medir
+            read_workload(conn, item_ids, rng, time.perf_counter() + min(1.0, args.seconds / 5))
+            reads = read_workload(conn, item_ids, rng, time.perf_counter() + args.seconds)
+            writes = write_workload(conn, item_ids, rng, time.perf_counter() + args.seconds)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        result = {
+            "profile": name,
+            "pragmas": dict(pragmas),
+            "readsPerSec": round(reads / args.seconds, 1),
+            "writesPerSec": round(writes / args.seconds, 1),
+        }
+        results.append(result)
+        print(f"{name:<20} {result['readsPerSec']:>10,.1f} {result['writesPerSec']:>10,.1f}")
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "size": args.size,
+            "dbDir": data_dir,
+            "sqlite": sqlite3.sqlite_version,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+    if not args.db_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
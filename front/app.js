@@ -9,6 +9,18 @@ const locationInput = document.getElementById("location");
 const priceInput = document.getElementById("price");
 const costUnitInput = document.getElementById("costUnit");
 const thresholdInput = document.getElementById("threshold");
+const imageFileInput = document.getElementById("imageFile");
+const imageUrlInput = document.getElementById("imageUrl");
+const statusInput = document.getElementById("status");
+const imageHint = document.getElementById("imageHint");
+const settingsForm = document.getElementById("settingsForm");
+const settingStoreName = document.getElementById("settingStoreName");
+const settingWhatsapp = document.getElementById("settingWhatsapp");
+const settingCurrency = document.getElementById("settingCurrency");
+const settingTaxRate = document.getElementById("settingTaxRate");
+const settingJoinCode = document.getElementById("settingJoinCode");
+const settingInviteLink = document.getElementById("settingInviteLink");
+const settingStoreLink = document.getElementById("settingStoreLink");
 const saveBtn = document.getElementById("saveBtn");
 const cancelEditBtn = document.getElementById("cancelEdit");
 
@@ -17,6 +29,7 @@ const lowOnlyInput = document.getElementById("lowOnly");
 const sortByInput = document.getElementById("sortBy");
 
 const inventoryBody = document.getElementById("inventoryBody");
+const inventoryWrap = document.getElementById("inventoryWrap");
 const statItems = document.getElementById("statItems");
 const statUnits = document.getElementById("statUnits");
 const statLow = document.getElementById("statLow");
@@ -49,7 +62,6 @@ const weeklyUnits = document.getElementById("weeklyUnits");
 const weeklyByPayment = document.getElementById("weeklyByPayment");
 
 const exportBtn = document.getElementById("exportCsv");
-const backupBtn = document.getElementById("backupBtn");
 const importInput = document.getElementById("importCsv");
 
 const saleForm = document.getElementById("saleForm");
@@ -72,6 +84,7 @@ const logoutBtn = document.getElementById("logoutBtn");
 const userDisplay = document.getElementById("userDisplay");
 
 let items = [];
+let lowStockItems = [];
 let sales = [];
 let editingId = null;
 
@@ -113,12 +126,12 @@ function showToast(message, type = "info") {
 async function fetchJson(url, options = {}) {
   const token = localStorage.getItem("authToken");
   const response = await fetch(url, {
+    ...options,
     headers: {
       "Content-Type": "application/json",
       "Authorization": `Bearer ${token}`,
       ...(options.headers || {}),
     },
-    ...options,
   });
 
   let data = null;
@@ -139,21 +152,72 @@ async function fetchJson(url, options = {}) {
     const message = data?.error || "Request failed.";
     throw new Error(message);
   }
+  if (response.status === 202 && data?.queued) {
+    showToast("Sin conexión: guardado en cola, se enviará al reconectar", "info");
+  }
   return data;
 }
 
+// Version que el cliente vio antes de editar: el servidor reporta conflicto si cambio
+function editBase(itemId) {
+  const current = items.find((i) => i.id === itemId);
+  return current
+    ? { expectedUpdatedAt: current.updatedAt, expectedQuantity: current.quantity }
+    : {};
+}
+
+// Una edicion = item + su updatedAt nuevo; es tambien el id con que el service worker la encola
+function editKey(item) {
+  return `${item.id}:${item.updatedAt}`;
+}
+
+// Listas grandes en formato columnar: nombres de columna una vez y un array por columna
+function fromColumnar(payload) {
+  if (Array.isArray(payload)) return payload;
+  const { columns, count, data } = payload;
+  const rows = new Array(count);
+  for (let i = 0; i < count; i++) {
+    const row = {};
+    for (let c = 0; c < columns.length; c++) {
+      row[columns[c]] = data[c][i];
+    }
+    rows[i] = row;
+  }
+  return rows;
+}
+
+async function fetchList(path) {
+  return fromColumnar(await fetchJson(`${API_BASE}${path}?format=columnar`));
+}
+
 async function loadItems() {
-  items = await fetchJson(`${API_BASE}/items`);
+  [items, lowStockItems] = await Promise.all([
+    fetchList("/items"),
+    fetchLowStock(),
+  ]);
   syncUI();
 }
 
+// El servidor mantiene el conjunto de stock bajo; el front no recorre el catalogo
+async function fetchLowStock() {
+  const data = await fetchJson(`${API_BASE}/alerts/low-stock`);
+  return data.items;
+}
+
+async function refreshLowStock() {
+  lowStockItems = await fetchLowStock();
+  renderStats();
+}
+
 async function saveItem(item) {
   if (editingId) {
     const updated = await fetchJson(`${API_BASE}/items/${item.id}`, {
       method: "PUT",
-      body: JSON.stringify(item),
+      headers: { "Idempotency-Key": editKey(item) },
+      body: JSON.stringify({ ...item, ...editBase(item.id) }),
     });
     upsertLocal(updated);
+    await refreshLowStock();
     return;
   }
 
@@ -162,6 +226,7 @@ async function saveItem(item) {
     body: JSON.stringify(item),
   });
   upsertLocal(created);
+  await refreshLowStock();
 }
 
 async function updateItem(itemId, updates) {
@@ -170,14 +235,17 @@ async function updateItem(itemId, updates) {
   const updated = { ...item, ...updates, updatedAt: new Date().toISOString() };
   await fetchJson(`${API_BASE}/items/${itemId}`, {
     method: "PUT",
-    body: JSON.stringify(updated),
+    headers: { "Idempotency-Key": editKey(updated) },
+    body: JSON.stringify({ ...updated, ...editBase(itemId) }),
   });
   upsertLocal(updated);
+  await refreshLowStock();
 }
 
 async function deleteItem(id) {
   await fetchJson(`${API_BASE}/items/${id}`, { method: "DELETE" });
   items = items.filter((item) => item.id !== id);
+  lowStockItems = lowStockItems.filter((item) => item.id !== id);
 }
 
 async function replaceAllItems(nextItems) {
@@ -185,6 +253,7 @@ async function replaceAllItems(nextItems) {
     method: "POST",
     body: JSON.stringify({ items: nextItems }),
   });
+  lowStockItems = await fetchLowStock();
 }
 
 function getFormData() {
@@ -198,8 +267,8 @@ function getFormData() {
     costUnit: Number(costUnitInput.value),
     threshold: Number(thresholdInput.value),
     description: "",
-    imageUrl: "",
-    status: "Nuevo",
+    imageUrl: imageUrlInput ? imageUrlInput.value : "",
+    status: statusInput ? statusInput.value : "Nuevo",
     updatedAt: new Date().toISOString(),
   };
 }
@@ -212,13 +281,25 @@ function setFormData(item) {
   priceInput.value = item.price;
   costUnitInput.value = item.costUnit || 0;
   thresholdInput.value = item.threshold;
+  if (imageUrlInput) {
+    imageUrlInput.value = item.imageUrl || "";
+  }
   if (statusInput) {
-    statusInput.value = item.status || "Nuevo";
+    const status = item.status || "Nuevo";
+    // Estados que llegaron por CSV y no estan en el select: se agregan para no perderlos
+    if (![...statusInput.options].some((option) => option.value === status)) {
+      statusInput.add(new Option(status, status));
+    }
+    statusInput.value = status;
   }
 }
 
 function resetForm() {
   form.reset();
+  if (imageUrlInput) {
+    imageUrlInput.value = "";
+    imageHint.textContent = "Optional, shown in the online store";
+  }
   editingId = null;
   itemIdInput.value = "";
   saveBtn.textContent = "Save Item";
@@ -276,7 +357,7 @@ function applyFilters(rawItems) {
 function renderStats() {
   statItems.textContent = items.length.toString();
   const totalUnits = items.reduce((sum, item) => sum + item.quantity, 0);
-  const lowCount = items.filter((item) => item.quantity <= item.threshold).length;
+  const lowCount = lowStockItems.length;
   const totalValue = items.reduce(
     (sum, item) => sum + item.quantity * item.price,
     0
@@ -334,7 +415,7 @@ function updateTrendIndicator(element, current, previous) {
 }
 
 function renderLowStockAlerts() {
-  const lowItems = items.filter(item => item.quantity <= item.threshold).sort((a, b) => a.quantity - b.quantity);
+  const lowItems = lowStockItems;
   
   if (lowItems.length === 0) {
     lowStockPanel.hidden = true;
@@ -374,22 +455,14 @@ async function updateCharts() {
   const today = new Date();
   today.setHours(0, 0, 0, 0);
   const dayLabels = [];
-  const daySalesData = [];
-  
   for (let i = 6; i >= 0; i--) {
     const d = new Date(today);
     d.setDate(d.getDate() - i);
     dayLabels.push(d.toLocaleDateString("en-US", { month: "short", day: "numeric" }));
-    
-    const daySales = sales.filter(s => {
-      const sDate = new Date(s.createdAt);
-      sDate.setHours(0, 0, 0, 0);
-      return sDate.getTime() === d.getTime();
-    });
-    
-    const dayTotal = daySales.reduce((sum, s) => sum + s.total, 0);
-    daySalesData.push(parseFloat(dayTotal.toFixed(2)));
   }
+  const daySalesData = (await dailySalesTotals(today, 7)).map((total) =>
+    parseFloat(total.toFixed(2))
+  );
 
   // Update Weekly Sales Chart
   if (salesChart) {
@@ -507,18 +580,126 @@ async function updateCharts() {
   }
 }
 
-function renderTable() {
-  const view = applyFilters(items);
-  if (view.length === 0) {
-    inventoryBody.innerHTML =
-      "<tr><td colspan='7'>No items found. Add the first item above.</td></tr>";
+// Tabla de inventario virtualizada: el worker devuelve los indices filtrados/ordenados
+// y solo se pintan las filas visibles (mas un margen) entre dos filas espaciadoras.
+const ROW_HEIGHT_FALLBACK = 45;
+const VIRTUAL_OVERSCAN = 10;
+const SEARCH_DEBOUNCE_MS = 150;
+
+let dataWorker = createDataWorker();
+let itemsDirty = true;
+let itemsSnapshot = [];
+let itemsVersion = 0;
+let workerRequestId = 0;
+let tableQuerySeq = 0;
+let currentView = { length: 0, get: () => null };
+let rowHeight = 0;
+let visibleRowsScheduled = false;
+let postedSales = null;
+let postedSalesLength = -1;
+const pendingWorkerReplies = new Map();
+
+function createDataWorker() {
+  if (!window.Worker) return null;
+  try {
+    const url = document.getElementById("dataWorkerUrl")?.getAttribute("href") || "/data-worker.js";
+    const worker = new Worker(url);
+    worker.addEventListener("message", handleWorkerMessage);
+    worker.addEventListener("error", (error) => {
+      console.warn("Data worker failed, filtering on the main thread:", error);
+      dataWorker = null;
+      pendingWorkerReplies.forEach(({ fallback }) => fallback());
+      pendingWorkerReplies.clear();
+      renderTable();
+    });
+    return worker;
+  } catch (error) {
+    console.warn("Data worker unavailable:", error);
+    return null;
+  }
+}
+
+function handleWorkerMessage(event) {
+  const pending = pendingWorkerReplies.get(event.data.requestId);
+  if (!pending) return;
+  pendingWorkerReplies.delete(event.data.requestId);
+  pending.resolve(event.data);
+}
+
+function askWorker(message, fallback) {
+  return new Promise((resolve) => {
+    const requestId = ++workerRequestId;
+    pendingWorkerReplies.set(requestId, { resolve, fallback: () => resolve(fallback()) });
+    dataWorker.postMessage({ ...message, requestId });
+  });
+}
+
+function markItemsChanged() {
+  itemsDirty = true;
+}
+
+// Copia columnar: un array por campo, los numericos como typed arrays
+function postItemsSnapshot() {
+  itemsSnapshot = items.slice();
+  itemsVersion += 1;
+  itemsDirty = false;
+  if (!dataWorker) return;
+  dataWorker.postMessage({
+    type: "items",
+    columns: {
+      name: itemsSnapshot.map((item) => item.name),
+      sku: itemsSnapshot.map((item) => item.sku),
+      location: itemsSnapshot.map((item) => item.location),
+      quantity: Int32Array.from(itemsSnapshot, (item) => item.quantity),
+      threshold: Int32Array.from(itemsSnapshot, (item) => item.threshold),
+      value: Float64Array.from(itemsSnapshot, (item) => item.quantity * item.price),
+      updatedAt: Float64Array.from(itemsSnapshot, (item) => Date.parse(item.updatedAt) || 0),
+    },
+  });
+}
+
+async function renderTable() {
+  if (itemsDirty) {
+    postItemsSnapshot();
+  }
+  if (!dataWorker) {
+    const view = applyFilters(itemsSnapshot);
+    showView({ length: view.length, get: (i) => view[i] });
     return;
   }
 
-  inventoryBody.innerHTML = view
-    .map((item) => {
-      const low = item.quantity <= item.threshold;
-      return `
+  const seq = ++tableQuerySeq;
+  const version = itemsVersion;
+  const snapshot = itemsSnapshot;
+  const fallback = () => ({ indices: null });
+  const reply = await askWorker(
+    {
+      type: "query",
+      version,
+      search: searchInput.value.trim().toLowerCase(),
+      lowOnly: lowOnlyInput.checked,
+      sortBy: sortByInput.value,
+    },
+    fallback
+  );
+  // Respuesta vieja (llego otra consulta o cambiaron los items): descartar
+  if (seq !== tableQuerySeq || version !== itemsVersion) return;
+  if (!reply.indices) {
+    renderTable();
+    return;
+  }
+  const { indices } = reply;
+  showView({ length: indices.length, get: (i) => snapshot[indices[i]] });
+}
+
+function showView(view) {
+  currentView = view;
+  renderVisibleRows();
+}
+
+function renderItemRow(item) {
+  const low = item.quantity <= item.threshold;
+  return `
       <tr>
         <td>${escapeHtml(item.name)} ${low ? "<span class='badge'>Low</span>" : ""}</td>
         <td>${escapeHtml(item.sku)}</td>
@@ -531,8 +712,95 @@ function renderTable() {
           <button class="action-btn danger" data-action="delete" data-id="${item.id}">Delete</button>
         </td>
       </tr>`;
-    })
-    .join("");
+}
+
+function spacerRow(height) {
+  return height > 0 ? `<tr class="spacer-row"><td colspan="7" style="height:${height}px"></td></tr>` : "";
+}
+
+function renderVisibleRows() {
+  const total = currentView.length;
+  if (total === 0) {
+    inventoryBody.innerHTML =
+      "<tr><td colspan='7'>No items found. Add the first item above.</td></tr>";
+    return;
+  }
+
+  const height = rowHeight || ROW_HEIGHT_FALLBACK;
+  const viewport = inventoryWrap ? inventoryWrap.clientHeight : window.innerHeight;
+  const scrollTop = inventoryWrap ? inventoryWrap.scrollTop : 0;
+  const first = Math.max(0, Math.floor(scrollTop / height) - VIRTUAL_OVERSCAN);
+  const last = Math.min(total, first + Math.ceil(viewport / height) + 2 * VIRTUAL_OVERSCAN);
+
+  let rows = "";
+  for (let i = first; i < last; i++) {
+    rows += renderItemRow(currentView.get(i));
+  }
+  inventoryBody.innerHTML = spacerRow(first * height) + rows + spacerRow((total - last) * height);
+
+  // Medir la altura real de una fila la primera vez y recalcular los espaciadores
+  if (!rowHeight) {
+    const sample = inventoryBody.querySelector("tr:not(.spacer-row)");
+    if (sample && sample.offsetHeight) {
+      rowHeight = sample.offsetHeight;
+      if (rowHeight !== height) renderVisibleRows();
+    }
+  }
+}
+
+function scheduleVisibleRows() {
+  if (visibleRowsScheduled) return;
+  visibleRowsScheduled = true;
+  requestAnimationFrame(() => {
+    visibleRowsScheduled = false;
+    renderVisibleRows();
+  });
+}
+
+if (inventoryWrap) {
+  inventoryWrap.addEventListener("scroll", scheduleVisibleRows, { passive: true });
+}
+
+function debounce(fn, wait) {
+  let timer = null;
+  return (...args) => {
+    clearTimeout(timer);
+    timer = setTimeout(() => fn(...args), wait);
+  };
+}
+
+// Totales de venta por dia (hora local) de los ultimos `days` dias, calculados en el worker
+function computeDailyTotals(today, days) {
+  const totals = new Array(days).fill(0);
+  sales.forEach((sale) => {
+    const day = new Date(sale.createdAt);
+    day.setHours(0, 0, 0, 0);
+    const offset = days - 1 - Math.round((today.getTime() - day.getTime()) / 86400000);
+    if (offset >= 0 && offset < days) totals[offset] += sale.total;
+  });
+  return totals;
+}
+
+async function dailySalesTotals(today, days) {
+  if (!dataWorker) {
+    return computeDailyTotals(today, days);
+  }
+  if (sales !== postedSales || sales.length !== postedSalesLength) {
+    postedSales = sales;
+    postedSalesLength = sales.length;
+    dataWorker.postMessage({
+      type: "sales",
+      columns: {
+        createdAt: Float64Array.from(sales, (sale) => Date.parse(sale.createdAt) || 0),
+        total: Float64Array.from(sales, (sale) => sale.total),
+      },
+    });
+  }
+  const reply = await askWorker(
+    { type: "daily", today: today.getTime(), days },
+    () => ({ totals: computeDailyTotals(today, days) })
+  );
+  return Array.from(reply.totals);
 }
 
 function formatDate(iso) {
@@ -609,6 +877,7 @@ async function loadWeeklyReport() {
 }
 
 function syncUI() {
+  markItemsChanged();
   renderStats();
   renderTable();
   updateCharts();
@@ -737,9 +1006,10 @@ inventoryBody.addEventListener("click", async (event) => {
   }
 });
 
-searchInput.addEventListener("input", syncUI);
-lowOnlyInput.addEventListener("change", syncUI);
-sortByInput.addEventListener("change", syncUI);
+// Filtros: solo recalculan la vista, los datos no cambiaron
+searchInput.addEventListener("input", debounce(renderTable, SEARCH_DEBOUNCE_MS));
+lowOnlyInput.addEventListener("change", renderTable);
+sortByInput.addEventListener("change", renderTable);
 
 if (salesToggleBtn) {
   salesToggleBtn.addEventListener("click", () => {
@@ -827,32 +1097,6 @@ if (reportPrintBtn) {
   });
 }
 
-if (backupBtn) {
-  backupBtn.addEventListener("click", async () => {
-    try {
-      const response = await fetch(`${API_BASE}/backup`, {
-        headers: {
-          "Authorization": `Bearer ${authToken}`,
-        },
-      });
-      if (!response.ok) {
-        throw new Error("Backup failed");
-      }
-      const blob = await response.blob();
-      const url = URL.createObjectURL(blob);
-      const link = document.createElement("a");
-      link.href = url;
-      link.download = `backup-${new Date().toISOString().split("T")[0]}.db`;
-      link.click();
-      URL.revokeObjectURL(url);
-      showToast("Base de datos descargada exitosamente", "success");
-    } catch (error) {
-      console.error(error);
-      showToast("Error al descargar backup. Intenta de nuevo.", "error");
-    }
-  });
-}
-
 if (exportBtn) {
   exportBtn.addEventListener("click", () => {
   if (items.length === 0) {
@@ -911,6 +1155,31 @@ if (importInput) {
   });
 }
 
+// La imagen se sube al elegirla; el item guarda solo la URL que devuelve el servidor
+if (imageFileInput) {
+  imageFileInput.addEventListener("change", async (event) => {
+    const file = event.target.files?.[0];
+    if (!file) {
+      return;
+    }
+    imageHint.textContent = "Subiendo imagen...";
+    try {
+      const data = await fetchJson(`${API_BASE}/images`, {
+        method: "POST",
+        headers: { "Content-Type": file.type || "application/octet-stream" },
+        body: file,
+      });
+      imageUrlInput.value = data.url;
+      imageHint.textContent = "Imagen lista";
+    } catch (error) {
+      console.error(error);
+      imageHint.textContent = "Optional, shown in the online store";
+      imageFileInput.value = "";
+      showToast(`Error al subir la imagen: ${error.message}`, "error");
+    }
+  });
+}
+
 function csvEscape(value) {
   if (value === null || value === undefined) {
     return "";
@@ -991,7 +1260,7 @@ function normalizeItem(raw) {
 }
 
 async function loadSales() {
-  sales = await fetchJson(`${API_BASE}/sales`);
+  sales = await fetchList("/sales");
   renderSalesTable();
   await loadWeeklyReport();
   updateCharts();
@@ -1139,9 +1408,12 @@ saleForm.addEventListener("submit", async (event) => {
   }
 
   try {
+    const saleId = crypto.randomUUID();
     await fetchJson(`${API_BASE}/sales`, {
       method: "POST",
+      headers: { "Idempotency-Key": saleId },
       body: JSON.stringify({
+        id: saleId,
         itemId,
         quantity,
         price,
@@ -1180,12 +1452,163 @@ if (logoutBtn) {
     } catch (error) {
       console.error(error);
     }
+    if (eventSource) eventSource.close();
     localStorage.removeItem("authToken");
     localStorage.removeItem("username");
     window.location.href = "/login.html";
   });
 }
 
+// Cambios en vivo de otras cajas: el servidor empuja items y ventas por SSE
+const EVENTS_RETRY_MS = 30000;
+let eventSource = null;
+let lastEventId = "";
+let renderScheduled = false;
+let salesChanged = false;
+let weeklyReportTimer = null;
+
+function scheduleLiveRender() {
+  if (renderScheduled) return;
+  renderScheduled = true;
+  requestAnimationFrame(() => {
+    renderScheduled = false;
+    syncUI();
+    if (salesChanged) {
+      salesChanged = false;
+      renderSalesTable();
+      clearTimeout(weeklyReportTimer);
+      weeklyReportTimer = setTimeout(loadWeeklyReport, 1000);
+    }
+  });
+}
+
+function upsertLowStock(item) {
+  lowStockItems = lowStockItems.filter((i) => i.id !== item.id);
+  lowStockItems.push(item);
+  lowStockItems.sort((a, b) => a.quantity - b.quantity);
+}
+
+const liveEventHandlers = {
+  item(item) {
+    upsertLocal(item);
+    if (lowStockItems.some((i) => i.id === item.id)) {
+      upsertLowStock(item);
+    }
+  },
+  "item-deleted"({ id }) {
+    items = items.filter((item) => item.id !== id);
+    lowStockItems = lowStockItems.filter((item) => item.id !== id);
+  },
+  "low-stock"(item) {
+    upsertLowStock(item);
+  },
+  "stock-recovered"({ id }) {
+    lowStockItems = lowStockItems.filter((item) => item.id !== id);
+  },
+  sale(sale) {
+    if (!sales.some((s) => s.id === sale.id)) {
+      sales.unshift(sale);
+      salesChanged = true;
+    }
+  },
+  settings(settings) {
+    if (settingsForm) setSettingsForm(settings);
+  },
+  "sale-deleted"({ id }) {
+    sales = sales.filter((sale) => sale.id !== id);
+    salesChanged = true;
+  },
+};
+
+// El token de sesion no va en la URL: cada conexion pide un ticket de un solo uso
+async function connectEvents() {
+  if (!window.EventSource) return;
+  let ticket;
+  try {
+    ({ ticket } = await fetchJson(`${API_BASE}/events/ticket`, { method: "POST" }));
+  } catch (error) {
+    setTimeout(connectEvents, EVENTS_RETRY_MS);
+    return;
+  }
+  const params = new URLSearchParams({ ticket });
+  if (lastEventId) params.set("lastEventId", lastEventId);
+  eventSource = new EventSource(`${API_BASE}/events?${params}`);
+
+  Object.entries(liveEventHandlers).forEach(([type, handler]) => {
+    eventSource.addEventListener(type, (event) => {
+      lastEventId = event.lastEventId || lastEventId;
+      handler(JSON.parse(event.data));
+      scheduleLiveRender();
+    });
+  });
+
+  const reloadAll = async (event) => {
+    lastEventId = event.lastEventId || lastEventId;
+    try {
+      await loadItems();
+      await loadSales();
+    } catch (error) {
+      console.error(error);
+    }
+  };
+  eventSource.addEventListener("items-reset", reloadAll);
+  eventSource.addEventListener("reset", reloadAll);
+
+  // La reconexion automatica reusaria el ticket ya canjeado: cerrar y volver a conectar con
+  // uno nuevo (lastEventId va en la URL para recuperar los eventos perdidos)
+  eventSource.onerror = () => {
+    eventSource.close();
+    eventSource = null;
+    setTimeout(connectEvents, EVENTS_RETRY_MS);
+  };
+}
+
+function setSettingsForm(settings) {
+  settingStoreName.value = settings.storeName || "";
+  settingWhatsapp.value = settings.whatsappNumber || "";
+  settingCurrency.value = settings.currency || "USD";
+  settingTaxRate.value = settings.taxRate ?? 0;
+}
+
+// Codigo para unir usuarios a esta tienda y enlace al catalogo publico de esta tienda
+function setStoreLinks(store) {
+  const origin = window.location.origin;
+  settingJoinCode.value = store.joinCode || "";
+  settingInviteLink.value = `${origin}/login.html?${new URLSearchParams({ storeCode: store.joinCode })}`;
+  settingStoreLink.value = `${origin}/tienda.html?${new URLSearchParams({ store: store.id })}`;
+}
+
+async function loadSettings() {
+  if (!settingsForm) return;
+  try {
+    setSettingsForm(await fetchJson(`${API_BASE}/settings`));
+    setStoreLinks(await fetchJson(`${API_BASE}/stores/current`));
+  } catch (error) {
+    // Sin conexion: el formulario queda vacio hasta el proximo evento "settings"
+    console.error(error);
+  }
+}
+
+async function handleSettingsSubmit(event) {
+  event.preventDefault();
+  try {
+    const settings = await fetchJson(`${API_BASE}/settings`, {
+      method: "PUT",
+      body: JSON.stringify({
+        storeName: settingStoreName.value.trim(),
+        whatsappNumber: settingWhatsapp.value.trim(),
+        currency: settingCurrency.value.trim(),
+        taxRate: Number(settingTaxRate.value || 0),
+      }),
+    });
+    setSettingsForm(settings);
+    showToast("Ajustes guardados", "success");
+  } catch (error) {
+    console.error(error);
+    showToast(`Error al guardar ajustes: ${error.message}`, "error");
+  }
+}
+
 // Iniciar aplicación: cargar datos al abrir la página
 async function initializeApp() {
   console.log("=== App Initialization Started ===");
@@ -1219,6 +1642,13 @@ async function initializeApp() {
     console.log("Loading sales...");
     await loadSales();
     console.log("✓ Sales loaded:", sales.length);
+
+    if (settingsForm) {
+      settingsForm.addEventListener("submit", handleSettingsSubmit);
+    }
+    loadSettings();
+
+    connectEvents();
     
     console.log("=== App Ready ===");
   } catch (error) {
@@ -1246,6 +1676,27 @@ async function handleFormSubmit(event) {
   }
 }
 
+// Resultado de reenviar la cola offline (mensajes del service worker)
+function showSyncResult(results) {
+  const conflicts = results.filter((r) => r.status === "conflict" || r.status === "error");
+  if (conflicts.length) {
+    const details = conflicts.map((r) => r.result?.item?.name || r.result?.error).join(", ");
+    showToast(`${conflicts.length} cambios offline no se aplicaron: ${details}`, "error");
+  } else {
+    showToast("Cambios offline sincronizados", "success");
+  }
+}
+
+function showSyncError({ status, error, dropped }) {
+  if (status === 401) {
+    showToast("Sesión vencida: inicia sesión para enviar los cambios offline", "error");
+  } else if (dropped.length) {
+    showToast(`${dropped.length} cambios offline rechazados por el servidor: ${error}`, "error");
+  } else {
+    showToast(`No se pudieron sincronizar los cambios offline: ${error}`, "error");
+  }
+}
+
 // Register Service Worker for PWA
 if ("serviceWorker" in navigator) {
   window.addEventListener("load", () => {
@@ -1281,6 +1732,34 @@ if ("serviceWorker" in navigator) {
   navigator.serviceWorker.addEventListener("controllerchange", () => {
     window.location.reload();
   });
+
+  // Cola offline: el service worker la reenvia en un solo /api/sync al volver la red
+  window.addEventListener("online", () => {
+    const token = localStorage.getItem("authToken");
+    navigator.serviceWorker.controller?.postMessage({
+      type: "REPLAY_QUEUE",
+      auth: token ? `Bearer ${token}` : null,
+    });
+  });
+
+  navigator.serviceWorker.addEventListener("message", async (event) => {
+    const message = event.data || {};
+    if (message.type === "SYNC_RESULT") {
+      showSyncResult(message.results);
+    } else if (message.type === "SYNC_ERROR") {
+      showSyncError(message);
+      // Sin operaciones descartadas la cola sigue igual: se reintenta al volver la red
+      if (!message.dropped.length) return;
+    } else {
+      return;
+    }
+    try {
+      await loadItems();
+      await loadSales();
+    } catch (error) {
+      console.error(error);
+    }
+  });
 }
 
 // Ejecutar cuando el DOM esté listo
@@ -0,0 +1,88 @@
+// Web Worker del dashboard: filtra/ordena el inventario y agrega ventas por dia
+// sobre una copia columnar (un array por campo) para no bloquear el hilo principal.
+
+let itemsColumns = null;
+let salesColumns = null;
+
+function compareText(a, b) {
+  return a.localeCompare(b);
+}
+
+function queryItems({ search, lowOnly, sortBy }) {
+  const cols = itemsColumns;
+  const count = cols.quantity.length;
+  const indices = [];
+  for (let i = 0; i < count; i++) {
+    if (lowOnly && cols.quantity[i] > cols.threshold[i]) continue;
+    if (
+      search &&
+      !cols.nameLower[i].includes(search) &&
+      !cols.skuLower[i].includes(search) &&
+      !cols.locationLower[i].includes(search)
+    ) {
+      continue;
+    }
+    indices.push(i);
+  }
+
+  switch (sortBy) {
+    case "name":
+      indices.sort((a, b) => compareText(cols.name[a], cols.name[b]));
+      break;
+    case "quantity":
+      indices.sort((a, b) => cols.quantity[b] - cols.quantity[a]);
+      break;
+    case "value":
+      indices.sort((a, b) => cols.value[b] - cols.value[a]);
+      break;
+    default:
+      indices.sort((a, b) => cols.updatedAt[b] - cols.updatedAt[a]);
+  }
+  return Int32Array.from(indices);
+}
+
+// Totales por dia local para los ultimos `days` dias terminando en `today` (ms, 00:00 local)
+function dailyTotals({ today, days }) {
+  const totals = new Float64Array(days);
+  const first = new Date(today);
+  first.setDate(first.getDate() - (days - 1));
+  const firstMs = first.getTime();
+  const { createdAt, total } = salesColumns;
+  for (let i = 0; i < createdAt.length; i++) {
+    if (createdAt[i] < firstMs) continue;
+    const day = new Date(createdAt[i]);
+    day.setHours(0, 0, 0, 0);
+    // Con cambio de horario un dia no dura 24h: redondear
+    const offset = Math.round((day.getTime() - firstMs) / 86400000);
+    if (offset >= 0 && offset < days) totals[offset] += total[i];
+  }
+  return totals;
+}
+
+self.addEventListener("message", (event) => {
+  const message = event.data;
+  switch (message.type) {
+    case "items":
+      itemsColumns = message.columns;
+      itemsColumns.nameLower = itemsColumns.name.map((v) => v.toLowerCase());
+      itemsColumns.skuLower = itemsColumns.sku.map((v) => v.toLowerCase());
+      itemsColumns.locationLower = itemsColumns.location.map((v) => v.toLowerCase());
+      break;
+    case "sales":
+      salesColumns = message.columns;
+      break;
+    case "query": {
+      const indices = itemsColumns ? queryItems(message) : new Int32Array(0);
+      self.postMessage(
+        { type: "query", requestId: message.requestId, version: message.version, indices },
+        [indices.buffer]
+      );
+      break;
+    }
+    case "daily": {
+      const totals = salesColumns ? dailyTotals(message) : new Float64Array(message.days);
+      self.postMessage({ type: "daily", requestId: message.requestId, totals }, [totals.buffer]);
+      break;
+    }
+  }
+});
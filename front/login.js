@@ -15,6 +15,7 @@ const registerUsername = document.getElementById("registerUsername");
 const registerEmail = document.getElementById("registerEmail");
 const registerPassword = document.getElementById("registerPassword");
 const registerPasswordConfirm = document.getElementById("registerPasswordConfirm");
+const registerStoreCode = document.getElementById("registerStoreCode");
 const verifyEmail = document.getElementById("verifyEmail");
 const verifyCode = document.getElementById("verifyCode");
 const resendCodeBtn = document.getElementById("resendCodeBtn");
@@ -76,8 +77,14 @@ if (token) {
   window.location.href = "/";
 }
 
-// Inicializar formularios
-showLogin();
+// Inicializar formularios; un enlace de invitacion (/login.html?storeCode=...) abre el registro
+const inviteCode = new URLSearchParams(window.location.search).get("storeCode");
+if (inviteCode) {
+  registerStoreCode.value = inviteCode;
+  showRegister();
+} else {
+  showLogin();
+}
 
 loginTab.addEventListener("click", () => {
   showLogin();
@@ -139,6 +146,8 @@ registerForm.addEventListener("submit", async (event) => {
   const email = registerEmail.value.trim().toLowerCase();
   const password = registerPassword.value.trim();
   const passwordConfirm = registerPasswordConfirm.value.trim();
+  // Sin codigo se crea una tienda nueva; con el codigo de otra tienda se comparte su inventario
+  const storeCode = registerStoreCode.value.trim();
 
   if (!username || !email || !password || !passwordConfirm) {
     registerError.textContent = "Please fill in all fields.";
@@ -159,7 +168,7 @@ registerForm.addEventListener("submit", async (event) => {
     const response = await fetch(`${API_BASE}/auth/register`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ username, email, password }),
+      body: JSON.stringify({ username, email, password, ...(storeCode && { storeCode }) }),
     });
 
     const data = await readApiPayload(response);
@@ -1,3 +1,4 @@
+// CACHE_NAME y urlsToCache se regeneran en el backend desde el manifest de assets
 const CACHE_NAME = 'plus-control-v2';
 const urlsToCache = [
   '/',
@@ -13,6 +14,10 @@ self.addEventListener('message', (event) => {
   if (event.data && event.data.type === 'SKIP_WAITING') {
     self.skipWaiting();
   }
+  if (event.data && event.data.type === 'REPLAY_QUEUE') {
+    // La pagina manda su token actual: la cola puede tener el de una sesion ya cerrada
+    event.waitUntil(replayQueue(event.data.auth));
+  }
 });
 
 // Install service worker and cache files
@@ -27,6 +32,223 @@ self.addEventListener('install', (event) => {
   );
 });
 
+// ---------------------------------------------------------------------------
+// Modo offline del POS: replicas de /api/items y /api/sales en IndexedDB y una cola de
+// ventas/ediciones que se reproduce en un solo POST /api/sync al volver la conexion.
+// Las ventas llevan id generado en el cliente, asi reenviar la cola nunca duplica.
+// ---------------------------------------------------------------------------
+const OFFLINE_DB_NAME = 'plus-control-offline';
+const REPLICATED_URLS = ['/api/items', '/api/sales'];
+const LOW_STOCK_URL = '/api/alerts/low-stock';
+const SYNC_URL = '/api/sync';
+const SYNC_BATCH_SIZE = 500;
+const SYNC_TAG = 'replay-queue';
+
+function openOfflineDb() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(OFFLINE_DB_NAME, 1);
+    request.onupgradeneeded = () => {
+      const db = request.result;
+      db.createObjectStore('replicas');
+      db.createObjectStore('queue', { keyPath: 'seq', autoIncrement: true });
+    };
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+async function withStore(storeName, mode, callback) {
+  const db = await openOfflineDb();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(storeName, mode);
+    const result = callback(tx.objectStore(storeName));
+    tx.oncomplete = () => resolve(result && 'result' in result ? result.result : result);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+const readReplica = (url) => withStore('replicas', 'readonly', (store) => store.get(url));
+const writeReplica = (url, data) => withStore('replicas', 'readwrite', (store) => store.put(data, url));
+
+// Id aleatorio de este dispositivo, guardado junto a las replicas: los seq de la cola son
+// autoincrementales y se repiten entre dispositivos, no sirven solos como clave
+async function deviceId() {
+  let id = await readReplica('device-id');
+  if (!id) {
+    id = self.crypto.randomUUID();
+    await writeReplica('device-id', id);
+  }
+  return id;
+}
+
+async function sha256Hex(text) {
+  const digest = await self.crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+function notifyClients(message) {
+  return self.clients.matchAll().then((clients) => clients.forEach((client) => client.postMessage(message)));
+}
+
+function jsonResponse(data, status = 200) {
+  return new Response(JSON.stringify(data), {
+    status,
+    headers: { 'Content-Type': 'application/json', 'X-Offline-Replica': '1' },
+  });
+}
+
+// GET de listas: red primero y copia en IndexedDB; sin red se responde desde la replica
+// La replica siempre se guarda como array de objetos, aunque la respuesta venga columnar
+function fromColumnar(payload) {
+  if (Array.isArray(payload)) return payload;
+  const { columns, count, data } = payload;
+  return Array.from({ length: count }, (_, i) =>
+    Object.fromEntries(columns.map((name, c) => [name, data[c][i]]))
+  );
+}
+
+async function fetchWithReplica(request, path) {
+  try {
+    const response = await fetch(request);
+    if (response.ok && path !== LOW_STOCK_URL) {
+      response.clone().json().then((data) => writeReplica(path, fromColumnar(data))).catch(() => {});
+    }
+    return response;
+  } catch (error) {
+    if (path === LOW_STOCK_URL) {
+      const items = (await readReplica('/api/items')) || [];
+      const low = items.filter((item) => item.quantity <= item.threshold)
+        .sort((a, b) => a.quantity - b.quantity);
+      return jsonResponse({ count: low.length, items: low });
+    }
+    const data = await readReplica(path);
+    if (data === undefined) throw error;
+    return jsonResponse(data);
+  }
+}
+
+async function applyToReplicas(operation) {
+  const items = (await readReplica('/api/items')) || [];
+  const { payload } = operation;
+  if (operation.type === 'sale') {
+    const item = items.find((i) => i.id === payload.itemId);
+    if (item) item.quantity -= payload.quantity;
+    const sales = (await readReplica('/api/sales')) || [];
+    sales.unshift({
+      ...payload,
+      total: payload.quantity * payload.price,
+      createdAt: new Date().toISOString(),
+      pending: true,
+    });
+    await writeReplica('/api/sales', sales);
+  } else {
+    const index = items.findIndex((i) => i.id === payload.id);
+    if (index >= 0) items[index] = { ...items[index], ...payload, pending: true };
+  }
+  await writeReplica('/api/items', items);
+}
+
+// POST /api/sales y PUT /api/items/<id>: si no hay red se encolan y se responde 202
+async function fetchOrQueue(request, type) {
+  const body = await request.clone().json();
+  try {
+    return await fetch(request);
+  } catch (error) {
+    const operation = {
+      // Mismo id que el Idempotency-Key de la pagina (id de venta o `${id}:${updatedAt}`)
+      id: request.headers.get('Idempotency-Key') || (type === 'sale' ? body.id : `${body.id}:${body.updatedAt}`),
+      type,
+      payload: body,
+      auth: request.headers.get('Authorization'),
+    };
+    await withStore('queue', 'readwrite', (store) => store.add(operation));
+    await applyToReplicas(operation);
+    if (self.registration.sync) {
+      self.registration.sync.register(SYNC_TAG).catch(() => {});
+    }
+    return jsonResponse({ ...body, queued: true }, 202);
+  }
+}
+
+let replayInFlight = null;
+
+function replayQueue(auth) {
+  if (!replayInFlight) {
+    replayInFlight = replayPending(auth).finally(() => {
+      replayInFlight = null;
+    });
+  }
+  return replayInFlight;
+}
+
+// 401/409/429 se reintentan mas tarde; otro 4xx no va a pasar nunca y el lote sale de la cola
+const RETRYABLE_SYNC_STATUSES = [401, 409, 429];
+
+async function replayPending(auth) {
+  const pending = await withStore('queue', 'readonly', (store) => store.getAll());
+  if (!pending.length) return;
+
+  const device = await deviceId();
+  const results = [];
+  for (let start = 0; start < pending.length; start += SYNC_BATCH_SIZE) {
+    const batch = pending.slice(start, start + SYNC_BATCH_SIZE);
+    const body = JSON.stringify({
+      operations: batch.map(({ id, type, payload }) => ({ id, type, payload })),
+    });
+    const response = await fetch(SYNC_URL, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Authorization': auth || batch[batch.length - 1].auth || '',
+        // Mismo dispositivo y mismo lote, misma clave: si la respuesta se pierde el
+        // reintento no se reaplica, y otro lote nunca choca con una clave ya usada
+        'Idempotency-Key': `sync-${device}-${await sha256Hex(body)}`,
+      },
+      body,
+    });
+    if (response.status >= 500) {
+      // Error del servidor: rechazar para que Background Sync vuelva a intentar
+      throw new Error(`Sync failed with ${response.status}`);
+    }
+    if (!response.ok) {
+      const data = await response.json().catch(() => ({}));
+      const retryable = RETRYABLE_SYNC_STATUSES.includes(response.status);
+      if (!retryable) {
+        await withStore('queue', 'readwrite', (store) => batch.forEach((op) => store.delete(op.seq)));
+      }
+      await notifyClients({
+        type: 'SYNC_ERROR',
+        status: response.status,
+        error: data.error || response.statusText,
+        dropped: retryable ? [] : batch.map(({ id, type }) => ({ id, type })),
+        results,
+      });
+      return;
+    }
+    const data = await response.json();
+    results.push(...data.results);
+    // Cada operacion ya tiene resultado (aplicada, duplicada o en conflicto): sale de la cola
+    await withStore('queue', 'readwrite', (store) => batch.forEach((op) => store.delete(op.seq)));
+  }
+
+  await notifyClients({ type: 'SYNC_RESULT', results });
+}
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(replayQueue());
+  }
+});
+
+self.addEventListener('fetch', (event) => {
+  const { pathname } = new URL(event.request.url);
+  if (event.request.method === 'POST' && pathname === '/api/sales') {
+    event.respondWith(fetchOrQueue(event.request, 'sale'));
+  } else if (event.request.method === 'PUT' && /^\/api\/items\/[^/]+$/.test(pathname)) {
+    event.respondWith(fetchOrQueue(event.request, 'item-update'));
+  }
+});
+
 // Fetch strategy: network-first for app shell, cache fallback for offline
 self.addEventListener('fetch', (event) => {
   if (event.request.method !== 'GET') {
@@ -35,6 +257,28 @@ self.addEventListener('fetch', (event) => {
 
   const requestUrl = new URL(event.request.url);
   if (requestUrl.pathname.startsWith('/api/')) {
+    if (REPLICATED_URLS.includes(requestUrl.pathname) || requestUrl.pathname === LOW_STOCK_URL) {
+      event.respondWith(fetchWithReplica(event.request, requestUrl.pathname));
+    }
+    return;
+  }
+
+  // Assets con hash e imagenes por contenido: nunca cambian, cache-first
+  if (requestUrl.pathname.startsWith('/assets/') || requestUrl.pathname.startsWith('/images/')) {
+    event.respondWith(
+      caches.match(event.request).then((cached) => {
+        if (cached) {
+          return cached;
+        }
+        return fetch(event.request).then((networkResponse) => {
+          if (networkResponse && networkResponse.status === 200) {
+            const responseClone = networkResponse.clone();
+            caches.open(CACHE_NAME).then((cache) => cache.put(event.request, responseClone));
+          }
+          return networkResponse;
+        });
+      })
+    );
     return;
   }
 
@@ -3,15 +3,20 @@ const storeGrid = document.getElementById("storeGrid");
 const storeSearch = document.getElementById("storeSearch");
 const storeCount = document.getElementById("storeCount");
 const storeStatus = document.getElementById("storeStatus");
+const storeFacets = document.getElementById("storeFacets");
+const storeMore = document.getElementById("storeMore");
 
-const WHATSAPP_NUMBER = ""; // example: 50760000000
-
-const currency = new Intl.NumberFormat("en-US", {
-  style: "currency",
-  currency: "USD",
-});
+// Numero de WhatsApp y moneda vienen de los ajustes de la tienda (PUT /api/settings)
+let whatsappNumber = "";
+let currency = new Intl.NumberFormat("en-US", { style: "currency", currency: "USD" });
 
+// El catalogo se pide por paginas al servidor; la primera viene dentro del HTML
+const storeId = new URLSearchParams(window.location.search).get("store");
+const filters = { q: "", status: "", location: "", price: "" };
 let items = [];
+let page = 0;
+let total = 0;
+let requestSeq = 0;
 
 function setStatus(message, type = "") {
   if (!storeStatus) return;
@@ -23,13 +28,31 @@ function formatCount(count) {
   return `${count} producto${count === 1 ? "" : "s"}`;
 }
 
+function escapeHtml(value) {
+  return String(value ?? "")
+    .replace(/&/g, "&amp;")
+    .replace(/</g, "&lt;")
+    .replace(/>/g, "&gt;")
+    .replace(/"/g, "&quot;")
+    .replace(/'/g, "&#39;");
+}
+
 function buildWhatsAppLink(item) {
   const message = `Hola, quiero comprar: ${item.name} - ${currency.format(item.price)}`;
-  return `https://wa.me/${WHATSAPP_NUMBER}?text=${encodeURIComponent(message)}`;
+  return `https://wa.me/${whatsappNumber}?text=${encodeURIComponent(message)}`;
+}
+
+// Imagenes subidas traen srcset con miniaturas WebP; las URLs externas van tal cual
+function buildImage(item) {
+  if (!item.imageUrl) return "";
+  const srcset = item.imageSrcset
+    ? ` srcset="${item.imageSrcset}" sizes="(max-width: 520px) 100vw, 280px"`
+    : "";
+  return `<img src="${escapeHtml(item.imageUrl)}"${srcset} alt="${escapeHtml(item.name)}" loading="lazy" decoding="async" />`;
 }
 
 function buildCard(item) {
-  const disabled = !WHATSAPP_NUMBER;
+  const disabled = !whatsappNumber;
   const actionLabel = disabled ? "Configurar WhatsApp" : "Agregar al carrito";
   const actionAttrs = disabled
     ? "disabled aria-disabled='true'"
@@ -41,13 +64,13 @@ function buildCard(item) {
   return `
     <article class="store-card">
       <div class="store-card-media">
-        ${item.imageUrl ? `<img src="${item.imageUrl}" alt="${item.name}" />` : ""}
+        ${buildImage(item)}
       </div>
-      <h4>${item.name}</h4>
-      ${description ? `<p class="store-card-desc">${description}</p>` : ""}
+      <h4>${escapeHtml(item.name)}</h4>
+      ${description ? `<p class="store-card-desc">${escapeHtml(description)}</p>` : ""}
       <div class="store-card-price">${currency.format(item.price)}</div>
       <div class="store-card-meta">
-        <span>${statusTag}</span>
+        <span>${escapeHtml(statusTag)}</span>
         <span class="store-tag-pill ${lowStock ? "low" : ""}">${stockTag}</span>
       </div>
       <button class="store-action" ${actionAttrs}>
@@ -56,43 +79,125 @@ function buildCard(item) {
     </article>`;
 }
 
-function renderGrid(list) {
+function renderGrid() {
   if (!storeGrid) return;
-  if (!list.length) {
+  if (!items.length) {
     storeGrid.innerHTML = "<div class='store-empty'>No hay productos disponibles.</div>";
-    return;
+  } else {
+    storeGrid.innerHTML = items.map(buildCard).join("");
+  }
+  if (storeMore) {
+    storeMore.hidden = items.length >= total;
+  }
+}
+
+function formatPriceBand(band) {
+  if (band.max === null) return `${currency.format(band.min)}+`;
+  return `${currency.format(band.min)} - ${currency.format(band.max)}`;
+}
+
+function buildFacetGroup(name, label, options, format = (option) => option.value) {
+  const chips = options
+    .filter((option) => option.count > 0 || filters[name] === option.value)
+    .map((option) => {
+      const active = filters[name] === option.value;
+      return `<button type="button" class="store-facet${active ? " active" : ""}" data-facet="${name}" data-value="${escapeHtml(option.value)}">
+        ${escapeHtml(format(option))} <span>${option.count}</span>
+      </button>`;
+    })
+    .join("");
+  if (!chips) return "";
+  return `<div class="store-facet-group"><span class="store-facet-label">${label}</span>${chips}</div>`;
+}
+
+function renderFacets(facets) {
+  if (!storeFacets || !facets) return;
+  storeFacets.innerHTML = [
+    buildFacetGroup("status", "Estado", facets.status),
+    buildFacetGroup("location", "Ubicacion", facets.location),
+    buildFacetGroup("price", "Precio", facets.price, formatPriceBand),
+  ].join("");
+}
+
+function applyStoreSettings(store) {
+  if (!store) return;
+  whatsappNumber = store.whatsappNumber || "";
+  try {
+    currency = new Intl.NumberFormat("en-US", { style: "currency", currency: store.currency || "USD" });
+  } catch (error) {
+    console.error(error);
   }
-  storeGrid.innerHTML = list.map(buildCard).join("");
 }
 
-function renderItems() {
-  const query = (storeSearch?.value || "").trim().toLowerCase();
-  const filtered = items.filter((item) =>
-    item.name.toLowerCase().includes(query)
-  );
+function catalogStatus() {
+  return whatsappNumber ? "" : "La tienda aun no configura su numero de WhatsApp";
+}
 
-  storeCount.textContent = formatCount(filtered.length);
+function applyCatalog(catalog, append) {
+  applyStoreSettings(catalog.store);
+  items = append ? items.concat(catalog.items) : catalog.items;
+  page = catalog.page;
+  total = catalog.total;
+  storeCount.textContent = formatCount(total);
+  renderFacets(catalog.facets);
+  renderGrid();
+}
 
-  renderGrid(filtered.slice(0, 5));
+function catalogUrl(nextPage) {
+  const params = new URLSearchParams({ page: String(nextPage) });
+  if (storeId) params.set("store", storeId);
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value) params.set(key, value);
+  });
+  return `${API_BASE}/store/catalog?${params}`;
 }
 
-async function loadStoreItems() {
+async function loadPage(nextPage) {
+  const seq = ++requestSeq;
   setStatus("Cargando productos...");
   try {
-    const response = await fetch(`${API_BASE}/store/items`);
+    const response = await fetch(catalogUrl(nextPage));
     if (!response.ok) {
       throw new Error("No se pudieron cargar los productos.");
     }
-    items = await response.json();
-    setStatus(WHATSAPP_NUMBER ? "" : "Configura el numero de WhatsApp en store.js");
-    renderItems();
+    const catalog = await response.json();
+    // Una busqueda mas nueva ya salio: descartar esta respuesta
+    if (seq !== requestSeq) return;
+    applyCatalog(catalog, nextPage > 1);
+    setStatus(catalogStatus());
   } catch (error) {
     console.error(error);
     setStatus("Error al cargar el catalogo.", "error");
   }
 }
 
+function loadInitialCatalog() {
+  const initial = document.getElementById("storeInitial");
+  if (!initial) {
+    loadPage(1);
+    return;
+  }
+  applyCatalog(JSON.parse(initial.textContent), false);
+  setStatus(catalogStatus());
+}
+
+let searchTimer = null;
+function handleSearch() {
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => {
+    filters.q = (storeSearch?.value || "").trim();
+    loadPage(1);
+  }, 250);
+}
+
 document.addEventListener("click", (event) => {
+  const facet = event.target.closest(".store-facet");
+  if (facet) {
+    const name = facet.dataset.facet;
+    filters[name] = filters[name] === facet.dataset.value ? "" : facet.dataset.value;
+    loadPage(1);
+    return;
+  }
   const button = event.target.closest(".store-action");
   if (!button) return;
   const link = button.dataset.link;
@@ -100,6 +205,7 @@ document.addEventListener("click", (event) => {
   window.open(link, "_blank");
 });
 
-storeSearch.addEventListener("input", renderItems);
+storeSearch.addEventListener("input", handleSearch);
+storeMore?.addEventListener("click", () => loadPage(page + 1));
 
-loadStoreItems();
+loadInitialCatalog();
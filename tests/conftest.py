@@ -0,0 +1,107 @@
+"""Fixtures comunes: la app cargada una vez por backend (SQLite siempre, Postgres si hay
+DATABASE_URL) y usuarios nuevos por test, cada uno con su propia tienda."""
+import importlib.util
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT_DIR, "back", "app.py")
+BACKENDS = ("sqlite", "postgres")
+
+
+def load_app(backend, data_dir, module_name=None):
+    """Importar back/app.py como un modulo aparte con el entorno del backend: la config
+    se lee de os.environ al importar, asi cada backend tiene su propia app y su BD."""
+    overrides = {"APP_DATA_DIR": data_dir, "SCHEDULER_ENABLED": "0"}
+    if backend == "sqlite":
+        overrides["DATABASE_URL"] = None
+        overrides["DATABASE_READ_URL"] = None
+    saved = {name: os.environ.get(name) for name in overrides}
+    for name, value in overrides.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    try:
+        spec = importlib.util.spec_from_file_location(module_name or f"inventario_app_{backend}", APP_PATH)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    return module
+
+
+@pytest.fixture(scope="session", params=BACKENDS)
+def app_module(request, tmp_path_factory):
+    if request.param == "postgres":
+        if not os.getenv("DATABASE_URL"):
+            pytest.skip("DATABASE_URL no esta definido")
+        pytest.importorskip("psycopg2")
+    module = load_app(request.param, str(tmp_path_factory.mktemp(request.param)))
+    yield module
+    module.AUDIT.flush()
+
+
+@pytest.fixture
+def backend(app_module):
+    return "postgres" if app_module.USE_POSTGRES else "sqlite"
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def make_user(client):
+    """Registrar un usuario nuevo; sin store_code queda en una tienda nueva.
+    Devuelve los headers de Authorization listos para usar."""
+
+    def make(store_code=None):
+        username = f"user-{uuid.uuid4().hex[:10]}"
+        payload = {"username": username, "password": "secret", "email": f"{username}@example.com"}
+        if store_code:
+            payload["storeCode"] = store_code
+        response = client.post("/api/auth/register", json=payload)
+        assert response.status_code == 201, response.get_json()
+        return {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+    return make
+
+
+@pytest.fixture
+def auth(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def store_id(client, auth):
+    return client.get("/api/stores/current", headers=auth).get_json()["id"]
+
+
+@pytest.fixture
+def item_payload():
+    """Payload valido para POST /api/items con un SKU unico"""
+
+    def make(**overrides):
+        payload = {
+            "name": "Cable USB-C",
+            "sku": f"SKU-{uuid.uuid4().hex[:8]}",
+            "quantity": 10,
+            "location": "Estante A",
+            "price": 12.5,
+            "costUnit": 8,
+            "threshold": 2,
+        }
+        payload.update(overrides)
+        return payload
+
+    return make
@@ -0,0 +1,44 @@
+"""Stock bajo: el panel de alertas y los cruces de umbral, siempre dentro de la tienda"""
+from flask import g
+
+
+def sell(client, auth, item_id, quantity):
+    return client.post(
+        "/api/sales",
+        json={"itemId": item_id, "quantity": quantity, "price": 12.5, "paymentMethod": "Efectivo"},
+        headers=auth,
+    )
+
+
+def test_sale_below_threshold_shows_in_alerts(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=3, threshold=2), headers=auth).get_json()
+    assert client.get("/api/alerts/low-stock", headers=auth).get_json()["count"] == 0
+
+    assert sell(client, auth, item["id"], 1).status_code == 201
+    alerts = client.get("/api/alerts/low-stock", headers=auth).get_json()
+    assert [entry["id"] for entry in alerts["items"]] == [item["id"]]
+
+
+def test_low_stock_ids_only_sees_the_current_store(app_module, client, make_user, item_payload):
+    owner, other = make_user(), make_user()
+    low = client.post("/api/items", json=item_payload(quantity=1, threshold=5), headers=owner).get_json()
+    ok = client.post("/api/items", json=item_payload(quantity=9, threshold=5), headers=owner).get_json()
+    stores = [client.get("/api/stores/current", headers=user).get_json()["id"] for user in (owner, other)]
+
+    with app_module.app.test_request_context(), app_module.get_db(readonly=True) as conn:
+        g.store_id = stores[0]
+        assert app_module.low_stock_ids(conn, [low["id"], ok["id"], "no-existe"]) == {low["id"]}
+        assert app_module.low_stock_ids(conn, []) == set()
+        g.store_id = stores[1]
+        assert app_module.low_stock_ids(conn, [low["id"], ok["id"]]) == set()
+
+
+def test_crossings_queue_one_event_per_changed_item(app_module, client, auth, store_id, item_payload):
+    crossed = client.post("/api/items", json=item_payload(quantity=1, threshold=5), headers=auth).get_json()
+    recovered = client.post("/api/items", json=item_payload(quantity=9, threshold=5), headers=auth).get_json()
+
+    with app_module.app.test_request_context(), app_module.get_db(readonly=True) as conn:
+        g.store_id = store_id
+        app_module.track_low_stock_crossings(conn, {recovered["id"]}, [crossed["id"], recovered["id"]])
+        events = sorted((event_type, data["id"]) for event_type, data in g.pending_events)
+    assert events == sorted([("low-stock", crossed["id"]), ("stock-recovered", recovered["id"])])
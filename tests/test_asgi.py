@@ -0,0 +1,85 @@
+"""back/asgi.py sobre la app del backend: se llama al callable ASGI directamente, sin servidor"""
+import asyncio
+import importlib.util
+import json
+import os
+
+import flask
+import pytest
+
+from conftest import ROOT_DIR
+
+a2wsgi = pytest.importorskip("a2wsgi")
+
+
+@pytest.fixture
+def asgi_app(app_module, monkeypatch):
+    # `from back.app import app` dentro de asgi.py recibe la app ya cargada del backend
+    monkeypatch.setitem(__import__("sys").modules, "back.app", app_module)
+    spec = importlib.util.spec_from_file_location("inventario_asgi", os.path.join(ROOT_DIR, "back", "asgi.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert isinstance(module.app, a2wsgi.WSGIMiddleware)
+    return module.app
+
+
+def call(asgi_app, method, path, headers=(), body=b"", chunk_size=None):
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size else [body]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 1234),
+    }
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+        for index, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    start = next(message for message in sent if message["type"] == "http.response.start")
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return start["status"], start["headers"], body
+
+
+def test_chunked_request_body_reaches_flask(asgi_app, auth, item_payload):
+    payload = json.dumps(item_payload(description="x" * 5000)).encode()
+    headers = [*auth.items(), ("Content-Type", "application/json"), ("Content-Length", str(len(payload)))]
+    status, _, body = call(asgi_app, "POST", "/api/items", headers, payload, chunk_size=1024)
+    assert status == 201
+    assert json.loads(body)["description"] == "x" * 5000
+
+
+def test_repeated_response_headers_are_sent_as_separate_pairs():
+    cookies_app = flask.Flask("cookies")
+
+    @cookies_app.route("/")
+    def two_cookies():
+        response = flask.jsonify({})
+        response.set_cookie("a", "1")
+        response.set_cookie("b", "2")
+        return response
+
+    status, headers, _ = call(a2wsgi.WSGIMiddleware(cookies_app), "GET", "/")
+    assert status == 200
+    assert sorted(value for name, value in headers if name == b"set-cookie") == [
+        b"a=1; Path=/",
+        b"b=2; Path=/",
+    ]
@@ -0,0 +1,95 @@
+"""Export/import CSV de items: lo exportado se vuelve a importar igual en la misma u otra tienda"""
+import csv
+import io
+import uuid
+
+
+def export_rows(client, auth):
+    response = client.get("/api/items/export", headers=auth)
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def items_by_sku(client, auth):
+    return {item["sku"]: item for item in client.get("/api/items", headers=auth).get_json()}
+
+
+def test_export_import_round_trip(app_module, client, auth, item_payload):
+    for payload in (item_payload(status="Usado", description="con caja"), item_payload(quantity=0, price=0.99)):
+        assert client.post("/api/items", json=payload, headers=auth).status_code == 201
+    before = items_by_sku(client, auth)
+    exported = client.get("/api/items/export", headers=auth).get_data()
+    assert export_rows(client, auth)[0].keys() == set(app_module.ITEM_EXPORT_COLUMNS)
+
+    client.delete("/api/items", headers=auth)
+    response = client.post("/api/items/import", data=exported, headers=auth, content_type="text/csv")
+    assert response.get_json() == {"imported": 2}
+    assert items_by_sku(client, auth) == before
+
+
+def test_import_into_another_store_gets_new_ids(client, make_user, item_payload):
+    owner, other = make_user(), make_user()
+    item = client.post("/api/items", json=item_payload(), headers=owner).get_json()
+    exported = client.get("/api/items/export", headers=owner).get_data()
+
+    response = client.post(
+        "/api/items/import", data={"file": (io.BytesIO(exported), "items.csv")}, headers=other
+    )
+    assert response.get_json() == {"imported": 1}
+    copied = client.get("/api/items", headers=other).get_json()
+    assert [entry["sku"] for entry in copied] == [item["sku"]]
+    assert copied[0]["id"] != item["id"]
+    assert client.get("/api/items", headers=owner).get_json()[0]["id"] == item["id"]
+
+
+def test_import_skips_incomplete_rows_and_defaults_status(client, auth):
+    data = "name,sku,location,quantity,status\nTeclado,T-1,Estante C,4,\n,T-2,Estante C,1,Usado\n"
+    response = client.post("/api/items/import", data=data, headers=auth, content_type="text/csv")
+    assert response.get_json() == {"imported": 1}
+    assert items_by_sku(client, auth)["T-1"]["status"] == "Nuevo"
+
+
+def test_bad_rows_import_the_same_on_every_backend(client, auth):
+    """Mismo CSV en SQLite (parse_item por fila) y Postgres (COPY + INSERT ... SELECT)"""
+    dup, other = uuid.uuid4().hex, uuid.uuid4().hex
+    data = (
+        "id,name,sku,location,quantity,threshold,price_cents,status\n"
+        f"{dup},Teclado viejo,T-1,A,3,1,100,\n"
+        ",Mouse,M-1,B,-4,-2,abc,Usado\n"
+        f"{other},,S-1,C,1,1,100,Nuevo\n"
+        ",Cable,C-1,D,muchos,2.5,250,\n"
+        f"{dup},Teclado,T-1,A, 5 ,1,200,Reacondicionado\n"
+    )
+    response = client.post("/api/items/import", data=data, headers=auth, content_type="text/csv")
+    assert response.get_json() == {"imported": 3}
+
+    items = {
+        sku: (item["name"], item["quantity"], item["threshold"], item["price"], item["status"])
+        for sku, item in items_by_sku(client, auth).items()
+    }
+    assert items == {
+        "T-1": ("Teclado", 5, 1, 2.0, "Reacondicionado"),
+        "M-1": ("Mouse", 0, 0, 0.0, "Usado"),
+        "C-1": ("Cable", 0, 0, 2.5, "Nuevo"),
+    }
+    assert items_by_sku(client, auth)["T-1"]["id"] == dup
+
+
+def test_import_records_ledger_movements(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=3), headers=auth).get_json()
+    rows = export_rows(client, auth)
+    rows[0]["quantity"] = "7"
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+    client.post("/api/items/import", data=out.getvalue(), headers=auth, content_type="text/csv")
+    movements = client.get(f"/api/items/{item['id']}/movements", headers=auth).get_json()["movements"]
+    assert (movements[0]["kind"], movements[0]["delta"]) == ("import", 4)
+
+
+def test_import_rejects_an_unknown_header(client, auth):
+    response = client.post("/api/items/import", data="nombre,sku\nx,y\n", headers=auth, content_type="text/csv")
+    assert response.status_code == 400
@@ -0,0 +1,54 @@
+def ticket(client, auth):
+    response = client.post("/api/events/ticket", headers=auth)
+    assert response.status_code == 201
+    return response.get_json()["ticket"]
+
+
+def open_stream(client, query):
+    response = client.get(f"/api/events?{query}")
+    status = response.status_code
+    response.close()
+    return status
+
+
+def test_stream_opens_with_a_ticket(client, auth):
+    assert open_stream(client, f"ticket={ticket(client, auth)}") == 200
+
+
+def test_ticket_is_single_use(client, auth):
+    value = ticket(client, auth)
+    assert open_stream(client, f"ticket={value}") == 200
+    assert open_stream(client, f"ticket={value}") == 401
+
+
+def test_session_token_is_not_accepted_on_the_url(client, auth):
+    token = auth["Authorization"][7:]
+    assert open_stream(client, f"token={token}") == 401
+    assert open_stream(client, f"ticket={token}") == 401
+
+
+def test_expired_ticket_is_rejected(app_module, client, auth, monkeypatch):
+    value = ticket(client, auth)
+    later = app_module.now_ms() + (app_module.SSE_TICKET_TTL_SECONDS + 1) * 1000
+    monkeypatch.setattr(app_module, "now_ms", lambda: later)
+    assert open_stream(client, f"ticket={value}") == 401
+
+
+def test_ticket_requires_a_session(client):
+    assert client.post("/api/events/ticket").status_code == 401
+
+
+def test_stream_only_sees_its_store(app_module, client, make_user, item_payload):
+    own, other = make_user(), make_user()
+    response = client.get(f"/api/events?ticket={ticket(client, own)}")
+    try:
+        client.post("/api/items", json=item_payload(name="Ajeno"), headers=other)
+        client.post("/api/items", json=item_payload(name="Propio"), headers=own)
+        body = b""
+        for chunk in response.response:
+            body += chunk
+            if b"Propio" in body:
+                break
+    finally:
+        response.close()
+    assert b"Ajeno" not in body
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import threading
+import uuid
+
+import pytest
+
+
+def keyed(headers, key):
+    return {**headers, "Idempotency-Key": key}
+
+
+def item_count(client, auth):
+    return len(client.get("/api/items", headers=auth).get_json())
+
+
+def test_retry_replays_first_response(client, auth, item_payload):
+    key = str(uuid.uuid4())
+    payload = item_payload()
+    first = client.post("/api/items", json=payload, headers=keyed(auth, key))
+    second = client.post("/api/items", json=payload, headers=keyed(auth, key))
+
+    assert first.status_code == second.status_code == 201
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.get_json() == first.get_json()
+    assert item_count(client, auth) == 1
+
+
+def test_key_reuse_with_different_body_is_rejected(client, auth, item_payload):
+    key = str(uuid.uuid4())
+    assert client.post("/api/items", json=item_payload(), headers=keyed(auth, key)).status_code == 201
+
+    response = client.post("/api/items", json=item_payload(), headers=keyed(auth, key))
+    assert response.status_code == 422
+    assert item_count(client, auth) == 1
+
+
+def test_key_reuse_on_another_path_is_rejected(client, auth, item_payload):
+    key = str(uuid.uuid4())
+    payload = item_payload()
+    assert client.post("/api/items", json=payload, headers=keyed(auth, key)).status_code == 201
+    assert client.post("/api/items/bulk", json={"items": [payload]}, headers=keyed(auth, key)).status_code == 422
+
+
+def test_keys_are_scoped_per_user(client, make_user, item_payload):
+    key = str(uuid.uuid4())
+    payload = item_payload()
+    for headers in (make_user(), make_user()):
+        response = client.post("/api/items", json=payload, headers=keyed(headers, key))
+        assert response.status_code == 201
+        assert "Idempotent-Replayed" not in response.headers
+
+
+def test_concurrent_retries_run_once(app_module, auth, item_payload):
+    key = str(uuid.uuid4())
+    payload = item_payload()
+    barrier = threading.Barrier(4)
+    responses = []
+
+    def send():
+        client = app_module.app.test_client()
+        barrier.wait()
+        responses.append(client.post("/api/items", json=payload, headers=keyed(auth, key)))
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [201] * 4
+    assert sum("Idempotent-Replayed" not in response.headers for response in responses) == 1
+    assert item_count(app_module.app.test_client(), auth) == 1
+
+
+def leave_reservation(app_module, auth, key, body, age_seconds):
+    """Simular una reserva sin respuesta para POST /api/items con este cuerpo"""
+    with app_module.get_db() as conn:
+        user_id = app_module.SessionsRepo(conn).lookup(auth["Authorization"][7:])["user_id"]
+    request_hash = hashlib.sha256(b"POST /api/items\n" + body).hexdigest()
+    with app_module.write_transaction() as conn:
+        conn.execute(
+            "INSERT INTO idempotency_keys (user_id, key, path, request_hash, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, key, "/api/items", request_hash, app_module.now_ms() - age_seconds * 1000),
+        )
+
+
+def post_raw(client, auth, key, body):
+    return client.post("/api/items", data=body, content_type="application/json", headers=keyed(auth, key))
+
+
+def test_fresh_reservation_reports_in_progress(app_module, client, auth, item_payload):
+    key = str(uuid.uuid4())
+    body = json.dumps(item_payload()).encode()
+    leave_reservation(app_module, auth, key, body, age_seconds=1)
+
+    assert post_raw(client, auth, key, body).status_code == 409
+    assert item_count(client, auth) == 0
+
+
+def test_abandoned_reservation_is_taken_over(app_module, client, auth, item_payload):
+    key = str(uuid.uuid4())
+    body = json.dumps(item_payload()).encode()
+    leave_reservation(app_module, auth, key, body, age_seconds=app_module.IDEMPOTENCY_LEASE_SECONDS + 5)
+
+    assert post_raw(client, auth, key, body).status_code == 201
+    assert post_raw(client, auth, key, body).headers["Idempotent-Replayed"] == "true"
+    assert item_count(client, auth) == 1
+
+
+def test_handler_crash_releases_the_key(app_module, client, auth, item_payload, monkeypatch):
+    key = str(uuid.uuid4())
+    payload = item_payload()
+
+    def crash(conn, movements):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(app_module, "record_stock_movements", crash)
+    monkeypatch.setattr(app_module.app, "testing", False)
+    assert client.post("/api/items", json=payload, headers=keyed(auth, key)).status_code == 500
+    monkeypatch.undo()
+
+    # El rollback se llevo la reserva junto con el item: el reintento se ejecuta
+    response = client.post("/api/items", json=payload, headers=keyed(auth, key))
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    assert item_count(client, auth) == 1
+
+
+@pytest.mark.parametrize("size", [0, 256])
+def test_key_length_limit(client, auth, item_payload, size):
+    response = client.post("/api/items", json=item_payload(), headers=keyed(auth, "k" * size))
+    assert response.status_code == (201 if size == 0 else 400)
+
+
+def test_item_edit_retry_is_not_reapplied(client, auth, item_payload):
+    created = client.post("/api/items", json=item_payload(quantity=5), headers=auth).get_json()
+    edit = {**created, "quantity": 8, "updatedAt": "2030-01-01T00:00:00Z"}
+    key = f"{created['id']}:{edit['updatedAt']}"
+    first = client.put(f"/api/items/{created['id']}", json=edit, headers=keyed(auth, key))
+    # Otro cambio entre medio: el reintento de la edicion anterior no lo pisa
+    client.put(f"/api/items/{created['id']}", json={**edit, "quantity": 3, "updatedAt": None}, headers=auth)
+    retry = client.put(f"/api/items/{created['id']}", json=edit, headers=keyed(auth, key))
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert client.get("/api/items", headers=auth).get_json()[0]["quantity"] == 3
@@ -0,0 +1,89 @@
+"""Ledger de stock: cada cambio de cantidad deja un movimiento y stock_at() lo reconstruye"""
+import time
+
+
+def sell(client, auth, item_id, quantity):
+    return client.post(
+        "/api/sales",
+        json={"itemId": item_id, "quantity": quantity, "price": 12.5, "paymentMethod": "Efectivo"},
+        headers=auth,
+    )
+
+
+def movements(client, auth, item_id, **params):
+    response = client.get(f"/api/items/{item_id}/movements", query_string=params, headers=auth)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_receipt_sale_and_adjustment_are_recorded(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=10), headers=auth).get_json()
+    assert sell(client, auth, item["id"], 3).status_code == 201
+    response = client.put(f"/api/items/{item['id']}", json={**item, "quantity": 20}, headers=auth)
+    assert response.status_code == 200
+
+    page = movements(client, auth, item["id"])
+    assert [(m["kind"], m["delta"]) for m in page["movements"]] == [
+        ("adjustment", 13),
+        ("sale", -3),
+        ("receipt", 10),
+    ]
+    assert page["nextBefore"] is None
+
+
+def test_movements_are_paginated(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=10), headers=auth).get_json()
+    for _ in range(3):
+        assert sell(client, auth, item["id"], 1).status_code == 201
+
+    first = movements(client, auth, item["id"], limit=2)
+    assert len(first["movements"]) == 2 and first["nextBefore"] is not None
+    rest = movements(client, auth, item["id"], limit=2, before=first["nextBefore"])
+    assert [m["kind"] for m in rest["movements"]] == ["sale", "receipt"]
+    assert rest["nextBefore"] is None
+
+
+def test_stock_at_a_past_date(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=10), headers=auth).get_json()
+    time.sleep(0.01)
+    before_sale = int(time.time() * 1000)
+    time.sleep(0.01)
+    assert sell(client, auth, item["id"], 4).status_code == 201
+
+    past = client.get(f"/api/items/{item['id']}/stock", query_string={"at": before_sale}, headers=auth)
+    now = client.get(f"/api/items/{item['id']}/stock", headers=auth)
+    assert past.get_json()["quantity"] == 10
+    assert now.get_json()["quantity"] == 6
+
+
+def test_snapshot_is_taken_every_n_movements(app_module, client, auth, item_payload, monkeypatch):
+    monkeypatch.setattr(app_module, "STOCK_SNAPSHOT_EVERY", 3)
+    item = client.post("/api/items", json=item_payload(quantity=10), headers=auth).get_json()
+    for _ in range(3):
+        assert sell(client, auth, item["id"], 1).status_code == 201
+
+    # receipt + 2 ventas = 3 movimientos: snapshot con el stock de ese momento
+    page = movements(client, auth, item["id"], snapshots=1)
+    snapshots = [m for m in page["movements"] if m["kind"] == "snapshot"]
+    assert [m["balance"] for m in snapshots] == [8]
+    now = client.get(f"/api/items/{item['id']}/stock", headers=auth).get_json()
+    assert now["quantity"] == 7
+
+
+def test_compaction_keeps_stock_at_consistent(app_module, client, auth, item_payload, monkeypatch):
+    item = client.post("/api/items", json=item_payload(quantity=10), headers=auth).get_json()
+    for _ in range(4):
+        assert sell(client, auth, item["id"], 1).status_code == 201
+
+    monkeypatch.setattr(app_module, "STOCK_SNAPSHOT_EVERY", 2)
+    with app_module.write_transaction() as conn:
+        app_module.compact_stock_ledger(conn)
+        snapshots = conn.execute(
+            "SELECT balance FROM stock_movements WHERE item_id = ? AND kind = 'snapshot'", (item["id"],)
+        ).fetchall()
+        assert [row["balance"] for row in snapshots] == [6]
+        assert app_module.stock_at(conn, item["id"], app_module.now_ms()) == 6
+
+
+def test_stock_of_an_unknown_item_is_404(client, auth):
+    assert client.get("/api/items/no-existe/stock", headers=auth).status_code == 404
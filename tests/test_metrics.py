@@ -0,0 +1,17 @@
+"""GET /api/metrics: solo con METRICS_TOKEN"""
+
+
+def test_metrics_are_disabled_without_a_token(client, auth, monkeypatch):
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    assert client.get("/api/metrics").status_code == 403
+    assert client.get("/api/metrics", headers=auth).status_code == 403
+
+
+def test_metrics_require_the_token(client, auth, monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "metrics-secret")
+    assert client.get("/api/metrics").status_code == 401
+    assert client.get("/api/metrics", headers=auth).status_code == 401
+
+    response = client.get("/api/metrics", headers={"Authorization": "Bearer metrics-secret"})
+    assert response.status_code == 200
+    assert "http_request_duration_seconds" in response.get_data(as_text=True)
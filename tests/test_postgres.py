@@ -0,0 +1,105 @@
+"""Rutas que solo existen con Postgres: wrapper de psycopg2, cursores con nombre, COPY,
+advisory lock del scheduler y DATABASE_READ_URL. Corren solo con DATABASE_URL definido."""
+import csv
+import io
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def pg(app_module):
+    if not app_module.USE_POSTGRES:
+        pytest.skip("solo Postgres")
+    return app_module
+
+
+def add_items(pg, store_id, count):
+    items = []
+    for index in range(count):
+        item, _ = pg.parse_item(
+            {"name": f"Item {index}", "sku": f"PG-{uuid.uuid4().hex[:8]}", "location": "A", "quantity": index}
+        )
+        items.append(item)
+    with pg.write_transaction() as conn:
+        pg.ItemsRepo(conn, store_id).upsert_many(items)
+    return items
+
+
+def test_wrapper_translates_placeholders_and_keeps_percent(pg, store_id):
+    assert pg.translate_sql_postgres("SELECT ? WHERE name LIKE '50%'") == "SELECT %s WHERE name LIKE '50%%'"
+    add_items(pg, store_id, 1)
+    with pg.get_db(readonly=True) as conn:
+        assert isinstance(conn.conn, pg.PostgresConnectionWrapper)
+        row = conn.execute(
+            "SELECT COUNT(*) AS count FROM items WHERE store_id = ? AND name LIKE 'Item %'", (store_id,)
+        ).fetchone()
+    assert row["count"] == 1
+
+
+def test_wrapper_rolls_back_on_error(pg, store_id):
+    item = add_items(pg, store_id, 1)[0]
+    with pytest.raises(RuntimeError):
+        with pg.write_transaction() as conn:
+            pg.ItemsRepo(conn, store_id).add_quantity(item["id"], 100)
+            raise RuntimeError("boom")
+    with pg.get_db(readonly=True) as conn:
+        assert pg.ItemsRepo(conn, store_id).get(item["id"])["quantity"] == 0
+
+
+def test_stream_rows_uses_a_named_cursor(pg, store_id, monkeypatch):
+    monkeypatch.setattr(pg, "POSTGRES_ITERSIZE", 2)
+    items = add_items(pg, store_id, 5)
+    with pg.get_db(readonly=True) as conn:
+        rows = pg.ItemsRepo(conn, store_id).stream()
+        assert rows.cur.cur.name.startswith("stream_")
+        assert rows.cur.cur.itersize == 2
+        assert sorted(row["id"] for row in rows) == sorted(item["id"] for item in items)
+
+
+def test_copy_export_and_import(pg, store_id):
+    items = add_items(pg, store_id, 3)
+    out = io.BytesIO()
+    with pg.get_db(readonly=True) as conn:
+        pg.ItemsRepo(conn, store_id).export_csv(out)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue().decode("utf-8"))))
+    assert sorted(row["id"] for row in rows) == sorted(item["id"] for item in items)
+    assert set(rows[0]) == set(pg.ITEM_EXPORT_COLUMNS)
+
+    with pg.write_transaction() as conn:
+        repo = pg.ItemsRepo(conn, store_id)
+        repo.clear()
+        out.seek(0)
+        imported = repo.import_csv(out)
+    assert imported == {item["id"]: item["quantity"] for item in items}
+
+
+def test_scheduler_leadership_uses_an_advisory_lock(pg):
+    first, second = pg.Scheduler(60), pg.Scheduler(60)
+    try:
+        assert first._acquire_leadership()
+        assert not second._acquire_leadership()
+        # La conexion del lider se cae: el lock de sesion se libera
+        first.lock_handle.close()
+        assert second._acquire_leadership()
+    finally:
+        for scheduler in (first, second):
+            if scheduler.lock_handle is not None and not scheduler.lock_handle.closed:
+                scheduler.lock_handle.close()
+
+
+def test_readonly_connections_use_database_read_url(pg, monkeypatch):
+    dsns = []
+    connect = pg.psycopg2.connect
+
+    def recording_connect(dsn, *args, **kwargs):
+        dsns.append(dsn)
+        return connect(pg.DATABASE_URL, *args, **kwargs)
+
+    monkeypatch.setattr(pg, "DATABASE_READ_URL", "postgresql://replica.invalid/inventario")
+    monkeypatch.setattr(pg.psycopg2, "connect", recording_connect)
+    with pg.get_db(readonly=True) as conn:
+        with pytest.raises(pg.psycopg2.Error):
+            conn.execute("DELETE FROM items WHERE id = 'no-existe'")
+    pg.get_db().close()
+    assert dsns == ["postgresql://replica.invalid/inventario", pg.DATABASE_URL]
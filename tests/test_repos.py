@@ -0,0 +1,184 @@
+"""Repositorios y migraciones contra la BD de cada backend, sin pasar por HTTP"""
+import sqlite3
+import uuid
+
+from conftest import load_app
+
+
+def make_item(app_module, **overrides):
+    payload = {
+        "name": "Mouse",
+        "sku": f"SKU-{uuid.uuid4().hex[:8]}",
+        "quantity": 5,
+        "location": "Estante B",
+        "price": 19.99,
+        "costUnit": 7.5,
+        "threshold": 1,
+        "status": "Usado",
+    }
+    payload.update(overrides)
+    item, error = app_module.parse_item(payload)
+    assert error is None
+    return item
+
+
+def table_columns(app_module, conn, table):
+    if app_module.USE_POSTGRES:
+        rows = conn.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = ?", (table,)
+        ).fetchall()
+        return {row["column_name"] for row in rows}
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def test_items_repo_round_trips_an_item(app_module, store_id):
+    item = make_item(app_module)
+    with app_module.write_transaction() as conn:
+        app_module.ItemsRepo(conn, store_id).upsert(item)
+
+    with app_module.get_db(readonly=True) as conn:
+        items = app_module.ItemsRepo(conn, store_id)
+        assert app_module.row_to_item(items.get(item["id"])) == item
+        assert items.quantities() == {item["id"]: 5}
+        assert items.sku_taken(item["sku"], "otro-id")
+        assert not items.sku_taken(item["sku"], item["id"])
+        assert [row["id"] for row in items.stream()] == [item["id"]]
+
+
+def test_items_repo_update_and_add_quantity(app_module, store_id):
+    item = make_item(app_module)
+    with app_module.write_transaction() as conn:
+        items = app_module.ItemsRepo(conn, store_id)
+        items.upsert(item)
+        items.update({**item, "name": "Mouse inalambrico", "status": "Reacondicionado"})
+        items.add_quantity(item["id"], -2)
+
+    with app_module.get_db(readonly=True) as conn:
+        row = app_module.ItemsRepo(conn, store_id).get(item["id"])
+    assert (row["name"], row["status"], row["quantity"]) == ("Mouse inalambrico", "Reacondicionado", 3)
+
+
+def test_items_repo_is_scoped_to_its_store(app_module, make_user, client):
+    stores = [
+        client.get("/api/stores/current", headers=make_user()).get_json()["id"] for _ in range(2)
+    ]
+    item = make_item(app_module)
+    with app_module.write_transaction() as conn:
+        app_module.ItemsRepo(conn, stores[0]).upsert(item)
+
+    with app_module.get_db(readonly=True) as conn:
+        other = app_module.ItemsRepo(conn, stores[1])
+        assert other.get(item["id"]) is None
+        assert other.owner(item["id"])["store_id"] == stores[0]
+        assert other.foreign_ids([item["id"], "no-existe"]) == {item["id"]}
+
+
+def test_upsert_never_moves_an_item_to_another_store(app_module, make_user, client):
+    stores = [
+        client.get("/api/stores/current", headers=make_user()).get_json()["id"] for _ in range(2)
+    ]
+    item = make_item(app_module)
+    with app_module.write_transaction() as conn:
+        app_module.ItemsRepo(conn, stores[0]).upsert(item)
+        app_module.ItemsRepo(conn, stores[1]).upsert({**item, "name": "Robado", "quantity": 0})
+
+    with app_module.get_db(readonly=True) as conn:
+        row = app_module.ItemsRepo(conn, stores[0]).get(item["id"])
+    assert (row["store_id"], row["name"], row["quantity"]) == (stores[0], "Mouse", 5)
+
+
+def test_sales_repo_totals_and_range(app_module, store_id):
+    item = make_item(app_module)
+    sales = [
+        {
+            "id": str(uuid.uuid4()),
+            "item_id": item["id"],
+            "quantity": quantity,
+            "price_cents": 1000,
+            "total_cents": quantity * 1000,
+            "cost_unit_cents": 400,
+            "gain_cents": quantity * 600,
+            "payment_method": method,
+            "created_at": created_at,
+        }
+        for quantity, method, created_at in ((1, "Efectivo", 1_000), (2, "Tarjeta", 2_000), (3, "Efectivo", 3_000))
+    ]
+    with app_module.write_transaction() as conn:
+        app_module.ItemsRepo(conn, store_id).upsert(item)
+        repo = app_module.SalesRepo(conn, store_id)
+        for sale in sales:
+            repo.insert(sale)
+
+    with app_module.get_db(readonly=True) as conn:
+        repo = app_module.SalesRepo(conn, store_id)
+        assert [row["id"] for row in repo.stream(start_ms=1_500, end_ms=3_000)] == [sales[1]["id"]]
+        assert [row["id"] for row in repo.stream()] == [sale["id"] for sale in reversed(sales)]
+        total = repo.totals(0, 10_000)[0]
+        assert (total["total_cents"], total["gain_cents"], total["count"], total["units"]) == (6000, 3600, 3, 6)
+        by_payment = {row["payment_method"]: row["total_cents"] for row in repo.totals(0, 10_000, by_payment=True)}
+        assert by_payment == {"Efectivo": 4000, "Tarjeta": 2000}
+
+
+def test_sessions_repo_lookup_and_expiry(app_module, auth, store_id):
+    token = auth["Authorization"].split(" ", 1)[1]
+    with app_module.get_db(readonly=True) as conn:
+        user_id = app_module.SessionsRepo(conn).lookup(token)["user_id"]
+
+    with app_module.write_transaction() as conn:
+        sessions = app_module.SessionsRepo(conn)
+        fresh = sessions.create(user_id)
+        stale = sessions.create(user_id)
+        conn.execute("UPDATE sessions SET created_at = ? WHERE token = ?", (1, stale))
+
+    with app_module.write_transaction() as conn:
+        sessions = app_module.SessionsRepo(conn)
+        assert sessions.lookup(fresh)["store_id"] == store_id
+        assert sessions.lookup(stale) is None
+        assert sessions.delete_older_than(2) == 1
+        sessions.delete(fresh)
+        assert sessions.lookup(fresh) is None
+
+
+def test_init_db_is_idempotent(app_module, auth):
+    app_module.init_db()
+    app_module.init_db()
+
+    with app_module.get_db(readonly=True) as conn:
+        for table in ("users", "items", "sales", "stock_movements"):
+            assert "store_id" in table_columns(app_module, conn, table)
+        assert {"price_cents", "cost_unit_cents", "status", "updated_at"} <= table_columns(app_module, conn, "items")
+        assert {"status", "body"} <= table_columns(app_module, conn, "idempotency_keys")
+        assert {"ticket_hash", "expires_at"} <= table_columns(app_module, conn, "stream_tickets")
+    # Los datos y las sesiones siguen ahi
+    assert app_module.app.test_client().get("/api/auth/validate", headers=auth).status_code == 200
+
+
+def test_legacy_sqlite_database_is_migrated(tmp_path):
+    """Una BD de antes de centavos, fechas en ms y tiendas se migra al arrancar"""
+    legacy = sqlite3.connect(tmp_path / "inventory.db")
+    legacy.executescript(
+        """
+        CREATE TABLE users (id TEXT PRIMARY KEY, username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL, created_at TEXT NOT NULL);
+        CREATE TABLE items (id TEXT PRIMARY KEY, name TEXT NOT NULL, sku TEXT NOT NULL,
+            quantity INTEGER NOT NULL, location TEXT NOT NULL, price REAL NOT NULL,
+            cost_unit REAL, threshold INTEGER NOT NULL, updated_at TEXT NOT NULL);
+        CREATE TABLE sales (id TEXT PRIMARY KEY, item_id TEXT NOT NULL, quantity INTEGER NOT NULL,
+            price REAL NOT NULL, total REAL NOT NULL, payment_method TEXT NOT NULL, created_at TEXT NOT NULL);
+        INSERT INTO items VALUES ('i1', 'Teclado', 'T-1', 4, 'Estante C', 25.5, 10.25, 1,
+            '2024-05-01T10:00:00+00:00');
+        INSERT INTO sales VALUES ('s1', 'i1', 2, 25.5, 51.0, 'Efectivo', '2024-05-02T10:00:00+00:00');
+        """
+    )
+    legacy.close()
+
+    module = load_app("sqlite", str(tmp_path), module_name="inventario_app_legacy")
+    with module.get_db(readonly=True) as conn:
+        item = conn.execute("SELECT * FROM items WHERE id = 'i1'").fetchone()
+        sale = conn.execute("SELECT * FROM sales WHERE id = 's1'").fetchone()
+        snapshot = conn.execute("SELECT * FROM stock_movements WHERE item_id = 'i1'").fetchone()
+    assert (item["price_cents"], item["cost_unit_cents"]) == (2550, 1025)
+    assert item["updated_at"] == module.to_epoch_ms("2024-05-01T10:00:00+00:00")
+    assert (sale["total_cents"], sale["gain_cents"]) == (5100, (2550 - 1025) * 2)
+    assert item["store_id"] is not None and sale["store_id"] == item["store_id"]
+    assert (snapshot["kind"], snapshot["balance"], snapshot["store_id"]) == ("snapshot", 4, item["store_id"])
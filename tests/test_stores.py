@@ -0,0 +1,101 @@
+import pytest
+
+
+def join_code(client, headers):
+    return client.get("/api/stores/current", headers=headers).get_json()["joinCode"]
+
+
+def test_users_sharing_a_join_code_share_the_inventory(client, make_user, item_payload):
+    owner = make_user()
+    clerk = make_user(store_code=join_code(client, owner))
+    created = client.post("/api/items", json=item_payload(), headers=owner).get_json()
+
+    assert client.get("/api/stores/current", headers=clerk).get_json()["id"] == (
+        client.get("/api/stores/current", headers=owner).get_json()["id"]
+    )
+    assert [item["id"] for item in client.get("/api/items", headers=clerk).get_json()] == [created["id"]]
+
+    # Lo que edita uno lo ve el otro
+    client.put(f"/api/items/{created['id']}", json={**created, "quantity": 4}, headers=clerk)
+    assert client.get("/api/items", headers=owner).get_json()[0]["quantity"] == 4
+
+
+def test_invalid_join_code_is_rejected(client):
+    response = client.post(
+        "/api/auth/register",
+        json={"username": "nadie", "password": "secret", "email": "nadie@example.com", "storeCode": "nope"},
+    )
+    assert response.status_code == 400
+
+
+def test_other_stores_cannot_touch_items(client, make_user, item_payload):
+    owner, stranger = make_user(), make_user()
+    created = client.post("/api/items", json=item_payload(quantity=5), headers=owner).get_json()
+    item_id = created["id"]
+
+    assert client.get("/api/items", headers=stranger).get_json() == []
+    assert client.put(f"/api/items/{item_id}", json={**created, "quantity": 0}, headers=stranger).status_code == 404
+    client.delete(f"/api/items/{item_id}", headers=stranger)  # no-op fuera de la tienda
+    assert client.get(f"/api/items/{item_id}/movements", headers=stranger).get_json()["movements"] == []
+    assert client.get(f"/api/items/{item_id}/stock", headers=stranger).status_code == 404
+    # Mismo id desde otra tienda: no pisa el item ajeno
+    assert client.post("/api/items", json=item_payload(id=item_id), headers=stranger).status_code == 409
+    sale = {"itemId": item_id, "quantity": 1, "price": 1, "paymentMethod": "Efectivo"}
+    assert client.post("/api/sales", json=sale, headers=stranger).status_code == 404
+
+    assert [(item["id"], item["quantity"]) for item in client.get("/api/items", headers=owner).get_json()] == [
+        (item_id, 5)
+    ]
+
+
+def test_other_stores_cannot_touch_sales(client, make_user, item_payload):
+    owner, stranger = make_user(), make_user()
+    item = client.post("/api/items", json=item_payload(quantity=5), headers=owner).get_json()
+    sale = client.post(
+        "/api/sales", json={"itemId": item["id"], "quantity": 2, "price": 1, "paymentMethod": "Efectivo"}, headers=owner
+    ).get_json()
+
+    assert client.get("/api/sales", headers=stranger).get_json() == []
+    assert client.get(f"/api/sales/{sale['id']}/invoice", headers=stranger).status_code == 404
+    assert client.delete(f"/api/sales/{sale['id']}", headers=stranger).status_code == 404
+    assert len(client.get("/api/sales", headers=owner).get_json()) == 1
+
+
+@pytest.mark.parametrize("path", ["/api/store/catalog", "/api/store/items", "/tienda.html"])
+def test_storefront_shows_the_requested_store(client, make_user, item_payload, path):
+    owner, other = make_user(), make_user()
+    client.post("/api/items", json=item_payload(name="Visible"), headers=owner)
+    client.post("/api/items", json=item_payload(name="Oculto"), headers=other)
+    store = client.get("/api/stores/current", headers=owner).get_json()["id"]
+
+    body = client.get(f"{path}?store={store}").get_data(as_text=True)
+    assert "Visible" in body
+    assert "Oculto" not in body
+    assert client.get(f"{path}?store=no-such-store").status_code == 404
+
+
+@pytest.fixture
+def primary_store_user(app_module, make_user):
+    """Un usuario de la tienda mas vieja, la que antes tenia acceso de operador"""
+    with app_module.get_db(readonly=True) as conn:
+        store_id = app_module.primary_store_id(conn)
+        code = conn.execute("SELECT join_code FROM stores WHERE id = ?", (store_id,)).fetchone()["join_code"]
+    return make_user(store_code=code)
+
+
+@pytest.mark.parametrize("path", ["/api/backup", "/api/admin/jobs"])
+def test_operator_endpoints_reject_store_sessions(client, primary_store_user, monkeypatch, path):
+    monkeypatch.delenv("OPERATOR_TOKEN", raising=False)
+    assert client.get(path, headers=primary_store_user).status_code == 403
+
+    monkeypatch.setenv("OPERATOR_TOKEN", "operator-secret")
+    assert client.get(path, headers=primary_store_user).status_code == 401
+
+
+def test_operator_token_opens_backup_and_jobs(client, backend, monkeypatch):
+    monkeypatch.setenv("OPERATOR_TOKEN", "operator-secret")
+    operator = {"Authorization": "Bearer operator-secret"}
+
+    assert client.get("/api/admin/jobs", headers=operator).status_code == 200
+    # En Postgres no hay archivo de BD que descargar
+    assert client.get("/api/backup", headers=operator).status_code == (200 if backend == "sqlite" else 404)
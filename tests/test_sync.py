@@ -0,0 +1,68 @@
+"""POST /api/sync: la cola offline se reproduce en orden y cada operacion tiene su resultado"""
+import uuid
+
+
+def sale_op(item_id, quantity, sale_id=None):
+    return {
+        "id": str(uuid.uuid4()),
+        "type": "sale",
+        "payload": {
+            "id": sale_id or uuid.uuid4().hex,
+            "itemId": item_id,
+            "quantity": quantity,
+            "price": 12.5,
+            "paymentMethod": "Efectivo",
+        },
+    }
+
+
+def sync(client, auth, operations):
+    response = client.post("/api/sync", json={"operations": operations}, headers=auth)
+    assert response.status_code == 200, response.get_json()
+    return [result["status"] for result in response.get_json()["results"]]
+
+
+def test_operations_are_applied_in_order(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=5), headers=auth).get_json()
+    edit = {"id": str(uuid.uuid4()), "type": "item-update", "payload": {**item, "quantity": 8}}
+
+    assert sync(client, auth, [sale_op(item["id"], 2), edit, sale_op(item["id"], 8)]) == [
+        "applied",
+        "applied",
+        "applied",
+    ]
+    items = client.get("/api/items", headers=auth).get_json()
+    assert items[0]["quantity"] == 0
+
+
+def test_replayed_sale_is_a_duplicate(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=5), headers=auth).get_json()
+    sale_id = uuid.uuid4().hex
+
+    assert sync(client, auth, [sale_op(item["id"], 2, sale_id)]) == ["applied"]
+    assert sync(client, auth, [sale_op(item["id"], 2, sale_id)]) == ["duplicate"]
+    assert client.get("/api/items", headers=auth).get_json()[0]["quantity"] == 3
+
+
+def test_conflicts_and_errors_do_not_stop_the_batch(client, auth, item_payload):
+    item = client.post("/api/items", json=item_payload(quantity=2), headers=auth).get_json()
+    stale_edit = {
+        "id": str(uuid.uuid4()),
+        "type": "item-update",
+        "payload": {**item, "quantity": 9, "expectedQuantity": 7},
+    }
+    unknown = {"id": str(uuid.uuid4()), "type": "refund", "payload": {}}
+
+    assert sync(client, auth, [sale_op(item["id"], 5), stale_edit, unknown, sale_op(item["id"], 1)]) == [
+        "conflict",
+        "conflict",
+        "error",
+        "applied",
+    ]
+    assert client.get("/api/items", headers=auth).get_json()[0]["quantity"] == 1
+
+
+def test_sync_rejects_a_bad_batch(client, auth, app_module):
+    assert client.post("/api/sync", json={}, headers=auth).status_code == 400
+    too_many = [sale_op("x", 1)] * (app_module.SYNC_MAX_OPERATIONS + 1)
+    assert client.post("/api/sync", json={"operations": too_many}, headers=auth).status_code == 400